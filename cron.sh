@@ -16,7 +16,7 @@ git pull --ff-only origin main
 
 # === run the python script ===
 
-python hr/main.py 'vosslnx'
+python hr/main.py 'vosslnx' --incremental
 
 
 # === push results to github ===
@@ -0,0 +1,219 @@
+"""
+Benchmark the HR pipeline on synthetic cohorts.
+
+Run from the repo root:
+
+    python hr/bench/run_bench.py --sizes 2 8 32 --out bench.json
+    python hr/bench/run_bench.py --sizes 2 8 32 --compare bench.json
+
+Each cohort size is generated once (see bench/synth.py), then every stage is
+timed `--repeat` times and the minimum and median are reported. Stage times
+are summed over all files of the cohort. `main` is an end-to-end Main.main run
+with the HR cache disabled.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HR_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if HR_ROOT not in sys.path:
+    sys.path.insert(0, HR_ROOT)
+
+import numpy as np
+import pandas as pd
+
+from bench.synth import POLAR_DIR, ZONE_WORKBOOK, make_cohort
+from main import Main
+from qc.save_qc import save_qc
+from qc.sup import QC_Sup
+from qc.zone.save_zones import save_zones
+from util.catalog import Catalog
+from util.hr.extract_hr import extract_recording, screen_recording
+from util.zone.zone_table import ZoneTable, _read_workbook
+
+FILE_STAGES = ["screen", "read", "window", "zone_lookup", "qc_data", "qc_zones"]
+
+
+def _git_commit() -> str | None:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=HR_ROOT, capture_output=True, text=True, check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+
+def _time_stages(base_path: str) -> dict[str, float]:
+    """One pass over the cohort, stage by stage; returns seconds per stage."""
+    times = dict.fromkeys(["catalog", "zone_table"] + FILE_STAGES + ["save_qc", "save_zones"], 0.0)
+    clock = time.perf_counter
+
+    t0 = clock()
+    catalog = Catalog.scan(os.path.join(base_path, POLAR_DIR))
+    times["catalog"] = clock() - t0
+
+    # the workbook itself, not the sidecar, so the parse cost is measured
+    t0 = clock()
+    zone_table = ZoneTable(*_read_workbook(os.path.join(base_path, ZONE_WORKBOOK)))
+    times["zone_table"] = clock() - t0
+
+    err_master, zone_master = {}, {}
+    for record in catalog.csvs():
+        t0 = clock()
+        screen_recording(record.path)
+        t1 = clock()
+        hr, week = extract_recording(record.path)
+        t2 = clock()
+        times["screen"] += t1 - t0
+        times["read"] += t2 - t1
+        if hr is None:
+            continue
+        window = hr.window
+        t3 = clock()
+        times["window"] += t3 - t2
+        if window is not None and window[2] > pd.Timedelta(hours=4):
+            continue
+        zones = zone_table.lookup(record.subject)
+        t4 = clock()
+        qc = QC_Sup(hr, zones, week, record.group)
+        qc.qc_data()
+        t5 = clock()
+        zone_metrics = qc.qc_zones()
+        t6 = clock()
+        times["zone_lookup"] += t4 - t3
+        times["qc_data"] += t5 - t4
+        times["qc_zones"] += t6 - t5
+        err_master.setdefault(record.subject, []).append([record.path, qc.err])
+        if zone_metrics is not None:
+            zone_master.setdefault(record.subject, []).append([record.path, zone_metrics])
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        t0 = clock()
+        save_qc(err_master, os.path.join(out_dir, "qc_out.csv"), catalog=catalog)
+        t1 = clock()
+        save_zones(zone_master, os.path.join(out_dir, "zone_out.csv"), catalog=catalog)
+        t2 = clock()
+    times["save_qc"] = t1 - t0
+    times["save_zones"] = t2 - t1
+    return times
+
+
+def _time_main(base_path: str, workers: int) -> float:
+    with tempfile.TemporaryDirectory() as run_dir:
+        cwd = os.getcwd()
+        os.chdir(run_dir)
+        try:
+            pipeline = Main(
+                system=None,
+                base_path=base_path,
+                workers=workers,
+                cache_dir=os.path.join(run_dir, ".hr_cache"),
+                cache_max_mb=0,
+            )
+            t0 = time.perf_counter()
+            pipeline.main()
+            return time.perf_counter() - t0
+        finally:
+            os.chdir(cwd)
+
+
+def _summary(runs: list[float]) -> dict:
+    return {"min_s": min(runs), "median_s": statistics.median(runs), "runs_s": runs}
+
+
+def run_size(n_subjects: int, repeat: int, workers: int, seed: int, work_dir: str) -> dict:
+    base_path = os.path.join(work_dir, f"cohort_{n_subjects}")
+    t0 = time.perf_counter()
+    cohort = make_cohort(base_path, n_subjects, seed=seed)
+    generate_s = time.perf_counter() - t0
+
+    stage_runs: dict[str, list[float]] = {}
+    for _ in range(repeat):
+        for stage, seconds in _time_stages(base_path).items():
+            stage_runs.setdefault(stage, []).append(seconds)
+        stage_runs.setdefault("main", []).append(_time_main(base_path, workers))
+
+    result = {**cohort, "generate_s": generate_s}
+    result["stages"] = {stage: _summary(runs) for stage, runs in stage_runs.items()}
+    return result
+
+
+def compare(current: dict, baseline: dict) -> list[str]:
+    """Per-stage min-time ratios current/baseline for the cohort sizes both reports share."""
+    lines = []
+    base_sizes = {r["subjects"]: r for r in baseline["results"]}
+    for result in current["results"]:
+        base = base_sizes.get(result["subjects"])
+        if base is None:
+            continue
+        lines.append(f"subjects={result['subjects']} files={result['files']}")
+        for stage, summary in result["stages"].items():
+            if stage not in base["stages"]:
+                continue
+            old, new = base["stages"][stage]["min_s"], summary["min_s"]
+            ratio = new / old if old > 0 else float("nan")
+            lines.append(f"  {stage:<12} {old:9.4f}s -> {new:9.4f}s  x{ratio:.2f}")
+    return lines
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the HR pipeline on synthetic cohorts")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2, 8, 32], help="cohort sizes in subjects")
+    parser.add_argument("--repeat", type=int, default=3, help="timed passes per cohort size")
+    parser.add_argument("--workers", type=int, default=1, help="--workers for the end-to-end run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", help="where cohorts are generated (default: a temporary directory)")
+    parser.add_argument("--out", help="write the JSON report here")
+    parser.add_argument("--compare", help="JSON report of an earlier run to compare against")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # keep per-file warnings out of the timings and off the terminal
+    logging.basicConfig(level=logging.ERROR)
+
+    report = {
+        "commit": _git_commit(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "workers": args.workers,
+        "seed": args.seed,
+        "results": [],
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = args.work_dir or tmp
+        for n_subjects in args.sizes:
+            result = run_size(n_subjects, args.repeat, args.workers, args.seed, work_dir)
+            report["results"].append(result)
+            stages = ", ".join(f"{k}={v['min_s']:.3f}s" for k, v in result["stages"].items())
+            print(f"subjects={n_subjects} files={result['files']}: {stages}", file=sys.stderr)
+
+    if args.out:
+        with open(args.out, "w") as fh:
+            json.dump(report, fh, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+        print("\n".join(compare(report, baseline)), file=sys.stderr)
+    return report
+
+
+if __name__ == "__main__":
+    main()
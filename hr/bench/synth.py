@@ -0,0 +1,146 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# Where Main expects things under a BOOST base path
+POLAR_DIR = os.path.join("InterventionStudy", "3-experiment", "data", "polarhrcsv")
+ZONE_WORKBOOK = os.path.join(
+    "InterventionStudy",
+    "1-projectManagement",
+    "participants",
+    "ExerciseSessionMaterials",
+    "Intervention Materials",
+    "BOOST HR ranges.xlsx",
+)
+
+SUPERVISED_WEEKS = range(1, 7)
+UNSUPERVISED_WEEKS = range(7, 13)
+
+
+def _hms(seconds: np.ndarray) -> list[str]:
+    """Elapsed seconds as HH:MM:SS; hours are not wrapped, like Polar's export."""
+    return [f"{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}" for s in seconds.tolist()]
+
+
+def synth_session(
+    rng: np.random.Generator,
+    minutes: float = 45,
+    base_hr: int = 120,
+    nan_runs: int = 0,
+    gaps: int = 0,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    One 1 Hz recording as (elapsed seconds, hr).
+
+    hr is a bounded random walk around `base_hr`. `nan_runs` stretches of
+    10-120 missing samples and `gaps` dropped stretches of 5-300 seconds are
+    placed at random.
+    """
+    n = max(int(minutes * 60), 2)
+    seconds = np.arange(n, dtype=np.int64)
+    hr = np.clip(base_hr + np.cumsum(rng.integers(-2, 3, n)), 55, 205).astype(float)
+    for _ in range(nan_runs):
+        start = int(rng.integers(0, n))
+        hr[start:start + int(rng.integers(10, 120))] = np.nan
+    keep = np.ones(n, dtype=bool)
+    for _ in range(gaps):
+        start = int(rng.integers(1, n - 1))
+        keep[start:start + int(rng.integers(5, 300))] = False
+    keep[0] = keep[-1] = True
+    return seconds[keep], hr[keep]
+
+
+def write_polar_csv(path: str, seconds: np.ndarray, hr: np.ndarray, start="10:00:00", date="16-04-2025") -> None:
+    """Write (seconds, hr) as a Polar export: summary header, column header, samples."""
+    duration = int(seconds[-1] - seconds[0]) if len(seconds) else 0
+    avg = np.nanmean(hr) if np.isfinite(hr).any() else 0
+    header = (
+        "Name,Sport,Date,Start time,Duration,Total distance (km),Average heart rate (bpm)\n"
+        f"Synthetic,OTHER,{date},{start},{_hms(np.array([duration]))[0]},,{avg:.0f}\n"
+    )
+    samples = pd.DataFrame({
+        "Sample rate": [1] + [None] * (len(seconds) - 1),
+        "Time": _hms(seconds),
+        "HR (bpm)": pd.Series(hr).astype("Int64"),
+        "Speed (km/h)": None,
+        "Pace (min/km)": None,
+    })
+    with open(path, "w", newline="") as fh:
+        fh.write(header)
+        samples.to_csv(fh, index=False)
+
+
+def write_zone_workbook(path: str, subject_ids, rng: np.random.Generator) -> pd.DataFrame:
+    """
+    Write an HR ranges workbook with five contiguous zones per subject.
+
+    Layout matches what ZoneTable reads: BOOST ID, four other columns, then
+    the ten zone bound columns.
+    """
+    rows = []
+    for sid in subject_ids:
+        bounds = []
+        lo = int(rng.integers(85, 105))
+        for _ in range(5):
+            hi = lo + int(rng.integers(10, 18))
+            bounds += [lo, hi]
+            lo = hi + int(rng.integers(0, 3))
+        rows.append([sid, "", "", "", ""] + bounds)
+    columns = ["BOOST ID", "Name", "Age", "Resting HR", "Max HR"] + [
+        f"Zone {z} {edge}" for z in range(1, 6) for edge in ("start", "end")
+    ]
+    df = pd.DataFrame(rows, columns=columns)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    df.to_excel(path, sheet_name="Sheet1", index=False)
+    return df
+
+
+def make_cohort(
+    base_path: str,
+    n_subjects: int,
+    sessions_per_week: int = 3,
+    long_rate: float = 0.02,
+    seed: int = 0,
+) -> dict:
+    """
+    Build a synthetic BOOST tree under `base_path` for `n_subjects` subjects.
+
+    Each subject gets `sessions_per_week` sessions in supervised weeks 1-6 and
+    unsupervised weeks 7-12. Most are ~45 minute sessions, some with NaN runs
+    or gaps. A `long_rate` share are 24-25 hour recordings whose elapsed time
+    runs past 24:00:00. Every subject also has one file without a week token.
+    Returns counts of what was written.
+    """
+    rng = np.random.default_rng(seed)
+    subject_ids = [8000 + i for i in range(n_subjects)]
+    write_zone_workbook(os.path.join(base_path, ZONE_WORKBOOK), subject_ids, rng)
+
+    stats = {"subjects": n_subjects, "files": 0, "long_files": 0, "bytes": 0}
+    for sid in subject_ids:
+        session = 0
+        for group, weeks in (("Supervised", SUPERVISED_WEEKS), ("Unsupervised", UNSUPERVISED_WEEKS)):
+            subject_dir = os.path.join(base_path, POLAR_DIR, group, f"sub{sid}")
+            os.makedirs(subject_dir, exist_ok=True)
+            for week in weeks:
+                for _ in range(sessions_per_week):
+                    session += 1
+                    is_long = rng.random() < long_rate
+                    minutes = rng.uniform(24 * 60, 25 * 60) if is_long else rng.uniform(35, 60)
+                    seconds, hr = synth_session(
+                        rng,
+                        minutes=minutes,
+                        base_hr=int(rng.integers(100, 150)),
+                        nan_runs=int(rng.random() < 0.3),
+                        gaps=int(rng.random() < 0.3),
+                    )
+                    path = os.path.join(subject_dir, f"{sid}_wk{week}_ses{session}.CSV")
+                    write_polar_csv(path, seconds, hr)
+                    stats["files"] += 1
+                    stats["long_files"] += int(is_long)
+                    stats["bytes"] += os.path.getsize(path)
+            path = os.path.join(subject_dir, f"Boost_Sub{sid}_2025-04-16.CSV")
+            write_polar_csv(path, *synth_session(rng, minutes=2))
+            stats["files"] += 1
+            stats["bytes"] += os.path.getsize(path)
+    return stats
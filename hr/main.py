@@ -6,13 +6,33 @@ import pandas as pd
 
 class Main:
 
-    def __init__(self, system):
+    def __init__(
+        self,
+        system,
+        workers=1,
+        incremental=False,
+        content_hash=False,
+        cache_dir="./.hr_cache",
+        cache_max_mb=1024,
+        base_path=None,
+        metrics_path=None,
+        trace_memory=False,
+        metrics_top=10,
+        prefetch=4,
+        prefetch_mb=256,
+        shard_dir="./shards",
+        results_db=None,
+        snap_to=5,
+        cost_from=None,
+    ):
         import os
 
-        # Set the base path dependent on system
-        if system is None:
+        # Set the base path dependent on system (base_path overrides it, e.g. for synthetic data)
+        if base_path is not None:
+            self.base_path = base_path
+        elif system is None:
             raise ValueError("System cannot be None")
-        if system == "Argon":
+        elif system == "Argon":
             self.base_path = "/Shared/vosslabhpc/Projects/BOOST/"
         elif system == "Home":
             self.base_path = "/mnt/lss/Projects/BOOST/"
@@ -33,10 +53,37 @@ class Main:
         )
         if not os.path.isfile(self.zone_path):
             raise FileNotFoundError(f"Zone path does not exist: {self.zone_path}")
+        self.project_path = os.path.join(self.base_path, "InterventionStudy", "3-experiment", "data", "polarhrcsv")
 
         self.out_path = "./qc_out.csv"
         self.zone_out_path = "./zone_out.csv"
-
+        self.sweep_out_path = "./sweep_out.csv"
+        self.sweep_summary_path = "./sweep_summary.csv"
+        self.plan_path = "./plan.csv"
+        # local scratch for sidecars, the manifest and parsed HR arrays; kept out of git
+        self.cache_dir = cache_dir
+        # size cap of the parsed-HR cache (LRU); 0 turns the cache off
+        self.cache_max_mb = cache_max_mb
+        # number of processes for per-file QC; 1 keeps everything in-process
+        self.workers = workers
+        # reuse stored results for unchanged files (see util/manifest.py)
+        self.incremental = incremental
+        self.content_hash = content_hash
+        # files read ahead on I/O threads in in-process runs, and their memory cap
+        self.prefetch = prefetch
+        self.prefetch_mb = prefetch_mb
+        # per-stage timing report (see util/metrics.py); None turns it off
+        self.metrics_path = metrics_path
+        self.trace_memory = trace_memory
+        self.metrics_top = metrics_top
+        # where --shard runs leave their partial results for `merge`
+        self.shard_dir = shard_dir
+        # optional SQLite store the CSVs are exported from (see util/results_db.py)
+        self.results_db = results_db
+        # zone bounds are snapped to multiples of this many bpm (see util/zone/midpoint.py)
+        self.snap_to = snap_to
+        # --metrics report whose per-file times calibrate the work plan (see util/schedule.py)
+        self.cost_from = cost_from
 
         # add logging configuration
         logging.basicConfig(
@@ -49,115 +96,424 @@ class Main:
         )
 
 
-    def main(self):
+    def main(self, skip=(), shard=None, plan=False):
         """
         Main function to run the script.
+
+        Files in `skip` (e.g. uploads still being written) are left out of QC
+        and the output tables for this run. With `shard=(i, n)` only shard i
+        of n is processed and its results are saved under shard_dir for
+        merge() instead of writing the output tables. With `plan=True`
+        nothing is processed: the batches the run would hand to its workers
+        are written to plan_path with their estimated cost, and the totals
+        are returned.
         """
-        err_master = {} # dict to hold all errors
-        zone_master = {} # dict to hold all zone metrics
-        from util.get_files import get_files
-        from util.hr.extract_hr import extract_hr, recording_window
-        from util.zone.extract_zones import extract_zones
-        from qc.sup import QC_Sup
-        project_path = os.path.join(self.base_path, "InterventionStudy", "3-experiment", "data", "polarhrcsv")
-        if os.path.exists(project_path):
-            for session in ["Supervised", "Unsupervised"]:
-                session_path = os.path.join(project_path, session)
-                logging.debug(f"Processing session: {session_path}")
-                if os.path.exists(session_path):
-                    # return the files dict that contains base_path and list of files for each base_path
-                    files = get_files(session_path)
-                    # extract hr from each file
-                    for subject, subject_files in files.items():
-                        for file in subject_files:
-                            if file.lower().endswith('.csv'):
-                                hr, week = extract_hr(file)
-                                if hr is None or week is None:
-                                    logging.warning("Skipping file with unparseable week: %s", file)
-                                    err = {"week_parse": ["could not parse week from filename; file skipped", None]}
-                                    if subject not in err_master:
-                                        err_master[subject] = [[file, err]]
-                                    else:
-                                        err_master[subject].append([file, err])
-                                    continue
-                                window = recording_window(hr)
-                                if window is not None:
-                                    start_time, end_time, duration = window
-                                    if duration > pd.Timedelta(hours=4):
-                                        logging.warning(
-                                            "Skipping file with long duration (%s): %s",
-                                            duration,
-                                            file,
-                                        )
-                                        err = {
-                                            "duration": [
-                                                "recording longer than 4 hours; file ignored",
-                                                pd.DataFrame({
-                                                    "start_time": [start_time],
-                                                    "end_time": [end_time],
-                                                    "duration": [duration],
-                                                }),
-                                            ]
-                                        }
-                                        if subject not in err_master:
-                                            err_master[subject] = [[file, err]]
-                                        else:
-                                            err_master[subject].append([file, err])
-                                        continue
-                                zones = extract_zones(self.zone_path, subject)
-                                err, zone_metrics = QC_Sup(hr, zones, week, session).main()
-
-                                if subject not in err_master:
-                                    # first time: create a list with this one error
-                                    err_master[subject] = [[file,err]]
-                                else:
-                                    # append to the existing list
-                                    err_master[subject].append([file,err])
-                                if zone_metrics is not None:
-                                    if subject not in zone_master:
-                                        zone_master[subject] = [[file, zone_metrics]]
-                                    else:
-                                        zone_master[subject].append([file, zone_metrics])
-        err_master = {
-            subject: [e for e in errs if e]
-            for subject, errs in err_master.items()
-        }
-        from qc.save_qc import save_qc
-        save_qc(err_master, self.out_path)
-        from qc.zone.save_zones import save_zones
-        save_zones(zone_master, self.zone_out_path)
+        from util import pipeline
+        from util.catalog import Catalog
+        from util.zone.zone_table import ZoneTable
+        from util.workers import run_files
+        metrics = None
+        if self.metrics_path:
+            from util.metrics import Run_Metrics
+            metrics = Run_Metrics(trace_memory=self.trace_memory)
+        stage = metrics.stage if metrics is not None else pipeline.no_stage
+
+        # parse the zone workbook once per run instead of once per file
+        with stage("zone_table"):
+            zone_table = ZoneTable.load(self.zone_path, snap_to=self.snap_to, cache_dir=self.cache_dir)
+        hr_cache = None
+        if self.cache_max_mb > 0:
+            from util.hr.cache import HR_Cache
+            hr_cache = HR_Cache(os.path.join(self.cache_dir, "hr"), max_bytes=self.cache_max_mb * 2**20)
+        project_path = self.project_path
+        # one scan of the tree shared by QC, the writers and Get_Data
+        with stage("discover"):
+            catalog = Catalog.scan(project_path)
+            tasks = list(pipeline.catalog_records(catalog, skip)) # File_Records in (group, subject, name) order
+        if shard is not None:
+            from util.shard import shard_indices, tasks_digest
+            positions = shard_indices(tasks, *shard)
+            n_tasks, digest = len(tasks), tasks_digest(tasks)
+            tasks = [tasks[pos] for pos in positions]
+            logging.info("Shard %d/%d: %d of %d files", *shard, len(tasks), n_tasks)
+
+        # incremental runs only recompute files (or subjects' zone rows) that changed
+        cached, pending, keys = {}, list(range(len(tasks))), {}
+        manifest = None
+        if self.incremental:
+            from util.manifest import Manifest
+            with stage("manifest"):
+                manifest = Manifest.load(self.cache_dir, content_hash=self.content_hash)
+                cached, pending, keys = pipeline.lookup_cached(tasks, manifest, zone_table)
+            logging.info("Incremental run: %d of %d files changed", len(pending), len(tasks))
+
+        cost_model = None
+        if self.cost_from:
+            from util.schedule import Cost_Model
+            cost_model = Cost_Model.from_metrics(self.cost_from)
+        if plan:
+            from util import schedule
+            batches = schedule.plan([tasks[i] for i in pending], self.workers, cost_model, hr_cache)
+            summary = schedule.write_plan(self.plan_path, batches, self.workers)
+            logging.info(
+                "Plan written: %s (%d files in %d batches; estimated QC time %.1f s, %.1f s with --workers %d)",
+                self.plan_path, summary["files"], summary["batches"], summary["cost_s"], summary["wall_s"], self.workers,
+            )
+            return summary
+
+        # results come back in task order, so the merge is identical to a serial run
+        processed = run_files(
+            [tasks[i] for i in pending],
+            zone_table,
+            workers=self.workers,
+            hr_cache=hr_cache,
+            metrics=metrics,
+            prefetch=self.prefetch,
+            prefetch_bytes=self.prefetch_mb * 2**20,
+            cost_model=cost_model,
+        )
+        outcomes = pipeline.in_task_order(tasks, cached, processed, manifest, keys)
+        if shard is not None:
+            from util.shard import save_shard
+            with stage("process", trace_memory=False):
+                entries = [(positions[k], record, result, keys.get(k)) for k, record, result, _ in outcomes]
+            save_shard(self.shard_dir, *shard, n_tasks, digest, entries)
+            summary = None
+        else:
+            summary = self._write_outputs(outcomes, catalog, stage)
+        with stage("cache_upkeep"):
+            # shards only read the manifest; merge() records their results in it
+            if manifest is not None and shard is None:
+                manifest.prune(record.path for record in tasks)
+                manifest.save()
+            if hr_cache is not None:
+                hr_cache.evict()
+
+        if shard is not None:
+            if metrics is not None:
+                metrics.save(self.metrics_path, top_n=self.metrics_top)
+            return None
+
         from plot.get_data import Get_Data
-        path = os.path.join(self.base_path, "InterventionStudy", "3-Experiment", "data", "polarhrcsv")
-        gd = Get_Data(sup_path=os.path.join(path, "Supervised"), unsup_path=os.path.join(path, "Unsupervised"), study="InterventionStudy")
-        meta = gd.get_meta()
-        df_master = gd.build_master_df()
+        gd = Get_Data(
+            sup_path=os.path.join(project_path, "Supervised"),
+            unsup_path=os.path.join(project_path, "Unsupervised"),
+            study="InterventionStudy",
+            catalog=catalog,
+        )
+        with stage("get_data"):
+            meta = gd.get_meta()
+            df_master = gd.build_master_df()
+        if metrics is not None:
+            metrics.save(self.metrics_path, top_n=self.metrics_top)
         #gd.save_for_rust("./rust-ols-adherence-cli/data.csv")
 
 
 
-        return err_master
+        return summary
 
+    def _write_outputs(self, outcomes, catalog, stage=None):
+        """
+        Write qc_out.csv and zone_out.csv from (position, File_Record,
+        File_Result, fresh) tuples streamed in task order, through the
+        results store when one is configured. Returns the row counts of both
+        tables.
+        """
+        from util import pipeline
+        stage = stage or pipeline.no_stage
+        if self.results_db:
+            return pipeline.db_sink(outcomes, self.results_db, self.out_path, self.zone_out_path, catalog, stage)
+        return pipeline.csv_sink(outcomes, self.out_path, self.zone_out_path, catalog, stage)
 
-if __name__ == '__main__':
-    if sys.argv[1]:
-        if sys.argv[1] in ["Argon", "Home", "vosslnx"]:
-            Main(system=sys.argv[1]).main()
-        else:
-            raise ValueError("""First Argument is not one of the desired systems: 
-            The argument must be one of the following:
-            vosslnx = the vosslab linux machine used for automation
-            Argon = the Argon HPC
-            Home = My (Zak) personal linux machine mount
-            """)
-    else:
-        raise ValueError("""First Argument does not exist.
+    def merge(self):
+        """
+        Combine the results of a complete set of --shard runs in shard_dir
+        into qc_out.csv and zone_out.csv, exactly as one unsharded run would
+        have written them. With --incremental the results also go into the
+        manifest, so later incremental runs reuse them.
+        """
+        from util.catalog import Catalog
+        from util.shard import load_shards
+
+        entries = load_shards(self.shard_dir)
+        tasks = [record for _, record, _, _ in entries]
+        logging.info("Merging %d files from %s", len(entries), self.shard_dir)
+        if self.incremental:
+            from util.manifest import Manifest
+            manifest = Manifest.load(self.cache_dir, content_hash=self.content_hash)
+            for _, _, result, key in entries:
+                if key is not None:
+                    manifest.put(result.file, *key, result)
+            manifest.prune(record.path for record in tasks)
+            manifest.save()
+        return self._write_outputs(
+            ((pos, record, result, True) for pos, record, result, _ in entries), Catalog(tasks, {})
+        )
+
+    def rescore(self):
+        """
+        Recompute every stored file's zone row and bounded_short errors from
+        its Zone_Stats (see qc/zone/kernel.py) against the current zone
+        workbook, snap_to and weekly plans, and rewrite qc_out.csv and
+        zone_out.csv without reading a single recording. Works on the
+        results of the last --incremental run, and updates the manifest so
+        the next incremental run reuses the rescored results.
+        """
+        from util.catalog import Catalog, File_Record
+        from util.manifest import Manifest
+        from util.zone.zone_table import ZoneTable
+
+        manifest = Manifest.load(self.cache_dir, content_hash=self.content_hash)
+        if not manifest.entries:
+            raise ValueError(f"No stored results in {self.cache_dir}; run with --incremental first")
+        zone_table = ZoneTable.load(self.zone_path, snap_to=self.snap_to, cache_dir=self.cache_dir)
+        stored = sorted(
+            ((File_Record.from_path(file, stat=fingerprint[:2]), fingerprint, result)
+             for file, fingerprint, _, result in manifest.stored()),
+            key=lambda entry: (entry[0].group, entry[0].subject, entry[0].name),
+        )
+        tasks = [record for record, _, _ in stored]
+        logging.info("Rescoring %d files from %s", len(tasks), manifest.path)
+
+        def outcomes():
+            for k, (record, fingerprint, result) in enumerate(stored):
+                if result.stats is not None:
+                    result = result.rescore(zone_table.lookup(record.subject))
+                manifest.put(record.path, fingerprint, zone_table.row_key(record.subject), result)
+                yield k, record, result, True
+
+        summary = self._write_outputs(outcomes(), Catalog(tasks, {}))
+        manifest.save()
+        return summary
+
+    def sweep(self, grid=None):
+        """
+        QC and zone metrics for every combination of thresholds in `grid` (a
+        qc.sweep.Sweep_Grid; by default just the current settings), written
+        to sweep_out.csv (per session and parameter set) and
+        sweep_summary.csv (per group and parameter set). Each file is read
+        once however large the grid; the regular outputs and the manifest
+        are left alone. Returns the row count and grid size.
+        """
+        import numpy as np
+        from qc.sweep import Sweep_Grid, Sweep_Writer, sweep_jobs
+        from util import pipeline
+        from util.catalog import Catalog
+        from util.zone.zone_table import ZoneTable
+
+        grid = grid or Sweep_Grid(snap_to=self.snap_to)
+        snaps = grid.values["snap_to"]
+        base = ZoneTable.load(self.zone_path, snap_to=snaps[0], cache_dir=self.cache_dir)
+        zone_tables = [base] + [ZoneTable(base.ids, base.raw_bounds, snap_to=snap) for snap in snaps[1:]]
+        bounds = {}
+
+        def subject_bounds(subject):
+            if subject not in bounds:
+                bounds[subject] = np.stack([table.lookup(subject) for table in zone_tables])
+            return bounds[subject]
+
+        hr_cache = None
+        if self.cache_max_mb > 0:
+            from util.hr.cache import HR_Cache
+            hr_cache = HR_Cache(os.path.join(self.cache_dir, "hr"), max_bytes=self.cache_max_mb * 2**20)
+        catalog = Catalog.scan(self.project_path)
+        tasks = list(pipeline.catalog_records(catalog))
+        logging.info("Sweep: %d parameter sets over %d files", len(grid), len(tasks))
+
+        writer = Sweep_Writer(self.sweep_out_path, self.sweep_summary_path, grid, catalog=catalog)
+        stream = pipeline.prefetch(
+            pipeline.jobs(tasks), hr_cache, depth=self.prefetch, max_bytes=self.prefetch_mb * 2**20
+        )
+        seq = {record.path: k for k, record in enumerate(tasks)}
+        for job, metrics in sweep_jobs(stream, subject_bounds, grid, hr_cache):
+            writer.add(seq[job.file], job.subject, job.file, metrics)
+        n_rows = writer.close()
+        if hr_cache is not None:
+            hr_cache.evict()
+        return {"sweep_rows": n_rows, "grid_points": len(grid)}
+
+    def watch(self, poll_s=60, max_polls=None):
+        """
+        Run once, then keep polling the subject directories and rerun
+        (incrementally, so only the new files are processed) whenever an
+        upload has finished or a file was removed. Stops after `max_polls`
+        polls when given, otherwise on Ctrl-C.
+        """
+        import time
+        from util.watch import Dir_Watcher
+
+        watcher = Dir_Watcher(self.project_path, settle_s=poll_s)
+        self.main(skip=watcher.unsettled)
+        logging.info("Watching %s every %ss", self.project_path, poll_s)
+        polls = 0
+        try:
+            while max_polls is None or polls < max_polls:
+                time.sleep(poll_s)
+                polls += 1
+                ready, removed = watcher.poll()
+                if not (ready or removed):
+                    continue
+                logging.info(
+                    "Watch: %d new file(s) ready%s; updating outputs",
+                    len(ready), ", files removed" if removed else "",
+                )
+                for path in ready:
+                    logging.info("New file: %s", path)
+                try:
+                    self.main(skip=watcher.unsettled)
+                except Exception:
+                    # keep watching; the manifest was not saved, so the next run redoes these files
+                    logging.exception("Watch run failed")
+        except KeyboardInterrupt:
+            logging.info("Watch stopped")
+
+
+SYSTEMS_HELP = """
         The argument must be one of the following:
         vosslnx = the vosslab linux machine used for automation
         Argon = the Argon HPC
         Home = My (Zak) personal linux machine mount
-        """)
+        """
 
 
+def parse_args(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="BOOST HR QC and zone adherence pipeline")
+    parser.add_argument("system", nargs="?", help="one of Argon, Home, vosslnx")
+    parser.add_argument(
+        "command", nargs="?", choices=["run", "merge", "rescore", "sweep"], default="run",
+        help="run the pipeline (default), merge the results of --shard runs into the output tables, "
+             "rescore the stored results of the last --incremental run against the current zones, "
+             "or sweep QC over a grid of thresholds (see --grid)",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="processes used for per-file QC (default: 1, serial)",
+    )
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="reuse results for files unchanged since the last run (manifest in .hr_cache/)",
+    )
+    parser.add_argument(
+        "--hash", dest="content_hash", action="store_true",
+        help="with --incremental, also match changed-mtime files by sha256 of their content",
+    )
+    parser.add_argument(
+        "--cache-dir", default="./.hr_cache",
+        help="local directory for the zone sidecar, manifest and parsed HR cache",
+    )
+    parser.add_argument(
+        "--cache-max-mb", type=int, default=1024,
+        help="size cap of the parsed HR cache, least recently used first out; 0 disables it",
+    )
+    parser.add_argument(
+        "--prefetch", type=int, default=4,
+        help="with --workers 1, files read ahead on background threads while QC runs (default: 4; 0 disables)",
+    )
+    parser.add_argument(
+        "--prefetch-mb", type=int, default=256,
+        help="cap on the size of files being read ahead (default: 256)",
+    )
+    parser.add_argument(
+        "--metrics", dest="metrics_path", metavar="PATH",
+        help="write per-stage timings as JSON to PATH (and per-file rows to PATH's stem + _files.csv)",
+    )
+    parser.add_argument(
+        "--trace-memory", action="store_true",
+        help="with --metrics, also record peak allocated memory per stage (tracemalloc; slower)",
+    )
+    parser.add_argument(
+        "--metrics-top", type=int, default=10,
+        help="number of slowest files listed in the metrics report (default: 10)",
+    )
+    parser.add_argument(
+        "--watch", action="store_true",
+        help="keep running: poll the subject directories and update the outputs as new files finish uploading (implies --incremental)",
+    )
+    parser.add_argument(
+        "--poll-s", type=float, default=60,
+        help="with --watch, seconds between polls (default: 60)",
+    )
+    parser.add_argument(
+        "--shard", metavar="i/N",
+        help="process only shard i of N (subjects split by file size; i from 1) and save its results to --shard-dir",
+    )
+    parser.add_argument(
+        "--shard-dir", default="./shards",
+        help="directory for --shard results, read by `merge` (default: ./shards)",
+    )
+    parser.add_argument(
+        "--results-db", metavar="PATH",
+        help="keep per-file results in this SQLite file and export the CSVs from it (e.g. .hr_cache/results.sqlite)",
+    )
+    parser.add_argument(
+        "--snap-to", type=int, default=5,
+        help="snap zone boundary midpoints to multiples of this many bpm (default: 5)",
+    )
+    parser.add_argument(
+        "--grid", action="append", metavar="NAME=V1,V2,...",
+        help="with sweep, values to try for one threshold (repeatable): max_gap_s, min_nan_run, "
+             "session_cap_min, snap_to or max_recording_h; others keep their current value",
+    )
+    parser.add_argument(
+        "--plan", action="store_true",
+        help="write the work plan (per-subject batches, longest first, with estimated seconds) to plan.csv and exit without processing",
+    )
+    parser.add_argument(
+        "--cost-from", metavar="PATH",
+        help="--metrics report of an earlier run whose per-file times calibrate the plan's cost estimates",
+    )
+    args = parser.parse_args(argv)
+    if not args.system:
+        raise ValueError("First Argument does not exist." + SYSTEMS_HELP)
+    if args.system not in ["Argon", "Home", "vosslnx"]:
+        raise ValueError("First Argument is not one of the desired systems: " + SYSTEMS_HELP)
+    if args.workers < 1:
+        raise ValueError("--workers must be at least 1")
+    if args.prefetch < 0:
+        raise ValueError("--prefetch must be 0 or more")
+    if args.poll_s <= 0:
+        raise ValueError("--poll-s must be positive")
+    if args.shard is not None:
+        from util.shard import parse_shard
+        args.shard = parse_shard(args.shard)
+        if args.watch or args.command != "run":
+            raise ValueError("--shard cannot be combined with --watch, merge, rescore or sweep")
+    if args.plan and (args.watch or args.command != "run"):
+        raise ValueError("--plan cannot be combined with --watch, merge, rescore or sweep")
+    if args.grid and args.command != "sweep":
+        raise ValueError("--grid only applies to the sweep command")
+    return args
 
 
-        
+if __name__ == '__main__':
+    args = parse_args()
+    pipeline = Main(
+        system=args.system,
+        workers=args.workers,
+        # a watch rerun only processes what changed
+        incremental=args.incremental or args.watch,
+        content_hash=args.content_hash,
+        cache_dir=args.cache_dir,
+        cache_max_mb=args.cache_max_mb,
+        metrics_path=args.metrics_path,
+        trace_memory=args.trace_memory,
+        metrics_top=args.metrics_top,
+        prefetch=args.prefetch,
+        prefetch_mb=args.prefetch_mb,
+        shard_dir=args.shard_dir,
+        results_db=args.results_db,
+        snap_to=args.snap_to,
+        cost_from=args.cost_from,
+    )
+    if args.command == "merge":
+        pipeline.merge()
+    elif args.command == "rescore":
+        pipeline.rescore()
+    elif args.command == "sweep":
+        from qc.sweep import Sweep_Grid
+        pipeline.sweep(Sweep_Grid.parse(args.grid, snap_to=args.snap_to))
+    elif args.watch:
+        pipeline.watch(poll_s=args.poll_s)
+    else:
+        pipeline.main(shard=args.shard, plan=args.plan)
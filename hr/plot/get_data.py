@@ -34,28 +34,47 @@ class Get_Data:
           unsup_prop_30 = unsup_n / 30.0
     """
 
-    def __init__(self, sup_path: str, unsup_path: str, study: str = "InterventionStudy"):
+    def __init__(self, sup_path: str, unsup_path: str, study: str = "InterventionStudy", catalog=None):
         self.sup_path = sup_path
         self.unsup_path = unsup_path
         self.study = study
         self.master = pd.DataFrame()
+        # util.catalog.Catalog of the same tree; when set, nothing is re-listed
+        self.catalog = catalog
+        self._groups = {sup_path: "Supervised", unsup_path: "Unsupervised"}
 
-    @staticmethod
-    def _list_subjects(path: str) -> List[str]:
+    def _list_subjects(self, path: str) -> List[str]:
+        if self.catalog is not None:
+            return self.catalog.subjects(self._groups[path])
         return [
             d for d in os.listdir(path)
             if not d.startswith(".") and os.path.isdir(os.path.join(path, d))
         ]
 
-    @staticmethod
-    def _count_csvs(path: str) -> int:
+    def _list_csvs(self, path: str) -> List[str]:
+        """Non-hidden *.csv names in a subject directory ([] if it is missing)."""
+        if self.catalog is not None:
+            group = self._groups[os.path.dirname(path)]
+            return [r.name for r in self.catalog.files(group, os.path.basename(path)) if r.is_csv]
         try:
-            return sum(
-                1 for f in os.listdir(path)
+            return [
+                f for f in os.listdir(path)
                 if f.lower().endswith(".csv") and not f.startswith(".")
-            )
+            ]
         except FileNotFoundError:
-            return 0
+            return []
+
+    def _count_csvs(self, path: str) -> int:
+        return len(self._list_csvs(path))
+
+    def _max_session(self, path: str) -> int:
+        if self.catalog is not None:
+            return max(
+                (int(m.group(1)) for fn in self._list_csvs(path)
+                 if (m := _SES_RE.search(fn)) is not None),
+                default=0,
+            )
+        return _max_session(path)
 
     def get_meta(self) -> Dict:
         """
@@ -70,10 +89,7 @@ class Get_Data:
         for study_path, label in [(self.sup_path, "sup"), (self.unsup_path, "unsup")]:
             for subject in self._list_subjects(study_path):
                 subject_path = os.path.join(study_path, subject)
-                files = [
-                    f for f in os.listdir(subject_path)
-                    if f.lower().endswith(".csv") and not f.startswith(".")
-                ]
+                files = self._list_csvs(subject_path)
 
                 # Session 30 present?
                 if any("_ses30" in f.lower() for f in files):
@@ -105,8 +121,8 @@ class Get_Data:
             unsup_n = self._count_csvs(unsup_dir)
 
             # Denominator = max session index observed in filenames
-            sup_den = _max_session(sup_dir)
-            unsup_den = _max_session(unsup_dir)
+            sup_den = self._max_session(sup_dir)
+            unsup_den = self._max_session(unsup_dir)
 
             logger.debug(
                 f"Subject {subj}: sup_n={sup_n}, sup_den={sup_den}, "
@@ -155,7 +171,7 @@ from main import Main
 from plot.get_data import Get_Data
 import os
 main = Main(system="Home")
-path = os.path.join(main.base_path, "InterventionStudy", "3-Experiment", "data", "polarhrcsv")
+path = main.project_path
 gd = Get_Data(sup_path=os.path.join(path, "Supervised"), unsup_path=os.path.join(path, "Unsupervised"), study="InterventionStudy")
 df_master = gd.build_master_df()
 gd.save_for_rust("../rust-ols-adherence-cli/data.csv")
@@ -0,0 +1,103 @@
+"""
+Columns of qc_out.csv and zone_out.csv and the formatting shared by every
+writer of them (qc.records, save_qc/save_zones and the results store).
+"""
+import numpy as np
+import pandas as pd
+
+QC_COLUMNS = [
+    "group", "subject", "week", "session", "error_type", "message",
+    "start_time", "end_time", "duration_s", "length",
+]
+
+META_COLUMNS = ["group", "subject", "week", "session"]
+NUMERIC_COLUMNS = [
+    "time_in_allowed_s",
+    "time_above_s",
+    "time_below_s",
+    "longest_bounded_bout_s",
+    "mazd",
+]
+METRIC_COLUMNS = NUMERIC_COLUMNS[:4] + ["bounded_met", "mazd"]
+ZONE_COLUMNS = META_COLUMNS + METRIC_COLUMNS
+
+_TWO_DIGITS = np.array([f"{i:02d}" for i in range(60)])
+
+
+def format_hms(times: pd.Series) -> pd.Series:
+    """Format datetimes as HH:MM:SS (same as .dt.strftime("%H:%M:%S")); NaT stays missing."""
+    values = times.to_numpy(dtype="datetime64[ns]")
+    valid = ~np.isnat(values)
+    secs = ((values[valid] - values[valid].astype("datetime64[D]")) // np.timedelta64(1, "s")).astype(np.int64)
+    out = np.full(len(values), np.nan, dtype=object)
+    out[valid] = np.char.add(
+        np.char.add(np.char.add(_TWO_DIGITS[secs // 3600], ":"), np.char.add(_TWO_DIGITS[secs // 60 % 60], ":")),
+        _TWO_DIGITS[secs % 60],
+    )
+    return pd.Series(out, index=times.index, dtype=object)
+
+
+def _as_datetime(col: pd.Series | None, n: int) -> np.ndarray:
+    """Coerce a time column to naive datetime64[ns] (safe if already datetime)."""
+    if col is None:
+        return np.full(n, np.datetime64("NaT"), dtype="datetime64[ns]")
+    if not pd.api.types.is_datetime64_dtype(col.dtype):
+        col = pd.to_datetime(col, errors="coerce")
+        if getattr(col.dt, "tz", None) is not None:
+            col = col.dt.tz_localize(None)
+    return col.to_numpy(dtype="datetime64[ns]")
+
+
+def _norm_details(df: pd.DataFrame | None) -> tuple[np.ndarray, ...] | None:
+    """
+    Normalize a per-error detail table to the common (start_time, end_time,
+    duration_s, length) columns, or None when there are no detail rows.
+    """
+    if df is None or df.empty:
+        return None
+    n = len(df)
+
+    # Standardize time columns
+    if {"gap_start", "gap_end"}.issubset(df.columns):
+        start, end = df["gap_start"], df["gap_end"]
+    else:
+        start, end = df.get("start_time"), df.get("end_time")
+    # Compute duration_s if a Timedelta `duration` column exists
+    if "duration" in df.columns:
+        duration = df["duration"]
+        if not pd.api.types.is_timedelta64_dtype(duration.dtype):
+            duration = pd.to_timedelta(duration, errors="coerce")
+        duration_s = duration.to_numpy(dtype="timedelta64[ns]") / np.timedelta64(1, "s")
+    elif "duration_s" in df.columns:
+        duration_s = pd.to_numeric(df["duration_s"], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    else:
+        duration_s = np.full(n, np.nan)
+
+    # lengths (NaN-run sizes) stay objects so each table keeps its own int/float values
+    if "length" in df.columns:
+        length = df["length"].to_numpy(dtype=object)
+    else:
+        length = np.full(n, pd.NA, dtype=object)
+    return _as_datetime(start, n), _as_datetime(end, n), duration_s, length
+
+
+def reported_errors(err_dict: dict):
+    """
+    (error_type, message, normalized details or None) for each entry of a
+    QC err dict that goes into qc_out.csv, in dict order.
+    """
+    for err_type, payload in err_dict.items():
+        # Skip zone-related summaries except bounded_short
+        if err_type.startswith("zone") and err_type != "bounded_short":
+            continue
+        # payload is commonly [message, details_df]
+        msg = None
+        details_df = None
+        if isinstance(payload, (list, tuple)):
+            if len(payload) >= 1 and isinstance(payload[0], str):
+                msg = payload[0]
+            if len(payload) >= 2 and isinstance(payload[1], pd.DataFrame):
+                details_df = payload[1]
+        elif isinstance(payload, str):
+            msg = payload
+        yield err_type, msg, _norm_details(details_df)
@@ -0,0 +1,360 @@
+import heapq
+import itertools
+import logging
+import os
+import pickle
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from qc.columns import META_COLUMNS, METRIC_COLUMNS, NUMERIC_COLUMNS, QC_COLUMNS, ZONE_COLUMNS, format_hms, reported_errors
+from qc.zone.zone_qc import rescore
+from util.catalog import parse_path
+
+log = logging.getLogger(__name__)
+
+# NaT as int64 nanoseconds
+_NAT = np.iinfo(np.int64).min
+
+# one qc_out.csv row of a file, without its group/subject/week/session
+ERROR_DTYPE = np.dtype([
+    ("error_type", object),
+    ("message", object),
+    ("start_ns", np.int64),
+    ("end_ns", np.int64),
+    ("duration_s", np.float64),
+    ("length", object),
+])
+
+_NO_ERRORS = np.empty(0, dtype=ERROR_DTYPE)
+
+
+def file_meta(parse_meta, file: str, subject: str) -> dict:
+    """group/subject/week/session of `file`, with the subject directory as fallback subject."""
+    meta = parse_meta(file)
+    return {**meta, "subject": meta["subject"] or subject}
+
+
+def error_rows(err) -> np.ndarray:
+    """The qc_out.csv rows of an err dict as an ERROR_DTYPE array, times as int ns (_NAT when missing)."""
+    parts = []
+    if err and isinstance(err, dict):
+        for err_type, msg, norm in reported_errors(err):
+            if norm is None:
+                # errors without details still get one row
+                part = np.empty(1, dtype=ERROR_DTYPE)
+                part[0] = (err_type, msg, _NAT, _NAT, np.nan, pd.NA)
+                parts.append(part)
+                continue
+            start, end, duration_s, length = norm
+            part = np.empty(len(start), dtype=ERROR_DTYPE)
+            part["error_type"] = err_type
+            part["message"] = msg
+            part["start_ns"] = start.view(np.int64)
+            part["end_ns"] = end.view(np.int64)
+            part["duration_s"] = duration_s
+            part["length"] = length
+            parts.append(part)
+    return np.concatenate(parts) if parts else _NO_ERRORS
+
+
+class File_Result:
+    """
+    One file's QC outcome, reduced to what the output tables need.
+
+    `errors` holds the file's qc_out.csv rows as an ERROR_DTYPE array, in
+    err dict order, with times as int nanoseconds (_NAT when missing).
+    `zone` holds the zone_out.csv metrics as (week, *METRIC_COLUMNS), or
+    None when the file has no zone row, and `stats` the session's
+    qc.zone.kernel.Zone_Stats (None when it had no HR), from which rescore()
+    recomputes both. The err dict's detail DataFrames are not kept, so a
+    File_Result costs a few KB however many gaps the recording had.
+    """
+
+    __slots__ = ("file", "errors", "zone", "stats")
+
+    def __init__(self, file: str, errors: np.ndarray = _NO_ERRORS, zone: tuple | None = None, stats=None):
+        self.file = file
+        self.errors = errors
+        self.zone = zone
+        self.stats = stats
+
+    @classmethod
+    def from_qc(cls, file, err, zone_metrics, stats=None) -> "File_Result":
+        """Convert a file's err dict and zone metrics, as QC_Sup gives them, plus the session's Zone_Stats."""
+        zone = None
+        if zone_metrics is not None:
+            zone = (zone_metrics.get("week"), *(zone_metrics.get(col) for col in METRIC_COLUMNS))
+        return cls(str(file), error_rows(err), zone, stats)
+
+    def rescore(self, zones) -> "File_Result":
+        """
+        This result with its zone row and bounded_short rows recomputed from
+        `stats` for `zones` (a ZoneTable.lookup array) and the current weekly
+        plans, as a rerun of QC would give them. Results without stats (no
+        HR, or rejected before QC) are returned as they are.
+        """
+        if self.stats is None:
+            return self
+        zone_metrics, zone_err = rescore(self.stats, zones)
+        rescored = File_Result.from_qc(self.file, zone_err, zone_metrics, self.stats)
+        # zone errors come after the data checks' in QC_Sup's err dict
+        kept = self.errors[self.errors["error_type"] != "bounded_short"]
+        return File_Result(self.file, np.concatenate([kept, rescored.errors]), rescored.zone, self.stats)
+
+    def qc_rows(self, meta: dict) -> list[tuple]:
+        """qc_out.csv rows (QC_COLUMNS, times as int ns or None) given the file's group/subject/week/session."""
+        head = (meta["group"], meta["subject"], meta["week"], meta["session"])
+        errors = self.errors
+        times = []
+        for name in ("start_ns", "end_ns"):
+            values = errors[name].astype(object)
+            values[errors[name] == _NAT] = None
+            times.append(values)
+        return [
+            head + row
+            for row in zip(errors["error_type"], errors["message"], *times, errors["duration_s"].tolist(), errors["length"])
+        ]
+
+    def zone_row(self, meta: dict) -> tuple | None:
+        """The zone_out.csv row (ZONE_COLUMNS), or None."""
+        if self.zone is None:
+            return None
+        week = self.zone[0] if self.zone[0] is not None else meta["week"]
+        return (meta["group"], meta["subject"], week, meta["session"], *self.zone[1:])
+
+
+def _qc_frame(meta: dict, errors: np.ndarray) -> pd.DataFrame:
+    """qc_out.csv rows from META_COLUMNS arrays and the matching ERROR_DTYPE rows: nullable week, HH:MM:SS times."""
+    df = pd.DataFrame({**meta, "error_type": errors["error_type"], "message": errors["message"]})
+    df["week"] = pd.array(df["week"], dtype="Int64")
+    df["start_time"] = format_hms(pd.Series(errors["start_ns"].astype("datetime64[ns]")))
+    df["end_time"] = format_hms(pd.Series(errors["end_ns"].astype("datetime64[ns]")))
+    df["duration_s"] = errors["duration_s"]
+    df["length"] = errors["length"]
+    return df
+
+
+def qc_chunk_frame(chunks: list[tuple]) -> pd.DataFrame:
+    """
+    qc_out.csv rows of (head, errors) chunks, one per file or session: each
+    chunk's group/subject/week/session is broadcast over its ERROR_DTYPE rows.
+    """
+    heads = [head for head, _ in chunks]
+    counts = [len(errors) for _, errors in chunks]
+    meta = {
+        name: np.repeat(np.array([head[k] for head in heads], dtype=object), counts)
+        for k, name in enumerate(META_COLUMNS)
+    }
+    return _qc_frame(meta, np.concatenate([errors for _, errors in chunks]))
+
+
+def qc_csv_frame(rows: list[tuple]) -> pd.DataFrame:
+    """Non-empty qc_out.csv rows (QC_COLUMNS, times as int ns or None) formatted for the CSV."""
+    cols = list(zip(*rows))
+    errors = np.empty(len(rows), dtype=ERROR_DTYPE)
+    errors["error_type"] = cols[4]
+    errors["message"] = cols[5]
+    errors["start_ns"] = [_NAT if v is None else v for v in cols[6]]
+    errors["end_ns"] = [_NAT if v is None else v for v in cols[7]]
+    errors["duration_s"] = [np.nan if v is None else v for v in cols[8]]
+    errors["length"] = [pd.NA if v is None else v for v in cols[9]]
+    meta = {name: np.array(col, dtype=object) for name, col in zip(META_COLUMNS, cols[:4])}
+    return _qc_frame(meta, errors)
+
+
+def zone_csv_frame(rows: list[tuple]) -> pd.DataFrame:
+    """Non-empty zone_out.csv rows (ZONE_COLUMNS) with their CSV types: nullable week and bounded_met, numeric metrics."""
+    df = pd.DataFrame.from_records(rows, columns=ZONE_COLUMNS)
+    df["week"] = pd.array(df["week"], dtype="Int64")
+    for col in NUMERIC_COLUMNS:
+        df[col] = pd.to_numeric(df[col], errors="coerce")
+    df["bounded_met"] = df["bounded_met"].astype("boolean")
+    return df
+
+
+def _one_row(chunk) -> int:
+    return 1
+
+
+def write_csv(out_csv, columns: list[str], chunks, frame, batch_rows: int = 50_000, size=_one_row) -> int:
+    """
+    Write `chunks` (already in output order, any iterable) to `out_csv`,
+    formatting about `batch_rows` rows at a time with `frame`, which turns a
+    list of chunks into a DataFrame. `size(chunk)` is the number of rows in
+    a chunk (by default each chunk is one row). Returns the row count.
+    """
+    out_csv = Path(out_csv)
+    out_csv.parent.mkdir(parents=True, exist_ok=True)
+    n = 0
+    with open(out_csv, "w", newline="") as fh:
+        pd.DataFrame(columns=columns).to_csv(fh, index=False)
+        batch, batch_n = [], 0
+        for chunk in chunks:
+            batch.append(chunk)
+            batch_n += size(chunk)
+            if batch_n >= batch_rows:
+                frame(batch).to_csv(fh, index=False, header=False)
+                n += batch_n
+                batch, batch_n = [], 0
+        if batch:
+            frame(batch).to_csv(fh, index=False, header=False)
+            n += batch_n
+    return n
+
+
+def _na_last(value):
+    # missing values sort after everything else, as in DataFrame.sort_values
+    if value is None or value is pd.NA or (isinstance(value, float) and value != value):
+        return (1, 0)
+    return (0, value)
+
+
+class Sorted_CSV:
+    """
+    A CSV whose chunks of rows arrive in any order and are written sorted,
+    without holding the whole table.
+
+    Chunks are buffered with their sort key; once `spill_rows` rows are
+    buffered the buffer is sorted and pickled to a temporary run file.
+    close() merges the runs and the remaining buffer, passes the (key,
+    chunk) stream through `combine` if given (which yields the chunks to
+    write, e.g. merged or reordered within a key range) and writes the
+    result in batches, so memory is bounded by `spill_rows` whatever the
+    cohort size. `size(chunk)` is the number of rows in a chunk (one by
+    default). Keys must be unique (callers append their own tie-breakers).
+    """
+
+    def __init__(self, out_csv, columns: list[str], frame, spill_rows: int = 200_000, size=_one_row, combine=None):
+        self.out_csv = out_csv
+        self.columns = columns
+        self.frame = frame
+        self.spill_rows = spill_rows
+        self.size = size
+        self.combine = combine
+        self._buffer = []
+        self._buffer_rows = 0
+        self._runs = []
+        self._tmp = None
+
+    def add(self, key: tuple, chunk) -> None:
+        self._buffer.append((key, chunk))
+        self._buffer_rows += self.size(chunk)
+        if self._buffer_rows >= self.spill_rows:
+            self._spill()
+
+    def _spill(self) -> None:
+        if self._tmp is None:
+            self._tmp = tempfile.TemporaryDirectory(prefix="hr_sort_")
+        self._buffer.sort(key=lambda item: item[0])
+        path = os.path.join(self._tmp.name, f"run{len(self._runs)}.pkl")
+        with open(path, "wb") as fh:
+            # pickled in pieces of about 10k rows, so a merge only holds a piece per run
+            piece, piece_rows = [], 0
+            for item in self._buffer:
+                piece.append(item)
+                piece_rows += self.size(item[1])
+                if piece_rows >= 10_000:
+                    pickle.dump(piece, fh, protocol=pickle.HIGHEST_PROTOCOL)
+                    piece, piece_rows = [], 0
+            if piece:
+                pickle.dump(piece, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        self._runs.append(path)
+        self._buffer = []
+        self._buffer_rows = 0
+
+    @staticmethod
+    def _read_run(path):
+        with open(path, "rb") as fh:
+            while True:
+                try:
+                    piece = pickle.load(fh)
+                except EOFError:
+                    return
+                yield from piece
+
+    def close(self) -> int:
+        """Write the CSV; returns the number of rows."""
+        self._buffer.sort(key=lambda item: item[0])
+        runs = [self._read_run(path) for path in self._runs] + [iter(self._buffer)]
+        merged = heapq.merge(*runs, key=lambda item: item[0]) if len(runs) > 1 else runs[0]
+        chunks = self.combine(merged) if self.combine is not None else (chunk for _, chunk in merged)
+        try:
+            return write_csv(self.out_csv, self.columns, chunks, self.frame, size=self.size)
+        finally:
+            self._buffer = []
+            self._buffer_rows = 0
+            if self._tmp is not None:
+                self._tmp.cleanup()
+
+
+def _error_count(chunk) -> int:
+    return len(chunk[1])
+
+
+def _sorted_sessions(items):
+    """
+    One (head, errors) chunk per group/subject/week/session from the
+    key-ordered per-file chunks, with the session's rows sorted by
+    error_type, start_time and end_time (missing times last). The sort is
+    stable, so ties stay in run order.
+    """
+    for _, session in itertools.groupby(items, key=lambda item: item[0][:4]):
+        session = [chunk for _, chunk in session]
+        head = session[0][0]
+        errors = np.concatenate([errors for _, errors in session]) if len(session) > 1 else session[0][1]
+        _, types = np.unique(errors["error_type"], return_inverse=True)
+        start, end = errors["start_ns"], errors["end_ns"]
+        order = np.lexsort((end, end == _NAT, start, start == _NAT, types))
+        yield head, errors[order]
+
+
+class Results_Writer:
+    """
+    qc_out.csv and zone_out.csv from File_Results streamed in task order.
+
+    This is the one writer of both tables; save_qc/save_zones and the
+    results store go through it or its frame formatters. qc_out.csv is
+    sorted by group, subject, week, session, error_type, start_time and
+    end_time, zone_out.csv by group, subject, week and session, with missing
+    values last and ties kept in run order: subjects by first appearance,
+    then files in task order. Each file's errors are kept as one chunk keyed
+    by its session and run position; a session's chunks are only sorted by
+    error type and time when the sorted stream is written. A table whose
+    path is None is not written.
+    """
+
+    def __init__(self, out_path, zone_out_path, catalog=None, spill_rows: int = 200_000):
+        self.parse_meta = catalog.meta if catalog is not None else parse_path
+        self.qc = None
+        if out_path is not None:
+            self.qc = Sorted_CSV(
+                out_path, QC_COLUMNS, qc_chunk_frame, spill_rows, size=_error_count, combine=_sorted_sessions,
+            )
+        self.zones = Sorted_CSV(zone_out_path, ZONE_COLUMNS, zone_csv_frame, spill_rows) if zone_out_path is not None else None
+        self._rank = {}  # subject -> order of first appearance
+
+    def add(self, seq: int, subject: str, result: File_Result) -> None:
+        """Add the result of the `seq`-th task, whose subject directory is `subject`."""
+        rank = self._rank.setdefault(subject, len(self._rank))
+        meta = file_meta(self.parse_meta, result.file, subject)
+        head = (meta["group"], meta["subject"], meta["week"], meta["session"])
+        key = tuple(_na_last(v) for v in head) + (rank, seq)
+        if self.qc is not None and len(result.errors):
+            self.qc.add(key, (head, result.errors))
+        row = result.zone_row(meta) if self.zones is not None else None
+        if row is not None:
+            self.zones.add(tuple(_na_last(v) for v in row[:4]) + (rank, seq), row)
+
+    def close(self) -> tuple[int, int]:
+        """Write both CSVs; returns their row counts (0 for a table that is not written)."""
+        n_qc = n_zones = 0
+        if self.qc is not None:
+            n_qc = self.qc.close()
+            log.info("QC summary written: %s (%d rows)", self.qc.out_csv, n_qc)
+        if self.zones is not None:
+            n_zones = self.zones.close()
+            log.info("Zone QC summary written: %s (%d rows)", self.zones.out_csv, n_zones)
+        return n_qc, n_zones
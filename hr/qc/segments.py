@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+
+from util.hr.recording import CLOCK_BASE, Recording
+
+
+def _clock(seconds: np.ndarray) -> np.ndarray:
+    return CLOCK_BASE + seconds.astype("timedelta64[s]")
+
+
+class Segment_Index:
+    """
+    Run-length index of a Recording, built in one pass over its hr mask.
+
+    - runs: maximal stretches of consecutive valid or NaN samples
+      (`run_start`, `run_end` inclusive, `run_is_nan`, `run_length`),
+      numbered from 1 in time order
+    - time gaps: the step between each valid sample and the previous valid
+      one (`valid_idx`, `valid_step`), so NaN stretches in between count
+      towards the gap
+
+    Gap- and run-based checks slice these arrays with their own thresholds
+    instead of re-scanning the samples.
+    """
+
+    __slots__ = ("seconds", "run_start", "run_end", "run_is_nan", "run_length", "valid_idx", "valid_step")
+
+    def __init__(self, rec: Recording):
+        self.seconds = rec.seconds
+        is_nan = np.isnan(rec.hr)
+        n = len(is_nan)
+
+        # run boundaries: where the mask changes
+        self.run_start = np.flatnonzero(np.r_[n > 0, is_nan[1:] != is_nan[:-1]])
+        self.run_end = np.r_[self.run_start[1:], n] - 1
+        self.run_is_nan = is_nan[self.run_start]
+        self.run_length = self.run_end - self.run_start + 1
+
+        self.valid_idx = np.flatnonzero(~is_nan)
+        self.valid_step = np.diff(rec.seconds[self.valid_idx])
+
+    def nan_runs(self, min_run: int = 30) -> pd.DataFrame:
+        """
+        Runs of more than `min_run` consecutive NaNs as a DataFrame with
+        columns [start_time, end_time, duration, length], indexed by run number.
+        """
+        keep = self.run_is_nan & (self.run_length > min_run)
+        start_time = _clock(self.seconds[self.run_start[keep]])
+        end_time = _clock(self.seconds[self.run_end[keep]])
+        return pd.DataFrame(
+            {
+                "start_time": start_time,
+                "end_time": end_time,
+                "duration": end_time - start_time,
+                "length": self.run_length[keep].astype(np.int64),
+            },
+            index=pd.Index(np.flatnonzero(keep) + 1, dtype=np.int64, name="run"),
+        )
+
+    def gaps(self, max_gap_s: float = 30) -> pd.DataFrame:
+        """
+        Stretches of more than `max_gap_s` seconds between consecutive valid
+        samples as a DataFrame with columns [gap_start, gap_end, duration],
+        indexed by the sample that ends each gap.
+        """
+        after = np.flatnonzero(self.valid_step > max_gap_s) + 1
+        gap_start = _clock(self.seconds[self.valid_idx[after - 1]])  # end of last good sample
+        gap_end = _clock(self.seconds[self.valid_idx[after]])        # start of next good sample
+        return pd.DataFrame(
+            {"gap_start": gap_start, "gap_end": gap_end, "duration": gap_end - gap_start},
+            index=self.valid_idx[after],
+        )
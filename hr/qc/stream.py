@@ -0,0 +1,357 @@
+import math
+from bisect import bisect_right
+from collections import Counter, deque
+
+import numpy as np
+import pandas as pd
+
+from qc.segments import _clock
+from qc.sup import QC_Sup
+from qc.zone.zone_qc import MAX_SESSION_MIN, SUPERVISED_PLAN, UNSUPERVISED_PLAN, zone_bounds, zone_report
+from util.hr.recording import Recording
+
+
+def _histogram_median(hist: Counter, extra=None) -> float:
+    """Median of the values counted in `hist` (plus `extra`, if given), as np.median takes it."""
+    n = sum(hist.values()) + (extra is not None)
+    if n == 0:
+        return 0.0
+    lo, hi = (n - 1) // 2, n // 2
+    values = sorted(hist if extra is None else {*hist, extra})
+    seen = 0
+    low = None
+    for value in values:
+        seen += hist.get(value, 0) + (value == extra)
+        if low is None and seen > lo:
+            low = value
+        if seen > hi:
+            return (low + value) / 2
+
+
+def _columns(rows: list, width: int) -> list[np.ndarray]:
+    """int64 columns of a list of equal-length tuples."""
+    if not rows:
+        return [np.empty(0, dtype=np.int64)] * width
+    return [np.asarray(col, dtype=np.int64) for col in zip(*rows)]
+
+
+class QC_Stream:
+    """
+    QC_Sup for a recording that arrives one sample at a time.
+
+    `push(t, hr)` folds each sample into running totals: the gap and NaN
+    run in progress, time in/above/below the allowed zones, the current and
+    longest bounded bout and the MAZD sums. The work per sample is constant.
+
+    Each gap and NaN run is counted when it closes (`n_gaps`,
+    `n_nan_runs`) and handed to `on_event(kind, row)` when given, with kind
+    "missing" and row (index, start_s, end_s), or kind "nan" and row (run,
+    start_s, end_s, length). Only the last `max_events` of each are kept
+    for the err detail tables; the default None keeps them all, as QC_Sup
+    reports them, and lets that list grow with the number of gaps and runs.
+    The other per-recording state is a histogram of the steps between
+    samples (for the last sample's duration), which has one entry per
+    distinct step size, so a handful for a Polar export whatever its length.
+
+    `err` and `zone_metrics` can be read at any point and equal what QC_Sup
+    reports for the samples pushed so far, including the 45 minute window of
+    supervised sessions and the MAZD cap of unsupervised ones. Samples must
+    arrive in time order (the order a Recording is in); replay() feeds a
+    whole recording through.
+    """
+
+    __slots__ = (
+        "week", "session_type", "max_gap_s", "min_nan_run", "err_plan",
+        "plan", "_supervised", "_cap_s",
+        "_ids", "_starts", "_ends", "_ordered", "_min_start", "_max_end", "_top_zone",
+        "_allowed", "_lowest", "_highest",
+        "on_event", "n_gaps", "n_nan_runs",
+        "n", "t0", "last_t", "_last_valid", "_gaps",
+        "_run_no", "_run_is_nan", "_nan_start", "_nan_end", "_nan_len", "_nan_runs",
+        "_pending", "_closed", "_steps",
+        "_in_allowed_s", "_above_s", "_below_s", "_bout_s", "_longest_s", "_mazd_sum", "_mazd_w",
+    )
+
+    def __init__(
+        self,
+        zones,
+        week,
+        session_type: str,
+        max_gap_s: float | None = None,
+        min_nan_run: int | None = None,
+        max_events: int | None = None,
+        on_event=None,
+    ):
+        self.week = int(week)
+        self.session_type = session_type.lower()
+        self.max_gap_s = QC_Sup.MAX_GAP_S if max_gap_s is None else max_gap_s
+        self.min_nan_run = QC_Sup.MIN_NAN_RUN if min_nan_run is None else min_nan_run
+
+        # same plan and window choice as QC_Sup.qc_zones / QC_Zone
+        self._supervised = self.session_type.startswith("super")
+        plans = SUPERVISED_PLAN if self._supervised else UNSUPERVISED_PLAN
+        self.plan = plans.get(self.week)
+        self.err_plan = None
+        if self.plan is None:
+            kind = "supervised" if self._supervised else "unsupervised"
+            self.err_plan = f"no {kind} plan for week {self.week}"
+        self._cap_s = MAX_SESSION_MIN * 60
+
+        bounds = zone_bounds(zones) if zones is not None else {}
+        allowed = self.plan["zones"] if self.plan else []
+        self._ids = sorted(bounds)
+        self._starts = [float(bounds[z][0]) for z in self._ids]
+        self._ends = [float(bounds[z][1]) for z in self._ids]
+        self._ordered = all(s <= e for s, e in zip(self._starts, self._ends)) and all(
+            e < s for e, s in zip(self._ends[:-1], self._starts[1:])
+        )
+        if bounds:
+            self._min_start, self._max_end = min(self._starts), max(self._ends)
+            self._top_zone = float(self._ids[-1]) + 1
+        # zones are scored only with bounds and allowed zones, as in zone_kernel
+        self._allowed = [float(z) for z in allowed] if bounds and allowed else []
+        if self._allowed:
+            self._lowest = min(bounds[z][0] for z in allowed)
+            self._highest = max(bounds[z][1] for z in allowed)
+
+        self.n = 0
+        self.t0 = self.last_t = None
+        # data QC: last valid sample (index, t), counts of the gaps and NaN
+        # runs found so far and the last max_events of each
+        self.on_event = on_event
+        self.n_gaps = self.n_nan_runs = 0
+        self._last_valid = None
+        self._gaps = deque(maxlen=max_events)
+        self._run_no = 0
+        self._run_is_nan = None
+        self._nan_start = self._nan_end = None
+        self._nan_len = 0
+        self._nan_runs = deque(maxlen=max_events)
+
+        # zone QC: a sample's duration is the step to the next one, so the
+        # latest sample waits in _pending until the next one arrives
+        self._pending = None
+        self._closed = False
+        self._steps = Counter()
+        self._in_allowed_s = self._above_s = self._below_s = 0.0
+        self._bout_s = self._longest_s = 0.0
+        self._mazd_sum = self._mazd_w = 0.0
+
+    @classmethod
+    def replay(cls, hr, zones, week, session_type: str, **kwargs) -> "QC_Stream":
+        """Push every sample of a Recording (or time/hr frame) through a new stream."""
+        stream = cls(zones, week, session_type, **kwargs)
+        if hr is not None:
+            rec = Recording.coerce(hr)
+            stream.push_many(rec.seconds, rec.hr)
+        return stream
+
+    def push_many(self, seconds, hr) -> None:
+        for t, value in zip(np.asarray(seconds).tolist(), np.asarray(hr, dtype=float).tolist()):
+            self.push(t, value)
+
+    def push(self, t, hr) -> None:
+        """Add one sample: `t` in seconds (non-decreasing), `hr` in bpm or NaN/None when missing."""
+        if self.last_t is not None and t < self.last_t:
+            raise ValueError(f"samples must arrive in time order: {t} after {self.last_t}")
+        hr = math.nan if hr is None else float(hr)
+        is_nan = math.isnan(hr)
+        idx = self.n
+        self.n += 1
+        if self.t0 is None:
+            self.t0 = t
+        self.last_t = t
+
+        # data QC: runs of the NaN mask, and steps between valid samples
+        if is_nan is not self._run_is_nan:
+            self._close_nan_run()
+            self._run_no += 1
+            self._run_is_nan = is_nan
+        if is_nan:
+            if self._nan_len == 0:
+                self._nan_start = t
+            self._nan_end = t
+            self._nan_len += 1
+        else:
+            if self._last_valid is not None and t - self._last_valid[1] > self.max_gap_s:
+                self._event("missing", self._gaps, (idx, self._last_valid[1], t))
+                self.n_gaps += 1
+            self._last_valid = (idx, t)
+
+        if self._allowed and not self._closed:
+            self._push_zone(t - self.t0, hr)
+
+    def _close_nan_run(self) -> None:
+        if self._nan_len > self.min_nan_run:
+            self._event("nan", self._nan_runs, (self._run_no, self._nan_start, self._nan_end, self._nan_len))
+            self.n_nan_runs += 1
+        self._nan_len = 0
+
+    def _event(self, kind: str, kept: deque, row: tuple) -> None:
+        kept.append(row)
+        if self.on_event is not None:
+            self.on_event(kind, row)
+
+    # -- zone QC -------------------------------------------------------------
+
+    def _classify(self, hr: float) -> tuple:
+        """(zone, in_allowed, above, bounded) for one sample, as bucket_zones/zone_kernel classify it."""
+        zone = math.nan
+        if self._ordered:
+            k = bisect_right(self._starts, hr) - 1
+            if k >= 0 and hr <= self._ends[k]:
+                zone = float(self._ids[k])
+            in_allowed = zone in self._allowed
+        else:
+            in_allowed = False
+            for z, start, end in zip(self._ids, self._starts, self._ends):
+                if start <= hr <= end:
+                    zone = float(z)
+                    in_allowed = in_allowed or z in self._allowed
+        if hr < self._min_start:
+            zone = 0.0
+        if hr > self._max_end:
+            zone = self._top_zone
+        above = hr > self._highest and not in_allowed
+        return zone, in_allowed, above, hr >= self._lowest
+
+    def _push_zone(self, offset, hr: float) -> None:
+        sample = (offset, hr, *self._classify(hr))
+        pending = self._pending
+        if pending is None:
+            self._pending = sample
+            return
+        step = offset - pending[0]
+        if self._supervised and offset >= self._cap_s:
+            # the supervised window ends here; a sample that runs past the
+            # cap is cut at it and repeated there, as truncate_to_seconds does
+            self._closed = True
+            if offset > self._cap_s:
+                remaining = self._cap_s - pending[0]
+                self._steps[remaining] += 1
+                self._fold(pending, remaining)
+                self._pending = (self._cap_s, *pending[1:])
+            return
+        self._steps[step] += 1
+        self._fold(pending, step)
+        self._pending = sample
+
+    def _fold(self, sample: tuple, d: float) -> None:
+        """Add `d` seconds of one sample to the running totals."""
+        offset, _, zone, in_allowed, above, bounded = sample
+        if in_allowed:
+            self._in_allowed_s += d
+        elif above:
+            self._above_s += d
+        else:
+            self._below_s += d
+
+        if bounded:
+            self._bout_s += d
+            self._longest_s = max(self._longest_s, self._bout_s)
+        else:
+            self._bout_s = 0.0
+
+        if not math.isnan(zone):
+            # unsupervised sessions only weigh the first 45 minutes in the MAZD
+            w = d if self._supervised else max(min(d, self._cap_s - offset), 0.0)
+            self._mazd_sum += min(abs(zone - z) for z in self._allowed) * w
+            self._mazd_w += w
+
+    def _metrics(self) -> dict | None:
+        """zone_kernel metrics for the samples so far, with the pending sample's duration estimated."""
+        if self._pending is None:
+            return None
+        saved = (
+            self._in_allowed_s, self._above_s, self._below_s,
+            self._bout_s, self._longest_s, self._mazd_sum, self._mazd_w,
+        )
+        try:
+            pending = self._pending
+            d = _histogram_median(self._steps)
+            if self._supervised and not self._closed and pending[0] + d > self._cap_s:
+                # the last sample would run past the cap: cut it and score a
+                # copy at the cap for one median step of the cut steps
+                remaining = self._cap_s - pending[0]
+                self._fold(pending, remaining)
+                pending = (self._cap_s, *pending[1:])
+                d = _histogram_median(self._steps, extra=remaining)
+            self._fold(pending, d)
+            bounded_min = self.plan["bounded_min"]
+            return {
+                "time_in_allowed_s": float(self._in_allowed_s),
+                "time_above_s": float(self._above_s),
+                "time_below_s": float(self._below_s),
+                "longest_bounded_bout_s": float(self._longest_s),
+                "bounded_met": bool(self._longest_s >= bounded_min * 60),
+                "mazd": float(self._mazd_sum / self._mazd_w) if self._mazd_w > 0 else None,
+            }
+        finally:
+            (
+                self._in_allowed_s, self._above_s, self._below_s,
+                self._bout_s, self._longest_s, self._mazd_sum, self._mazd_w,
+            ) = saved
+
+    # -- results -------------------------------------------------------------
+
+    @property
+    def current_gap_s(self) -> float:
+        """Seconds since the last valid sample (0 when the latest sample is valid)."""
+        if self.last_t is None:
+            return 0.0
+        since = self._last_valid[1] if self._last_valid is not None else self.t0
+        return float(self.last_t - since)
+
+    @property
+    def current_nan_run(self) -> int:
+        """Length of the NaN run in progress."""
+        return self._nan_len
+
+    @property
+    def missing_periods(self) -> pd.DataFrame:
+        """Gaps so far (the last max_events), as QC_Sup._missing_periods returns them."""
+        idx, start, end = _columns(list(self._gaps), 3)
+        gap_start, gap_end = _clock(start), _clock(end)
+        return pd.DataFrame(
+            {"gap_start": gap_start, "gap_end": gap_end, "duration": gap_end - gap_start},
+            index=idx,
+        )
+
+    @property
+    def nan_runs(self) -> pd.DataFrame:
+        """NaN runs so far (the last max_events), including one in progress, as QC_Sup._nan_check returns them."""
+        runs = list(self._nan_runs)
+        if self._nan_len > self.min_nan_run:
+            runs.append((self._run_no, self._nan_start, self._nan_end, self._nan_len))
+        run_no, start, end, length = _columns(runs, 4)
+        start_time, end_time = _clock(start), _clock(end)
+        return pd.DataFrame(
+            {"start_time": start_time, "end_time": end_time, "duration": end_time - start_time, "length": length},
+            index=pd.Index(run_no, dtype=np.int64, name="run"),
+        )
+
+    @property
+    def zone_metrics(self) -> dict | None:
+        if self.plan is None:
+            return None
+        metrics = self._metrics()
+        return zone_report(self.week, metrics)[0] if metrics is not None else None
+
+    @property
+    def err(self) -> dict:
+        """QC_Sup.err for the samples so far."""
+        err = {}
+        if self.n_gaps:
+            err["missing"] = ["missing significant time", self.missing_periods]
+        elif self.n_nan_runs or self._nan_len > self.min_nan_run:
+            err["nan"] = [f"more than {self.min_nan_run} NaNs in a row", self.nan_runs]
+
+        if self.plan is None:
+            err["zone_summary"] = [self.err_plan, None]
+            return err
+        metrics = self._metrics()
+        if metrics is None:
+            err["zone_summary"] = ["hr data missing for zone QC", None]
+        else:
+            err.update(zone_report(self.week, metrics)[1])
+        return err
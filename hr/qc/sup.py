@@ -2,18 +2,27 @@ import pandas as pd
 import logging
 
 from qc.zone.zone_qc import QC_Zone
+from qc.segments import Segment_Index
+from util.hr.recording import Recording
 
 logger = logging.getLogger(__name__)
 
 class QC_Sup:
 
+    # data QC thresholds: gaps between valid samples, and consecutive NaNs
+    MAX_GAP_S = 30
+    MIN_NAN_RUN = 30
+
     def __init__(self, hr, zones, week, session_type: str):
-        self.hr = hr
+        # a Recording (a time/hr DataFrame is converted once); QC only reads it
+        self.hr = Recording.coerce(hr) if hr is not None else None
+        self._segment_index = None
         self.zones = zones
         self.week = week
         self.err = {}
         self.session_type = session_type.lower()
         self.zone_metrics = None
+        self.zone_stats = None
 
     def main(self):
         self.qc_data()
@@ -28,11 +37,11 @@ class QC_Sup:
         
         logger.debug("running missing check")
         missing_check, missing_periods = self._missing_periods()
-        nan_runs = self._nan_check(self.hr.copy())
+        nan_runs = self._nan_check()
         if missing_check == 1:
             self.err['missing'] = ['missing significant time', missing_periods]
         elif not nan_runs.empty:
-            self.err['nan'] = ['more than 30 NaNs in a row', nan_runs]
+            self.err['nan'] = [f'more than {self.MIN_NAN_RUN} NaNs in a row', nan_runs]
         else: 
             return None
 
@@ -51,73 +60,32 @@ class QC_Sup:
 
         # Merge any zone errors into the overall error dictionary
         self.err.update(qc_zone.err)
+        self.zone_stats = qc_zone.zone_stats
         return qc_zone.zone_metrics
 
 
 
-    def _missing_periods(self):
-
-        df = self.hr.copy()
-
-        # assume df has columns “time” and “hr”
-        df['time'] = pd.to_datetime(df['time'], format='%H:%M:%S')
-        df = df.sort_values('time')
-
-        # drop any NaNs so we only look at real measurements
-        valid = df.dropna(subset=['hr'])
+    def _segments(self) -> Segment_Index:
+        """Run-length index of the recording, built on first use and shared by the data checks."""
+        if self._segment_index is None:
+            self._segment_index = Segment_Index(self.hr)
+        return self._segment_index
 
-        # compute time‐diff between successive valid samples
-        delta = valid['time'].diff()
-
-        # mask where that gap exceeds 30 s
-        gaps = delta > pd.Timedelta(seconds=30)
-
-        # build a table of missing‐data intervals
-        prev_time = valid['time'].shift()
-        missing_periods = pd.DataFrame({
-            'gap_start': prev_time[gaps],    # end of last good sample
-            'gap_end':   valid['time'][gaps] # start of next good sample
-        })
-        missing_periods['duration'] = missing_periods['gap_end'] - missing_periods['gap_start']
+    def _missing_periods(self, max_gap_s: float | None = None):
+        """
+        Gaps of more than `max_gap_s` seconds (default MAX_GAP_S) between
+        consecutive valid samples. Returns (flag, DataFrame[gap_start, gap_end, duration]).
+        """
+        missing_periods = self._segments().gaps(self.MAX_GAP_S if max_gap_s is None else max_gap_s)
         if missing_periods.empty:
             return 0, missing_periods
         else:
             return 1, missing_periods
 
 
-    def _nan_check(self, df: pd.DataFrame, min_run: int = 30) -> pd.DataFrame:
+    def _nan_check(self, min_run: int | None = None) -> pd.DataFrame:
         """
-        Detect runs of > min_run consecutive NaNs in df['hr'].
-        Returns a DataFrame with columns: [start_time, end_time, length].
+        Detect runs of > min_run (default MIN_NAN_RUN) consecutive NaNs.
+        Returns a DataFrame with columns: [start_time, end_time, duration, length].
         """
-        # 1) Ensure time is datetime and sorted
-        df = df.copy()
-        df['time'] = pd.to_datetime(df['time'])
-        df = df.sort_values('time').reset_index(drop=True)
-
-        # 2) Boolean mask of where hr is NaN
-        is_nan = df['hr'].isna()
-
-        # 3) Build run‐IDs by marking where the mask changes
-        run_id = is_nan.ne(is_nan.shift()).cumsum()
-
-        # 4) Aggregate each run
-        summary = (
-            df
-            .assign(is_nan=is_nan, run=run_id)
-            .groupby('run')
-            .agg(
-                start_time=('time', 'first'),
-                end_time  =('time', 'last'),
-                length    =('is_nan', 'size'),
-                all_nan   =('is_nan', 'all')
-            )
-        )
-
-        # 5) Filter to runs that are all-NaN and longer than min_run
-        long_runs = summary[(summary['all_nan']) & (summary['length'] > min_run)]
-
-        # 6) Add duration and return start/end/length/duration
-        long_runs = long_runs.copy()
-        long_runs['duration'] = long_runs['end_time'] - long_runs['start_time']
-        return long_runs[['start_time', 'end_time', 'duration', 'length']]
+        return self._segments().nan_runs(self.MIN_NAN_RUN if min_run is None else min_run)
@@ -0,0 +1,285 @@
+"""
+QC and zone metrics over a grid of thresholds, from one read of each file.
+
+The thresholds QC hard-codes are the parameters: the gap that counts as
+missing time (QC_Sup.MAX_GAP_S), the NaN run length (QC_Sup.MIN_NAN_RUN),
+the session cap (zone_qc.MAX_SESSION_MIN), the zone midpoint snap
+(ZoneTable snap_to) and the longest recording kept (pipeline.MAX_RECORDING).
+Each recording is parsed once and every combination is evaluated from it:
+
+- gaps and NaN runs are thresholded on the sorted Segment_Index steps and
+  run lengths, so any number of thresholds costs one searchsorted
+- zone metrics come from one Zone_Stats per session cap, scored against the
+  subject's bounds under every snap_to at once (Zone_Stats.score_bounds)
+- the recording cutoff only decides which parameter sets skip the file
+
+and the per-parameter results are broadcast over the full grid.
+"""
+import itertools
+import logging
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from qc.columns import META_COLUMNS
+from qc.records import Sorted_CSV, _na_last, file_meta
+from qc.segments import Segment_Index
+from qc.sup import QC_Sup
+from qc.zone.zone_qc import MAX_SESSION_MIN, SUPERVISED_PLAN, UNSUPERVISED_PLAN, session_stats
+from util.catalog import parse_path
+from util.hr.extract_hr import _get_week_from_path, extract_recording, screen_recording
+from util.pipeline import MAX_RECORDING
+
+log = logging.getLogger(__name__)
+
+# grid parameters, in the order they vary in the output (the last fastest)
+PARAMS = ("max_gap_s", "min_nan_run", "session_cap_min", "snap_to", "max_recording_h")
+
+ZONE_METRICS = [
+    "time_in_allowed_s", "time_above_s", "time_below_s",
+    "longest_bounded_bout_s", "bounded_met", "zone_compliance", "mazd",
+]
+DATA_METRICS = ["data_error", "n_gaps", "gap_s", "n_nan_runs", "nan_run_samples"]
+SWEEP_COLUMNS = ["group", "subject", "week", "session", *PARAMS, *DATA_METRICS, *ZONE_METRICS]
+SUMMARY_COLUMNS = [
+    "group", *PARAMS, "n_sessions", "n_ignored", "n_missing", "n_nan", "n_zone_rows",
+    "n_bounded_met", "mean_time_in_allowed_s", "mean_zone_compliance", "mean_mazd",
+]
+
+_COUNT_COLUMNS = ["week", "n_gaps", "n_nan_runs", "nan_run_samples"]
+_MEAN_METRICS = ["time_in_allowed_s", "zone_compliance", "mazd"]
+
+
+def _number(text: str):
+    value = float(text)
+    return int(value) if value.is_integer() else value
+
+
+class Sweep_Grid:
+    """
+    Values to try for each of PARAMS; unset parameters keep the pipeline's
+    own value, so the grid always contains the default run.
+    """
+
+    def __init__(self, **values):
+        unknown = set(values) - set(PARAMS)
+        if unknown:
+            raise ValueError(f"Unknown sweep parameter(s): {', '.join(sorted(unknown))}; expected {', '.join(PARAMS)}")
+        defaults = {
+            "max_gap_s": QC_Sup.MAX_GAP_S,
+            "min_nan_run": QC_Sup.MIN_NAN_RUN,
+            "session_cap_min": MAX_SESSION_MIN,
+            "snap_to": 5,
+            "max_recording_h": MAX_RECORDING / pd.Timedelta(hours=1),
+        }
+        self.values = {}
+        for name in PARAMS:
+            given = values.get(name)
+            if given is None:
+                given = defaults[name]
+            given = tuple(dict.fromkeys(np.atleast_1d(given).tolist()))
+            if not given or any(v <= 0 for v in given):
+                raise ValueError(f"Sweep values for {name} must be positive, got {given}")
+            if name == "snap_to" and any(not float(v).is_integer() for v in given):
+                raise ValueError(f"snap_to values must be whole bpm, got {given}")
+            self.values[name] = given
+
+    @classmethod
+    def parse(cls, specs, **defaults) -> "Sweep_Grid":
+        """A grid from "name=v1,v2,..." strings (e.g. "max_gap_s=15,30,60"), over `defaults`."""
+        values = dict(defaults)
+        for spec in specs or ():
+            name, sep, text = spec.partition("=")
+            if not sep:
+                raise ValueError(f"Expected NAME=V1,V2,... for a sweep parameter, got {spec!r}")
+            try:
+                values[name.strip()] = [_number(v) for v in text.split(",") if v.strip()]
+            except ValueError:
+                raise ValueError(f"Sweep values for {name.strip()} must be numbers, got {text!r}") from None
+        return cls(**values)
+
+    @property
+    def shape(self) -> tuple[int, ...]:
+        return tuple(len(self.values[name]) for name in PARAMS)
+
+    def __len__(self):
+        return int(np.prod(self.shape))
+
+    def points(self) -> list[tuple]:
+        """Every parameter set as a tuple in PARAMS order, in output order."""
+        return list(itertools.product(*(self.values[name] for name in PARAMS)))
+
+
+def _exceeding(values: np.ndarray, thresholds) -> tuple[np.ndarray, np.ndarray]:
+    """Count and sum of `values` (sorted ascending) above each threshold."""
+    k = np.searchsorted(values, np.asarray(thresholds, dtype=float), side="right")
+    above = np.r_[np.cumsum(values[::-1])[::-1], 0]
+    return len(values) - k, above[k]
+
+
+def _zone_grid(rec, week: int, supervised: bool, bounds: np.ndarray, caps_min) -> dict:
+    """Zone metrics as (session cap, snap_to) arrays, NaN where QC reports no zone row."""
+    shape = (len(caps_min), len(bounds))
+    out = {name: np.full(shape, np.nan) for name in ZONE_METRICS}
+    weekly_plan = (SUPERVISED_PLAN if supervised else UNSUPERVISED_PLAN).get(week)
+    if weekly_plan is None or not weekly_plan.get("zones") or rec.empty:
+        return out
+    for i, cap_min in enumerate(caps_min):
+        stats = session_stats(rec, week, supervised, cap_min * 60)
+        if stats is None:
+            continue
+        scored = stats.score_bounds(bounds, weekly_plan["zones"], weekly_plan["bounded_min"])
+        for name, values in scored.items():
+            out[name][i] = values
+    total = out["time_in_allowed_s"] + out["time_above_s"] + out["time_below_s"]
+    np.divide(out["time_in_allowed_s"], total, out=out["zone_compliance"], where=total > 0)
+    return out
+
+
+def sweep_recording(rec, week: int, supervised: bool, bounds: np.ndarray, grid: Sweep_Grid, screen_s=None) -> dict:
+    """
+    DATA_METRICS and ZONE_METRICS of one Recording for every parameter set
+    of `grid`, as length-len(grid) arrays in Sweep_Grid.points() order.
+
+    `bounds` holds the subject's (n_zones, 2) zone bounds under each of the
+    grid's snap_to values, and `screen_s` the duration the header screen
+    found (seconds, None when it could not tell). Parameter sets whose
+    recording cutoff rejects the file get data_error "duration" and no
+    other metrics, as the pipeline reports it.
+    """
+    values = grid.values
+    seg = Segment_Index(rec)
+    n_gaps, gap_s = _exceeding(np.sort(seg.valid_step).astype(float), values["max_gap_s"])
+    n_nan, nan_samples = _exceeding(np.sort(seg.run_length[seg.run_is_nan]).astype(float), values["min_nan_run"])
+    zone = _zone_grid(rec, week, supervised, bounds, values["session_cap_min"])
+
+    # the screen and the parsed window are both checked against the cutoff
+    durations = [d for d in (screen_s, None if rec.empty else rec.end_s - rec.start_s) if d is not None]
+    cutoff_s = np.asarray(values["max_recording_h"], dtype=float) * 3600
+    ignored = max(durations) > cutoff_s if durations else np.zeros(len(cutoff_s), dtype=bool)
+
+    gap_i, nan_i, cap_i, snap_i, cut_i = np.indices(grid.shape).reshape(len(PARAMS), -1)
+    skip = ignored[cut_i]
+    data_error = np.where(n_gaps[gap_i] > 0, "missing", np.where(n_nan[nan_i] > 0, "nan", None)).astype(object)
+    data_error[skip] = "duration"
+    out = {
+        "data_error": data_error,
+        "n_gaps": n_gaps[gap_i].astype(float),
+        "gap_s": gap_s[gap_i],
+        "n_nan_runs": n_nan[nan_i].astype(float),
+        "nan_run_samples": nan_samples[nan_i],
+    }
+    for name in ZONE_METRICS:
+        out[name] = zone[name][cap_i, snap_i]
+    for name in DATA_METRICS[1:] + ZONE_METRICS:
+        out[name] = np.where(skip, np.nan, out[name])
+    return out
+
+
+def sweep_jobs(jobs, subject_bounds, grid: Sweep_Grid, hr_cache=None):
+    """
+    (File_Job, sweep_recording metrics) for each job of a util.pipeline job
+    stream whose file has a week. `subject_bounds(subject)` gives the
+    subject's bounds for every snap_to of the grid. Files are screened and
+    parsed (through `hr_cache`) once, whatever the grid.
+    """
+    for job in jobs:
+        window = job.window
+        if window is None and _get_week_from_path(job.file, warn=False) is not None:
+            window = screen_recording(job.file, job.data)
+        rec, week = extract_recording(job.file, cache=hr_cache, data=job.data, stat=job.stat)
+        job.data = None
+        if rec is None or week is None:
+            log.warning("Skipping file with unparseable week: %s", job.file)
+            continue
+        screen_s = window[2].total_seconds() if window is not None else None
+        supervised = job.group.lower().startswith("super")
+        yield job, sweep_recording(rec, week, supervised, subject_bounds(job.subject), grid, screen_s)
+
+
+def _sweep_frame(points: pd.DataFrame, chunks: list[tuple]) -> pd.DataFrame:
+    """sweep_out.csv rows of (head, metrics) chunks, one per session: head and grid `points` broadcast over the metrics."""
+    n = len(points)
+    heads = [head for head, _ in chunks]
+    df = pd.DataFrame({
+        name: np.repeat(np.array([head[k] for head in heads], dtype=object), n)
+        for k, name in enumerate(META_COLUMNS)
+    })
+    for name in PARAMS:
+        df[name] = np.tile(points[name].to_numpy(), len(chunks))
+    for name in DATA_METRICS + ZONE_METRICS:
+        df[name] = np.concatenate([metrics[name] for _, metrics in chunks])
+    for col in _COUNT_COLUMNS:
+        df[col] = pd.array(df[col].to_numpy(dtype=float), dtype="Int64")
+    df["bounded_met"] = df["bounded_met"].astype(float).astype("boolean")
+    return df
+
+
+class Sweep_Writer:
+    """
+    sweep_out.csv (one row per session and parameter set, sorted like
+    zone_out.csv with parameter sets in grid order) and a per-group
+    summary of each parameter set, accumulated as sessions are added.
+    """
+
+    def __init__(self, out_path, summary_path, grid: Sweep_Grid, catalog=None, spill_rows: int = 200_000):
+        self.grid = grid
+        self.summary_path = summary_path
+        self.parse_meta = catalog.meta if catalog is not None else parse_path
+        self._points = grid.points()
+        # one chunk per session: its metrics over the whole grid
+        self.rows = Sorted_CSV(
+            out_path, SWEEP_COLUMNS, partial(_sweep_frame, pd.DataFrame(self._points, columns=list(PARAMS))),
+            spill_rows, size=lambda chunk: len(self._points),
+        )
+        self._rank = {}   # subject -> order of first appearance
+        self._totals = {}  # group -> {summary column: per-parameter-set sums}
+
+    def add(self, seq: int, subject: str, file: str, metrics: dict) -> None:
+        """Add the sweep_recording metrics of the `seq`-th task, whose subject directory is `subject`."""
+        rank = self._rank.setdefault(subject, len(self._rank))
+        meta = file_meta(self.parse_meta, file, subject)
+        head = (meta["group"], meta["subject"], meta["week"], meta["session"])
+        key = tuple(_na_last(v) for v in head) + (rank, seq)
+        self.rows.add(key, (head, {name: metrics[name] for name in DATA_METRICS + ZONE_METRICS}))
+        self._count(meta["group"], metrics)
+
+    def _count(self, group, metrics: dict) -> None:
+        totals = self._totals.get(group)
+        if totals is None:
+            names = SUMMARY_COLUMNS[len(PARAMS) + 1:] + [f"n_{name}" for name in _MEAN_METRICS]
+            totals = self._totals[group] = {name: np.zeros(len(self._points)) for name in names}
+        error = metrics["data_error"]
+        totals["n_sessions"] += 1
+        totals["n_ignored"] += error == "duration"
+        totals["n_missing"] += error == "missing"
+        totals["n_nan"] += error == "nan"
+        totals["n_zone_rows"] += ~np.isnan(metrics["time_in_allowed_s"])
+        totals["n_bounded_met"] += metrics["bounded_met"] == 1
+        # means are over the sessions that have the metric
+        for name in _MEAN_METRICS:
+            totals[f"mean_{name}"] += np.nan_to_num(metrics[name])
+            totals[f"n_{name}"] += ~np.isnan(metrics[name])
+
+    def close(self) -> int:
+        """Write both CSVs; returns the number of sweep_out.csv rows."""
+        n_rows = self.rows.close()
+        log.info("Sweep written: %s (%d rows)", self.rows.out_csv, n_rows)
+
+        frames = []
+        for group in sorted(self._totals, key=_na_last):
+            totals = self._totals[group]
+            df = pd.DataFrame(self._points, columns=list(PARAMS))
+            df.insert(0, "group", group)
+            for name in SUMMARY_COLUMNS[len(PARAMS) + 1:]:
+                if name.startswith("mean_"):
+                    counts = totals[f"n_{name[5:]}"]
+                    df[name] = np.divide(totals[name], counts, out=np.full(len(df), np.nan), where=counts > 0)
+                else:
+                    df[name] = totals[name].astype(np.int64)
+            frames.append(df)
+        summary = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=SUMMARY_COLUMNS)
+        summary.to_csv(self.summary_path, index=False)
+        log.info("Sweep summary written: %s (%d rows)", self.summary_path, len(summary))
+        return n_rows
@@ -0,0 +1,408 @@
+import numpy as np
+
+
+def sample_durations(t: np.ndarray) -> np.ndarray:
+    """
+    Per-sample durations (seconds) using the next-sample delta; the last
+    sample uses the median delta (0 for a single sample).
+    """
+    d = np.empty(len(t), dtype=float)
+    if len(t) == 0:
+        return d
+    d[:-1] = np.diff(t)
+    d[-1] = np.median(d[:-1]) if len(t) > 1 else 0.0
+    return np.clip(d, 0, None)
+
+
+def truncate_to_seconds(t: np.ndarray, hr: np.ndarray, max_seconds: float):
+    """
+    Keep the samples that start within the first `max_seconds` of the
+    recording. When the last kept sample runs past the cap, a copy of it is
+    appended at exactly the cap so the window adds up to `max_seconds`.
+    """
+    d = sample_durations(t)
+    cum_end = np.cumsum(d)
+    start_offset = cum_end - d
+    in_window = start_offset < max_seconds
+    if not in_window.any():
+        return t[:0], hr[:0]
+
+    last = np.flatnonzero(in_window)[-1]
+    t_cap, hr_cap = t[in_window], hr[in_window]
+    if cum_end[last] > max_seconds:
+        remaining = max_seconds - start_offset[last]
+        if remaining > 0:
+            t_cap = np.append(t_cap, t[last] + remaining)
+            hr_cap = np.append(hr_cap, hr[last])
+    return t_cap, hr_cap
+
+
+def capped_weights(d: np.ndarray, max_seconds: float) -> np.ndarray:
+    """Durations clipped so that only the first `max_seconds` carry weight."""
+    cum_end = np.cumsum(d)
+    w = np.where((cum_end - d) < max_seconds, d, 0.0)
+    overflow = np.flatnonzero(cum_end > max_seconds)
+    if len(overflow):
+        first = overflow[0]
+        remaining = max(max_seconds - (cum_end[first] - d[first]), 0)
+        w[first] = min(w[first], remaining)
+    return w
+
+
+def bucket_zones(hr: np.ndarray, zone_bounds: dict, allowed_zones: list):
+    """
+    Returns (zone_idx, in_allowed).
+
+    zone_idx is z for start <= hr <= end, 0 below the lowest start, max(z) + 1
+    above the highest end and NaN otherwise (missing hr, or an hr that falls
+    between two zones). in_allowed marks samples inside any allowed zone.
+
+    Ordered, non-overlapping bounds (what midpoint_snap produces) are bucketed
+    with a single searchsorted; anything else falls back to one pass per zone
+    where the higher zone wins, as before.
+    """
+    zones = sorted(zone_bounds)
+    ids = np.array(zones, dtype=float)
+    starts = np.array([zone_bounds[z][0] for z in zones], dtype=float)
+    ends = np.array([zone_bounds[z][1] for z in zones], dtype=float)
+
+    zone_idx = np.full(len(hr), np.nan)
+    if (starts <= ends).all() and (ends[:-1] < starts[1:]).all():
+        k = np.searchsorted(starts, hr, side="right") - 1
+        k_safe = np.clip(k, 0, None)
+        inside = (k >= 0) & (hr <= ends[k_safe])
+        zone_idx[inside] = ids[k_safe[inside]]
+        in_allowed = np.isin(zone_idx, allowed_zones)
+    else:
+        in_allowed = np.zeros(len(hr), dtype=bool)
+        for z, start, end in zip(ids, starts, ends):
+            in_zone = (hr >= start) & (hr <= end)
+            zone_idx[in_zone] = z
+            if z in allowed_zones:
+                in_allowed |= in_zone
+
+    zone_idx[hr < starts.min()] = 0.0
+    zone_idx[hr > ends.max()] = ids.max() + 1
+    return zone_idx, in_allowed
+
+
+def longest_run(mask: np.ndarray, d: np.ndarray) -> float:
+    """Largest summed duration over the runs where `mask` is True."""
+    if not mask.any():
+        return 0.0
+    run_id = np.cumsum(np.r_[True, mask[1:] != mask[:-1]]) - 1
+    sums = np.bincount(run_id, weights=d)
+    run_is_good = mask[np.r_[0, np.flatnonzero(mask[1:] != mask[:-1]) + 1]]
+    return float(sums[run_is_good].max())
+
+
+def _nearest_lower(h: np.ndarray) -> np.ndarray:
+    """Index of the nearest earlier entry with a strictly lower value (-1 if none), by pointer jumping."""
+    left = np.arange(-1, len(h) - 1)
+    todo = np.flatnonzero(h[np.maximum(left, 0)] >= h)
+    todo = todo[left[todo] >= 0]
+    while len(todo):
+        # everything between left[j] and j is >= h[j] >= h[i], so i can skip to left[j]
+        left[todo] = left[left[todo]]
+        prev = left[todo]
+        todo = todo[(prev >= 0) & (h[np.maximum(prev, 0)] >= h[todo])]
+    return left
+
+
+def longest_runs_above(hr: np.ndarray, d: np.ndarray, levels: np.ndarray) -> np.ndarray:
+    """
+    longest_run(hr >= level, d) for each of the ascending `levels` at once.
+
+    The widest window in which a sample is the lowest (bounded by the nearest
+    lower samples on both sides, missing HR counting as lowest) is a bout for
+    every level up to its HR, so the longest bout at a level is the widest
+    such window among the samples at or above it.
+    """
+    # consecutive equal HR never ends a bout; runs of it are merged first
+    same = np.r_[False, hr[1:] == hr[:-1]]
+    h = np.where(np.isnan(hr[~same]), -np.inf, hr[~same])
+    cum = np.r_[0.0, np.cumsum(np.bincount(np.cumsum(~same) - 1, weights=d))]
+    left = _nearest_lower(h)
+    right = len(h) - 1 - _nearest_lower(h[::-1])[::-1]
+    width = cum[right] - cum[left + 1]
+
+    valid = np.isfinite(h)
+    order = np.argsort(h[valid], kind="stable")
+    h_sorted = h[valid][order]
+    widest_above = np.maximum.accumulate(width[valid][order][::-1])[::-1]
+    first = np.searchsorted(h_sorted, levels, side="left")
+    out = np.zeros(len(levels))
+    found = first < len(h_sorted)
+    out[found] = widest_above[first[found]]
+    return out
+
+
+def zone_kernel(
+    t: np.ndarray,
+    hr: np.ndarray,
+    zone_bounds: dict,
+    allowed_zones: list,
+    bounded_min: float,
+    truncate_s: float | None = None,
+    mazd_cap_s: float | None = None,
+) -> dict | None:
+    """
+    All zone metrics for one session from sorted time (seconds) and hr arrays.
+
+    truncate_s drops everything after the first `truncate_s` seconds before any
+    metric is computed (supervised sessions); mazd_cap_s only limits which
+    samples carry weight in the MAZD (unsupervised sessions).
+
+    Returns None when there is no data to score.
+    """
+    if truncate_s is not None:
+        t, hr = truncate_to_seconds(t, hr, truncate_s)
+    if len(t) == 0 or not zone_bounds or not allowed_zones:
+        return None
+
+    d = sample_durations(t)
+    lowest_allowed = min(zone_bounds[z][0] for z in allowed_zones)
+    highest_allowed = max(zone_bounds[z][1] for z in allowed_zones)
+    zone_idx, in_allowed = bucket_zones(hr, zone_bounds, allowed_zones)
+    above = (hr > highest_allowed) & ~in_allowed
+    below = ~(in_allowed | above)
+
+    time_in_allowed = d[in_allowed].sum()
+    time_above = d[above].sum()
+    time_below = d[below].sum()
+
+    # Longest bounded bout without dropping below lowest_allowed
+    longest_bout = longest_run(hr >= lowest_allowed, d)
+
+    # MAZD: distance of each sample's zone to the nearest allowed zone
+    w = capped_weights(d, mazd_cap_s) if mazd_cap_s is not None else d
+    valid = ~np.isnan(zone_idx)
+    total_time = w[valid].sum()
+    if total_time <= 0:
+        mazd = None
+    else:
+        targets = np.asarray(allowed_zones, dtype=float)
+        deviation = np.abs(zone_idx[valid, None] - targets[None, :]).min(axis=1)
+        mazd = float((deviation * w[valid]).sum() / total_time)
+
+    return {
+        "time_in_allowed_s": float(time_in_allowed),
+        "time_above_s": float(time_above),
+        "time_below_s": float(time_below),
+        "longest_bounded_bout_s": float(longest_bout),
+        "bounded_met": bool(longest_bout >= bounded_min * 60),
+        "mazd": mazd,
+    }
+
+
+def longest_count(mask: np.ndarray) -> int:
+    """Length of the longest run of True in `mask`."""
+    edges = np.flatnonzero(np.diff(np.r_[False, mask, False].astype(np.int8)))
+    return int((edges[1::2] - edges[::2]).max()) if len(edges) else 0
+
+
+def dense_zone_kernel(
+    hr: np.ndarray,
+    zone_bounds: dict,
+    allowed_zones: list,
+    bounded_min: float,
+    truncate_s: int | None = None,
+    mazd_cap_s: int | None = None,
+) -> dict | None:
+    """
+    zone_kernel for a recording on an exact 1 s cadence, given only its hr
+    (Recording.regular). Every sample lasts one second, so times are counts,
+    the bounded bout is a run length and both caps are slices; the caps must
+    be whole seconds. Returns exactly what zone_kernel returns for the same
+    samples.
+    """
+    if truncate_s is not None:
+        hr = hr[:truncate_s]
+    if len(hr) == 0 or not zone_bounds or not allowed_zones:
+        return None
+    # a lone sample has no duration, as in sample_durations
+    unit = 1.0 if len(hr) > 1 else 0.0
+
+    lowest_allowed = min(zone_bounds[z][0] for z in allowed_zones)
+    highest_allowed = max(zone_bounds[z][1] for z in allowed_zones)
+    zone_idx, in_allowed = bucket_zones(hr, zone_bounds, allowed_zones)
+    n_in = np.count_nonzero(in_allowed)
+    n_above = np.count_nonzero((hr > highest_allowed) & ~in_allowed)
+    longest_bout = longest_count(hr >= lowest_allowed) * unit
+
+    window = zone_idx[:mazd_cap_s] if mazd_cap_s is not None else zone_idx
+    window = window[~np.isnan(window)]
+    if len(window) == 0 or unit == 0:
+        mazd = None
+    else:
+        targets = np.asarray(allowed_zones, dtype=float)
+        mazd = float(np.abs(window[:, None] - targets[None, :]).min(axis=1).sum() / len(window))
+
+    return {
+        "time_in_allowed_s": float(n_in * unit),
+        "time_above_s": float(n_above * unit),
+        "time_below_s": float((len(hr) - n_in - n_above) * unit),
+        "longest_bounded_bout_s": float(longest_bout),
+        "bounded_met": bool(longest_bout >= bounded_min * 60),
+        "mazd": mazd,
+    }
+
+
+class Zone_Stats:
+    """
+    What zone_kernel needs from one session, independent of the zone bounds
+    and weekly plan.
+
+    HR is integer bpm, so time in/above/below any zones and the MAZD depend
+    only on the seconds spent at each bpm value, and the longest bounded bout
+    only on the zone floor. `levels` are the distinct bpm values (ascending),
+    `seconds` the time at each (after the supervised 45-minute truncation),
+    `mazd_seconds` the same with the unsupervised MAZD cap applied and
+    `nan_seconds` the time with no HR. `bout_s[i]` is the longest run of
+    samples with hr >= levels[i]. A session's stats are ~1-2 KB and score()
+    reproduces zone_kernel for any bounds, allowed zones and bounded_min.
+    """
+
+    __slots__ = ("week", "supervised", "cap_s", "levels", "seconds", "mazd_seconds", "nan_seconds", "bout_s")
+
+    def __init__(self, week, supervised, cap_s, levels, seconds, mazd_seconds, nan_seconds, bout_s):
+        self.week = week
+        self.supervised = supervised
+        self.cap_s = cap_s
+        self.levels = levels
+        self.seconds = seconds
+        self.mazd_seconds = mazd_seconds
+        self.nan_seconds = nan_seconds
+        self.bout_s = bout_s
+
+    @classmethod
+    def from_arrays(cls, t: np.ndarray, hr: np.ndarray, week, supervised: bool, cap_s: float) -> "Zone_Stats | None":
+        """
+        Stats of sorted time (seconds) and hr arrays, with the same
+        truncation (supervised) or MAZD cap (unsupervised) zone_kernel
+        applies; None when there is nothing to score.
+        """
+        if supervised:
+            t, hr = truncate_to_seconds(t, hr, cap_s)
+        if len(t) == 0:
+            return None
+        d = sample_durations(t)
+        w = d if supervised else capped_weights(d, cap_s)
+
+        valid = ~np.isnan(hr)
+        levels, inverse = np.unique(hr[valid], return_inverse=True)
+        seconds = np.bincount(inverse, weights=d[valid], minlength=len(levels))
+        mazd_seconds = seconds if supervised else np.bincount(inverse, weights=w[valid], minlength=len(levels))
+        bout_s = longest_runs_above(hr, d, levels)
+        return cls(
+            week, supervised, cap_s, levels, seconds, mazd_seconds,
+            float(d[~valid].sum()), bout_s,
+        )
+
+    @classmethod
+    def from_dense(cls, hr: np.ndarray, week, supervised: bool, cap_s: int) -> "Zone_Stats | None":
+        """from_arrays for a recording on an exact 1 s cadence, given only its hr; `cap_s` in whole seconds."""
+        if supervised:
+            hr = hr[:cap_s]
+        if len(hr) == 0:
+            return None
+        unit = 1.0 if len(hr) > 1 else 0.0
+
+        valid = ~np.isnan(hr)
+        levels, inverse = np.unique(hr[valid], return_inverse=True)
+        seconds = np.bincount(inverse, minlength=len(levels)) * unit
+        if supervised:
+            mazd_seconds = seconds
+        else:
+            in_cap = np.flatnonzero(valid) < cap_s
+            mazd_seconds = np.bincount(inverse[in_cap], minlength=len(levels)) * unit
+        bout_s = longest_runs_above(hr, np.full(len(hr), unit), levels)
+        return cls(
+            week, supervised, cap_s, levels, seconds, mazd_seconds,
+            float((len(hr) - len(inverse)) * unit), bout_s,
+        )
+
+    def score(self, zone_bounds: dict, allowed_zones: list, bounded_min: float) -> dict | None:
+        """zone_kernel's metrics for these bounds and plan."""
+        if not zone_bounds or not allowed_zones:
+            return None
+        lowest_allowed = min(zone_bounds[z][0] for z in allowed_zones)
+        highest_allowed = max(zone_bounds[z][1] for z in allowed_zones)
+        zone_idx, in_allowed = bucket_zones(self.levels, zone_bounds, allowed_zones)
+        above = (self.levels > highest_allowed) & ~in_allowed
+
+        time_in_allowed = self.seconds[in_allowed].sum()
+        time_above = self.seconds[above].sum()
+        # missing HR and HR between two zones count as below, as in zone_kernel
+        time_below = self.seconds[~(in_allowed | above)].sum() + self.nan_seconds
+
+        first = np.searchsorted(self.levels, lowest_allowed, side="left")
+        longest_bout = self.bout_s[first] if first < len(self.levels) else 0.0
+
+        valid = ~np.isnan(zone_idx)
+        total_time = self.mazd_seconds[valid].sum()
+        if total_time <= 0:
+            mazd = None
+        else:
+            targets = np.asarray(allowed_zones, dtype=float)
+            deviation = np.abs(zone_idx[valid, None] - targets[None, :]).min(axis=1)
+            mazd = float((deviation * self.mazd_seconds[valid]).sum() / total_time)
+
+        return {
+            "time_in_allowed_s": float(time_in_allowed),
+            "time_above_s": float(time_above),
+            "time_below_s": float(time_below),
+            "longest_bounded_bout_s": float(longest_bout),
+            "bounded_met": bool(longest_bout >= bounded_min * 60),
+            "mazd": mazd,
+        }
+
+    def score_bounds(self, bounds: np.ndarray, allowed_zones: list, bounded_min: float) -> dict:
+        """
+        score() for many sets of zone bounds at once: `bounds` is (K, n_zones,
+        2) [start, end] per zone (zones numbered from 1), e.g. one subject's
+        bounds under several snap_to values. Returns each metric as a length-K
+        array, with NaN where score() gives None.
+        """
+        bounds = np.asarray(bounds, dtype=float)
+        n_zones = bounds.shape[1]
+        ids = np.arange(1, n_zones + 1, dtype=float)
+        allowed = np.isin(ids, allowed_zones)
+        starts, ends = bounds[:, :, 0], bounds[:, :, 1]
+        h = self.levels
+
+        # (K, zone, level); where zones overlap the higher one wins, as in bucket_zones
+        inside = (starts[:, :, None] <= h) & (h <= ends[:, :, None])
+        top = n_zones - 1 - np.argmax(inside[:, ::-1, :], axis=1)
+        zone_idx = np.where(inside.any(axis=1), ids[top], np.nan)
+        zone_idx = np.where(h < starts.min(axis=1)[:, None], 0.0, zone_idx)
+        zone_idx = np.where(h > ends.max(axis=1)[:, None], ids.max() + 1, zone_idx)
+        in_allowed = inside[:, allowed, :].any(axis=1)
+        above = (h > ends[:, allowed].max(axis=1)[:, None]) & ~in_allowed
+
+        time_in_allowed = np.where(in_allowed, self.seconds, 0.0).sum(axis=1)
+        time_above = np.where(above, self.seconds, 0.0).sum(axis=1)
+        time_below = np.where(in_allowed | above, 0.0, self.seconds).sum(axis=1) + self.nan_seconds
+
+        longest_bout = np.zeros(len(bounds))
+        first = np.searchsorted(h, starts[:, allowed].min(axis=1), side="left")
+        found = first < len(h)
+        longest_bout[found] = self.bout_s[first[found]]
+
+        valid = ~np.isnan(zone_idx)
+        w = np.where(valid, self.mazd_seconds, 0.0)
+        total_time = w.sum(axis=1)
+        targets = np.asarray(allowed_zones, dtype=float)
+        deviation = np.abs(zone_idx[:, :, None] - targets).min(axis=2)
+        weighted = np.where(valid, deviation * w, 0.0).sum(axis=1)
+        mazd = np.full(len(bounds), np.nan)
+        np.divide(weighted, total_time, out=mazd, where=total_time > 0)
+
+        return {
+            "time_in_allowed_s": time_in_allowed,
+            "time_above_s": time_above,
+            "time_below_s": time_below,
+            "longest_bounded_bout_s": longest_bout,
+            "bounded_met": longest_bout >= bounded_min * 60,
+            "mazd": mazd,
+        }
@@ -1,18 +1,117 @@
 import logging
 
-import pandas as pd
+import numpy as np
+
+from qc.zone.kernel import Zone_Stats, dense_zone_kernel, zone_kernel
+from util.hr.recording import Recording
 
 logging = logging.getLogger(__name__)
 
+# sessions are scored on (supervised) or MAZD-capped to (unsupervised) this many minutes
+MAX_SESSION_MIN = 45
+
+# supervised weeks and their expected zones
+SUPERVISED_PLAN = {
+    1: {
+        "zones": [1, 2, 3],
+        "warmup_min": 5,
+        "bounded_min": 15,
+        "unbounded_min": 15,
+        "cooldown_min": 5,
+    },
+    2: {
+        "zones": [1, 2, 3],
+        "warmup_min": 5,
+        "bounded_min": 20,
+        "unbounded_min": 10,
+        "cooldown_min": 5,
+    },
+    3: {
+        "zones": [2, 3],
+        "warmup_min": 5,
+        "bounded_min": 25,
+        "unbounded_min": 5,
+        "cooldown_min": 5,
+    },
+    4: {
+        "zones": [2, 3, 4],
+        "warmup_min": 5,
+        "bounded_min": 30,
+        "unbounded_min": 0,
+        "cooldown_min": 5,
+    },
+    5: {
+        "zones": [3, 4],
+        "warmup_min": 5,
+        "bounded_min": 30,
+        "unbounded_min": 0,
+        "cooldown_min": 5,
+    },
+    6: {
+        "zones": [3, 4],
+        "warmup_min": 5,
+        "bounded_min": 30,
+        "unbounded_min": 0,
+        "cooldown_min": 5,
+    },
+}
+
+# unsupervised (home) weeks and their expected zones
+UNSUPERVISED_PLAN = {
+    7: {
+        "zones": [3, 4],
+        "warmup_min": 5,
+        "bounded_min": 30,
+        "unbounded_min": 0,
+        "cooldown_min": 5,
+    },
+    8: {
+        "zones": [3, 4],
+        "warmup_min": 5,
+        "bounded_min": 30,
+        "unbounded_min": 0,
+        "cooldown_min": 5,
+    },
+    9: {
+        "zones": [3, 4],
+        "warmup_min": 5,
+        "bounded_min": 30,
+        "unbounded_min": 0,
+        "cooldown_min": 5,
+    },
+    10: {
+        "zones": [3, 4, 5],
+        "warmup_min": 5,
+        "bounded_min": 30,
+        "unbounded_min": 0,
+        "cooldown_min": 5,
+    },
+    11: {
+        "zones": [4, 5],
+        "warmup_min": 5,
+        "bounded_min": 30,
+        "unbounded_min": 0,
+        "cooldown_min": 5,
+    },
+    12: {
+        "zones": [4, 5],
+        "warmup_min": 5,
+        "bounded_min": 30,
+        "unbounded_min": 0,
+        "cooldown_min": 5,
+    },
+}
+
 
 class QC_Zone:
 
     def __init__(self, hr, zones, week):
-        self.hr = hr
+        self.hr = Recording.coerce(hr) if hr is not None else None
         self.zones = zones
         self.week = int(week)
         self.err = {}
         self.zone_metrics = None
+        self.zone_stats = None
         self._is_supervised = False
 
     def supervised(self):
@@ -20,109 +119,19 @@ class QC_Zone:
         Run the supervised zone QC
         """
         self._is_supervised = True
-        # These define the weeks and their expected zones
-        zone_info = {
-            1: {
-                "zones": [1, 2, 3],
-                "warmup_min": 5,
-                "bounded_min": 15,
-                "unbounded_min": 15,
-                "cooldown_min": 5,
-            },
-            2: {
-                "zones": [1, 2, 3],
-                "warmup_min": 5,
-                "bounded_min": 20,
-                "unbounded_min": 10,
-                "cooldown_min": 5,
-            },
-            3: {
-                "zones": [2, 3],
-                "warmup_min": 5,
-                "bounded_min": 25,
-                "unbounded_min": 5,
-                "cooldown_min": 5,
-            },
-            4: {
-                "zones": [2, 3, 4],
-                "warmup_min": 5,
-                "bounded_min": 30,
-                "unbounded_min": 0,
-                "cooldown_min": 5,
-            },
-            5: {
-                "zones": [3, 4],
-                "warmup_min": 5,
-                "bounded_min": 30,
-                "unbounded_min": 0,
-                "cooldown_min": 5,
-            },
-            6: {
-                "zones": [3, 4],
-                "warmup_min": 5,
-                "bounded_min": 30,
-                "unbounded_min": 0,
-                "cooldown_min": 5,
-            },
-        }
-
-        weekly_plan = zone_info.get(self.week)
+        self.zone_stats = self._zone_stats()
+        weekly_plan = SUPERVISED_PLAN.get(self.week)
         if weekly_plan is None:
             self.err["zone_summary"] = [f"no supervised plan for week {self.week}", None]
             return None
 
-        self._cap_hr_to_minutes(45)
         return self._run_zone_qc(weekly_plan)
 
     def unsupervised(self):
         self._is_supervised = False
+        self.zone_stats = self._zone_stats()
 
-        training_plan = {
-            7: {
-                "zones": [3, 4],
-                "warmup_min": 5,
-                "bounded_min": 30,
-                "unbounded_min": 0,
-                "cooldown_min": 5,
-            },
-            8: {
-                "zones": [3, 4],
-                "warmup_min": 5,
-                "bounded_min": 30,
-                "unbounded_min": 0,
-                "cooldown_min": 5,
-            },
-            9: {
-                "zones": [3, 4],
-                "warmup_min": 5,
-                "bounded_min": 30,
-                "unbounded_min": 0,
-                "cooldown_min": 5,
-            },
-            10: {
-                "zones": [3, 4, 5],
-                "warmup_min": 5,
-                "bounded_min": 30,
-                "unbounded_min": 0,
-                "cooldown_min": 5,
-            },
-            11: {
-                "zones": [4, 5],
-                "warmup_min": 5,
-                "bounded_min": 30,
-                "unbounded_min": 0,
-                "cooldown_min": 5,
-            },
-            12: {
-                "zones": [4, 5],
-                "warmup_min": 5,
-                "bounded_min": 30,
-                "unbounded_min": 0,
-                "cooldown_min": 5,
-            },
-        }
-
-        weekly_plan = training_plan.get(self.week)
+        weekly_plan = UNSUPERVISED_PLAN.get(self.week)
         if weekly_plan is None:
             self.err["zone_summary"] = [f"no unsupervised plan for week {self.week}", None]
             return None
@@ -152,6 +161,13 @@ class QC_Zone:
            - Boolean flag: True if a single continuous bounded bout meets or
              exceeds weekly_plan["bounded_min"] minutes without dipping below
              that lower bound (going above is acceptable); False otherwise.
+        4. MAZD (Mean Absolute Zone Deviation)
+           - 1/T * ∑ |z_i - z_target|, where z_target is the allowed zone
+             nearest to each sample's zone; quantifies how closely hr stays
+             in the prescribed target zone.
+
+        All of these come from a single zone_kernel() pass over sorted arrays,
+        or dense_zone_kernel() for recordings on an exact 1 s cadence.
 
         Returns a dict of summary metrics and populates self.err with messages.
         """
@@ -162,200 +178,76 @@ class QC_Zone:
             self.err["zone_summary"] = ["hr data missing for zone QC", None]
             return None
 
-        hr_df, hr_vals, deltas, zone_bounds, allowed_zones, lowest_allowed, highest_allowed = ctx
-        category = pd.Series("below", index=hr_df.index)
-        category.loc[hr_vals > highest_allowed] = "above"
-        for z in allowed_zones:
-            start, end = zone_bounds[z]
-            in_zone = hr_vals.between(start, end, inclusive="both")
-            category.loc[in_zone] = f"z{z}"
-
-        # Aggregate durations
-        durations = deltas
-        time_in_allowed = durations[category.isin([f"z{z}" for z in allowed_zones])].sum()
-        time_above = durations[category == "above"].sum()
-        time_below = durations[category == "below"].sum()
-
-        # Longest bounded bout without dropping below lowest_allowed
-        good_mask = hr_vals >= lowest_allowed
-        run_id = good_mask.ne(good_mask.shift()).cumsum()
-        bout_lengths = (
-            pd.DataFrame({"good": good_mask, "dur": durations, "run": run_id})
-            .groupby("run")
-            .agg(is_good=("good", "first"), duration_s=("dur", "sum"))
-        )
-        good_bouts = bout_lengths.loc[bout_lengths["is_good"], "duration_s"]
-        longest_bout = good_bouts.max() if not good_bouts.empty else 0
-        bounded_met = longest_bout >= weekly_plan["bounded_min"] * 60
-
-        zone_compliance = self._calc_zone_compliance(
-            time_in_allowed,
-            time_above,
-            time_below,
-        )
-        mazd = self._calc_mazd(weekly_plan, apply_cap=not self._is_supervised)
-        self.zone_metrics = {
-            "week": self.week,
-            "time_in_allowed_s": float(time_in_allowed),
-            "time_above_s": float(time_above),
-            "time_below_s": float(time_below),
-            "longest_bounded_bout_s": float(longest_bout),
-            "bounded_met": bool(bounded_met),
-            "zone_compliance": zone_compliance,
-            "mazd": mazd,
-        }
-        summary_msg = (
-            f"time_in_allowed_s={time_in_allowed:.1f}; "
-            f"time_above_s={time_above:.1f}; "
-            f"time_below_s={time_below:.1f}; "
-            f"longest_bounded_bout_s={longest_bout:.1f}; "
-            f"bounded_met={bounded_met}"
-        )
-        self.err["zone_summary"] = [summary_msg, None]
-        if not bounded_met:
-            self.err["bounded_short"] = [
-                "bounded time target not met without dropping below zone floor",
-                None,
-            ]
+        t, hr_vals, zone_bounds = ctx
+        cap_s = MAX_SESSION_MIN * 60
+        # Supervised sessions are scored on their first 45 minutes only;
+        # unsupervised sessions keep all time but cap the MAZD window at 45 minutes.
+        if t is None:
+            cap_s = int(cap_s)
+            metrics = dense_zone_kernel(
+                hr_vals,
+                zone_bounds,
+                weekly_plan["zones"],
+                weekly_plan["bounded_min"],
+                truncate_s=cap_s if self._is_supervised else None,
+                mazd_cap_s=None if self._is_supervised else cap_s,
+            )
+        else:
+            metrics = zone_kernel(
+                t,
+                hr_vals,
+                zone_bounds,
+                weekly_plan["zones"],
+                weekly_plan["bounded_min"],
+                truncate_s=cap_s if self._is_supervised else None,
+                mazd_cap_s=None if self._is_supervised else cap_s,
+            )
+        if metrics is None:
+            self.err["zone_summary"] = ["hr data missing for zone QC", None]
+            return None
 
+        self.zone_metrics, err = zone_report(self.week, metrics)
+        self.err.update(err)
         return self.zone_metrics
 
     def _zone_context(self, weekly_plan: dict):
+        """
+        Sorted (time in seconds, hr) arrays plus the subject's zone bounds, or
+        None when there is nothing to score. The times are None when the
+        1 s fast path applies (see on_grid).
+        """
         if self.hr is None or self.hr.empty:
             return None
 
-        # Ensure time is datetime and ordered
-        hr_df = self.hr.copy()
-        hr_df["time"] = pd.to_datetime(hr_df["time"])
-        hr_df = hr_df.sort_values("time").reset_index(drop=True)
-
-        # Build zone bounds from subject-level zones
-        zone_bounds = {}
-        for i in range(1, 6):
-            start_col = f"z{i}_start"
-            end_col = f"z{i}_end"
-            if start_col in self.zones.columns and end_col in self.zones.columns:
-                zone_bounds[i] = (
-                    int(self.zones[start_col].iat[0]),
-                    int(self.zones[end_col].iat[0]),
-                )
+        zone_bounds = self._zone_bounds()
         if not zone_bounds:
             return None
-
-        allowed_zones = weekly_plan.get("zones") if weekly_plan else None
-        if not allowed_zones:
+        if not (weekly_plan and weekly_plan.get("zones")):
             return None
 
-        lowest_allowed = min(zone_bounds[z][0] for z in allowed_zones)
-        highest_allowed = max(zone_bounds[z][1] for z in allowed_zones)
-
-        # Per-sample durations (seconds) using the next-sample delta; last sample uses median delta
-        time_vals = hr_df["time"]
-        deltas = (time_vals.shift(-1) - time_vals).dt.total_seconds()
-        median_delta = deltas.dropna().median()
-        if pd.isna(median_delta):
-            median_delta = 0
-        deltas = deltas.fillna(median_delta).clip(lower=0)
-
-        hr_vals = hr_df["hr"]
-        return (
-            hr_df,
-            hr_vals,
-            deltas,
-            zone_bounds,
-            allowed_zones,
-            lowest_allowed,
-            highest_allowed,
-        )
-
-    def _cap_hr_to_minutes(self, max_minutes: int):
-        if self.hr is None or self.hr.empty:
-            return
-
-        hr_df = self.hr.copy()
-        hr_df["time"] = pd.to_datetime(hr_df["time"])
-        hr_df = hr_df.sort_values("time").reset_index(drop=True)
-
-        time_vals = hr_df["time"]
-        deltas = (time_vals.shift(-1) - time_vals).dt.total_seconds()
-        median_delta = deltas.dropna().median()
-        if pd.isna(median_delta):
-            median_delta = 0
-        deltas = deltas.fillna(median_delta).clip(lower=0)
-
-        max_seconds = max_minutes * 60
-        cum_end = deltas.cumsum()
-        start_offset = cum_end - deltas
-        in_window = start_offset < max_seconds
-        if not in_window.any():
-            self.hr = hr_df.iloc[:0].copy()
-            return
-
-        capped = hr_df.loc[in_window].copy()
-        last_idx = in_window[in_window].index[-1]
-        if cum_end.at[last_idx] > max_seconds:
-            remaining = max_seconds - start_offset.at[last_idx]
-            if remaining > 0:
-                cap_row = hr_df.loc[[last_idx]].copy()
-                cap_row["time"] = time_vals.at[last_idx] + pd.to_timedelta(remaining, unit="s")
-                capped = pd.concat([capped, cap_row], ignore_index=True)
-
-        self.hr = capped.reset_index(drop=True)
-
-    def _calc_mazd(self, weekly_plan: dict | None = None, apply_cap: bool = True):
-        """
-        Calculate the Mean Absolute Zone Deviation (MAZD):
-        Formula:
-            1/T * ∑ |z_i - z_target|
+        # the Recording is already sorted; only the float copies are new
+        t = None if on_grid(self.hr, MAX_SESSION_MIN * 60) else (self.hr.seconds - self.hr.seconds[0]).astype(float)
+        hr_vals = self.hr.hr.astype(float)
+        return t, hr_vals, zone_bounds
 
-        Purpose:
-            The MAZD quantifies how closely an individual's heart rate
-            during exercise sessions aligns with the prescribed target zone.
+    def _zone_stats(self) -> Zone_Stats | None:
         """
-        ctx = self._zone_context(weekly_plan or getattr(self, "_weekly_plan", None))
-        if ctx is None:
-            return None
-
-        hr_df, hr_vals, deltas, zone_bounds, allowed_zones, _, _ = ctx
-        if apply_cap:
-            max_seconds = 45 * 60
-            cum_end = deltas.cumsum()
-            in_window = (cum_end - deltas) < max_seconds
-            window_deltas = deltas.where(in_window, 0)
-            overflow = cum_end > max_seconds
-            if overflow.any():
-                last_idx = overflow.idxmax()
-                remaining = max_seconds - (cum_end.at[last_idx] - deltas.at[last_idx])
-                if remaining < 0:
-                    remaining = 0
-                window_deltas.at[last_idx] = min(window_deltas.at[last_idx], remaining)
-        else:
-            window_deltas = deltas
-        zone_idx = pd.Series(pd.NA, index=hr_df.index, dtype="Float64")
-        for z, (start, end) in zone_bounds.items():
-            in_zone = hr_vals.between(start, end, inclusive="both")
-            zone_idx.loc[in_zone] = float(z)
-
-        min_start = min(start for start, _ in zone_bounds.values())
-        max_end = max(end for _, end in zone_bounds.values())
-        zone_idx.loc[hr_vals < min_start] = 0.0
-        zone_idx.loc[hr_vals > max_end] = float(max(zone_bounds.keys()) + 1)
-
-        valid = zone_idx.notna()
-        total_time = window_deltas[valid].sum()
-        if total_time <= 0:
+        The session's Zone_Stats, kept with its results so it can be re-scored
+        against new bounds or plans (see rescore) without reading the file again.
+        """
+        if self.hr is None or self.hr.empty:
             return None
+        return session_stats(self.hr, self.week, self._is_supervised, MAX_SESSION_MIN * 60)
 
-        def nearest_allowed(zone_val: float) -> int:
-            return min(allowed_zones, key=lambda target: abs(zone_val - target))
-
-        nearest = zone_idx[valid].apply(nearest_allowed)
-        deviation = (zone_idx[valid] - nearest).abs()
-        mazd = (deviation * window_deltas[valid]).sum() / total_time
-        return float(mazd)
+    def _zone_bounds(self) -> dict:
+        """
+        Build {zone: (start, end)} from subject-level zones, given either as the
+        (5, 2) array from ZoneTable.lookup or the 1-row extract_zones DataFrame.
+        """
+        return zone_bounds(self.zones)
 
+    @staticmethod
     def _calc_zone_compliance(
-        self,
         time_in_allowed_s: float,
         time_above_s: float,
         time_below_s: float,
@@ -372,3 +264,95 @@ class QC_Zone:
         if total_time <= 0:
             return None
         return float(time_in_allowed_s / total_time)
+
+
+def on_grid(rec: Recording, cap_s: float) -> bool:
+    """
+    Whether `rec` can take the 1 s fast path (dense_zone_kernel,
+    Zone_Stats.from_dense) with a session cap of `cap_s`: an exact 1 s
+    cadence and a cap in whole seconds. Both paths give identical results.
+    """
+    return rec.regular and float(cap_s).is_integer()
+
+
+def session_stats(rec: Recording, week, supervised: bool, cap_s: float) -> Zone_Stats | None:
+    """Zone_Stats of a non-empty Recording, through the 1 s fast path when it applies."""
+    hr = rec.hr.astype(float)
+    if on_grid(rec, cap_s):
+        return Zone_Stats.from_dense(hr, week, supervised, int(cap_s))
+    return Zone_Stats.from_arrays((rec.seconds - rec.seconds[0]).astype(float), hr, week, supervised, cap_s)
+
+
+def zone_bounds(zones) -> dict:
+    """{zone: (start, end)} from a ZoneTable.lookup array or an extract_zones row."""
+    bounds = {}
+    if isinstance(zones, np.ndarray):
+        for i, (start, end) in enumerate(zones.tolist(), start=1):
+            bounds[i] = (int(start), int(end))
+        return bounds
+
+    for i in range(1, 6):
+        start_col = f"z{i}_start"
+        end_col = f"z{i}_end"
+        if start_col in zones.columns and end_col in zones.columns:
+            bounds[i] = (
+                int(zones[start_col].iat[0]),
+                int(zones[end_col].iat[0]),
+            )
+    return bounds
+
+
+def zone_report(week: int, metrics: dict) -> tuple[dict, dict]:
+    """
+    The zone_metrics dict and zone err entries for one session, from the
+    zone_kernel metrics (or their streaming equivalent).
+    """
+    time_in_allowed = metrics["time_in_allowed_s"]
+    time_above = metrics["time_above_s"]
+    time_below = metrics["time_below_s"]
+    longest_bout = metrics["longest_bounded_bout_s"]
+    bounded_met = metrics["bounded_met"]
+    zone_metrics = {
+        "week": week,
+        "time_in_allowed_s": time_in_allowed,
+        "time_above_s": time_above,
+        "time_below_s": time_below,
+        "longest_bounded_bout_s": longest_bout,
+        "bounded_met": bounded_met,
+        "zone_compliance": QC_Zone._calc_zone_compliance(time_in_allowed, time_above, time_below),
+        "mazd": metrics["mazd"],
+    }
+    summary_msg = (
+        f"time_in_allowed_s={time_in_allowed:.1f}; "
+        f"time_above_s={time_above:.1f}; "
+        f"time_below_s={time_below:.1f}; "
+        f"longest_bounded_bout_s={longest_bout:.1f}; "
+        f"bounded_met={bounded_met}"
+    )
+    err = {"zone_summary": [summary_msg, None]}
+    if not bounded_met:
+        err["bounded_short"] = [
+            "bounded time target not met without dropping below zone floor",
+            None,
+        ]
+    return zone_metrics, err
+
+
+def rescore(stats: Zone_Stats, zones) -> tuple[dict | None, dict]:
+    """
+    (zone_metrics, err) as QC_Zone.supervised()/unsupervised() would produce
+    them for the session `stats` come from, scored against `zones` (a
+    ZoneTable.lookup array or extract_zones row) and the current weekly plans.
+    """
+    if stats.cap_s != MAX_SESSION_MIN * 60:
+        raise ValueError(f"zone stats were taken with a {stats.cap_s / 60:g}-minute session cap; rerun QC")
+    kind = "supervised" if stats.supervised else "unsupervised"
+    weekly_plan = (SUPERVISED_PLAN if stats.supervised else UNSUPERVISED_PLAN).get(stats.week)
+    if weekly_plan is None:
+        return None, {"zone_summary": [f"no {kind} plan for week {stats.week}", None]}
+
+    bounds = zone_bounds(zones)
+    metrics = stats.score(bounds, weekly_plan.get("zones"), weekly_plan["bounded_min"]) if bounds else None
+    if metrics is None:
+        return None, {"zone_summary": ["hr data missing for zone QC", None]}
+    return zone_report(stats.week, metrics)
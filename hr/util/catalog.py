@@ -0,0 +1,167 @@
+import os
+import re
+import logging
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
+
+GROUPS = ("Supervised", "Unsupervised")
+
+_WK_SES_RE = re.compile(r"_wk(\d+)_ses(\d+(?:\.\d+)?)", re.IGNORECASE)
+_SUBJECT_RE = re.compile(r"sub\d+", re.IGNORECASE)
+
+
+class File_Record(NamedTuple):
+    """One file in a subject directory, with everything consumers derive from it."""
+    path: str
+    group: str            # "Supervised" or "Unsupervised"
+    subject: str          # subject directory name, e.g. "sub8000"
+    week: int | None      # from `_wk##_ses##` in the filename
+    session: str | None   # from `_wk##_ses##`; may carry decimals (e.g. "3.1")
+    size: int
+    mtime_ns: int
+
+    @classmethod
+    def from_path(cls, path: str, stat: tuple[int, int] | None = None) -> "File_Record":
+        """
+        The record Catalog.scan would list for .../<group>/<subject>/<file>,
+        without scanning the tree; the file is stat'ed unless its
+        (size, mtime_ns) is given.
+        """
+        subject_path = os.path.dirname(os.path.abspath(path))
+        week, session = _week_session(os.path.basename(path))
+        if stat is None:
+            st = os.stat(path)
+            stat = (st.st_size, st.st_mtime_ns)
+        return cls(
+            path=path,
+            group=os.path.basename(os.path.dirname(subject_path)),
+            subject=os.path.basename(subject_path),
+            week=week,
+            session=session,
+            size=stat[0],
+            mtime_ns=stat[1],
+        )
+
+    @property
+    def name(self) -> str:
+        return os.path.basename(self.path)
+
+    @property
+    def is_csv(self) -> bool:
+        return self.path.lower().endswith(".csv")
+
+
+def parse_path(file_path: str) -> dict:
+    """Extract group, subject, week, and session from a file path."""
+    group = None
+    if re.search(r"/Supervised/", file_path, re.IGNORECASE):
+        group = "Supervised"
+    elif re.search(r"/Unsupervised/", file_path, re.IGNORECASE):
+        group = "Unsupervised"
+
+    subject = None
+    match_subject = re.search(r"/(sub\d+)/", file_path, re.IGNORECASE)
+    if match_subject:
+        subject = match_subject.group(1).lower()
+
+    week, session = _week_session(os.path.basename(file_path))
+    return {"group": group, "subject": subject, "week": week, "session": session}
+
+
+def _week_session(filename: str) -> tuple[int | None, str | None]:
+    match_ws = _WK_SES_RE.search(filename)
+    if not match_ws:
+        return None, None
+    return int(match_ws.group(1)), match_ws.group(2)
+
+
+def subject_label(subject: str) -> str:
+    """Subject id as written to the output tables ('Sub8000' -> 'sub8000')."""
+    return subject.lower() if _SUBJECT_RE.fullmatch(subject) else subject
+
+
+class Catalog:
+    """
+    Every file under polarhrcsv/{Supervised,Unsupervised}/<subject>/, listed
+    with a single os.scandir pass per directory and one stat per file.
+
+    Records are sorted by group, subject and filename so runs are
+    reproducible regardless of directory listing order. Subject directories
+    without files are kept in `subjects` since adherence counts need them.
+    """
+
+    def __init__(self, records: list[File_Record], subjects: dict[str, list[str]]):
+        self.records = records
+        self._subjects = subjects
+        self._by_path = {r.path: r for r in records}
+        self._by_dir = {}
+        for r in records:
+            self._by_dir.setdefault((r.group, r.subject), []).append(r)
+
+    @classmethod
+    def scan(cls, project_path: str, groups=GROUPS) -> "Catalog":
+        records = []
+        subjects = {}
+        for group in groups:
+            group_path = os.path.join(project_path, group)
+            subjects[group] = []
+            try:
+                with os.scandir(group_path) as it:
+                    subject_dirs = sorted(
+                        (e.name, e.path) for e in it
+                        if not e.name.startswith(".") and e.is_dir()
+                    )
+            except FileNotFoundError:
+                logger.debug("No %s directory under %s", group, project_path)
+                continue
+            for subject, subject_path in subject_dirs:
+                subjects[group].append(subject)
+                with os.scandir(subject_path) as it:
+                    entries = sorted(
+                        (e for e in it if not e.name.startswith(".") and e.is_file()),
+                        key=lambda e: e.name,
+                    )
+                for entry in entries:
+                    st = entry.stat()
+                    week, session = _week_session(entry.name)
+                    records.append(File_Record(
+                        path=entry.path,
+                        group=group,
+                        subject=subject,
+                        week=week,
+                        session=session,
+                        size=st.st_size,
+                        mtime_ns=st.st_mtime_ns,
+                    ))
+        return cls(records, subjects)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def get(self, path: str) -> File_Record | None:
+        return self._by_path.get(path)
+
+    def csvs(self) -> list[File_Record]:
+        return [r for r in self.records if r.is_csv]
+
+    def subjects(self, group: str) -> list[str]:
+        return list(self._subjects.get(group, []))
+
+    def files(self, group: str, subject: str) -> list[File_Record]:
+        return list(self._by_dir.get((group, subject), []))
+
+    def meta(self, path: str) -> dict:
+        """Output-table metadata for `path`, falling back to parsing the path."""
+        record = self._by_path.get(path)
+        if record is None:
+            return parse_path(path)
+        return {
+            "group": record.group,
+            "subject": subject_label(record.subject),
+            "week": record.week,
+            "session": record.session,
+        }
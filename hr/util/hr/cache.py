@@ -0,0 +1,111 @@
+import hashlib
+import logging
+import os
+
+import numpy as np
+
+from util.manifest import file_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# Bump when read_polar_csv output changes so old entries are never served.
+CACHE_FORMAT = 1
+
+
+class HR_Cache:
+    """
+    Local on-disk cache of parsed Polar recordings.
+
+    Each source CSV maps to a pair of .npy files (int32 seconds, float32 hr)
+    named after a hash of the file's path, size and mtime, so an edited or
+    replaced upload gets a new key and stale entries simply age out. Hits are
+    memory-mapped read-only. Last use is tracked through the entries' mtime
+    and evict() drops the least recently used entries until the cache fits in
+    `max_bytes`.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 1 << 30):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def key(self, path: str, stat: tuple | None = None) -> str:
+        """Entry name for `path`; `stat` is an already known (size, mtime_ns), e.g. from the catalog."""
+        size, mtime_ns = stat if stat is not None else file_fingerprint(path)[:2]
+        ident = f"{CACHE_FORMAT}|{os.path.abspath(path)}|{size}|{mtime_ns}"
+        return hashlib.sha1(ident.encode("utf-8")).hexdigest()
+
+    def _paths(self, key: str) -> tuple[str, str]:
+        base = os.path.join(self.cache_dir, key)
+        return base + ".t.npy", base + ".hr.npy"
+
+    def get(self, path: str, stat: tuple | None = None):
+        """Return (seconds, hr) memory-mapped from the cache, or None on a miss; `stat` as for key()."""
+        t_path, hr_path = self._paths(self.key(path, stat))
+        try:
+            seconds = np.load(t_path, mmap_mode="r")
+            hr = np.load(hr_path, mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        if len(seconds) != len(hr):
+            return None
+        for p in (t_path, hr_path):
+            os.utime(p)
+        return seconds, hr
+
+    def has(self, path: str, stat: tuple | None = None) -> bool:
+        """True when `path` has a cache entry (without marking it used); `stat` as for key()."""
+        return all(os.path.exists(p) for p in self._paths(self.key(path, stat)))
+
+    def put(self, path: str, seconds: np.ndarray, hr: np.ndarray, stat: tuple | None = None) -> None:
+        t_path, hr_path = self._paths(self.key(path, stat))
+        for target, arr in ((t_path, seconds.astype(np.int32)), (hr_path, hr.astype(np.float32))):
+            tmp = f"{target}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as fh:
+                np.save(fh, arr)
+            os.replace(tmp, target)
+
+    def read(self, path: str, reader, stat: tuple | None = None):
+        """
+        (seconds, hr) for `path`, calling `reader(path)` and storing the
+        result on a miss; `stat` as for key(), otherwise the file is stat'ed
+        once for both the lookup and the store.
+        """
+        if stat is None:
+            stat = file_fingerprint(path)[:2]
+        hit = self.get(path, stat)
+        if hit is not None:
+            return hit
+        seconds, hr = reader(path)
+        try:
+            self.put(path, seconds, hr, stat)
+        except OSError as exc:
+            logger.warning("Could not cache %s: %s", path, exc)
+        return seconds, hr
+
+    def evict(self) -> int:
+        """Remove least recently used entries until the cache fits; returns bytes freed."""
+        entries = {}  # key -> [last_used_ns, size, paths]
+        total = 0
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith(".npy") and entry.is_file():
+                    st = entry.stat()
+                    e = entries.setdefault(entry.name.split(".", 1)[0], [0, 0, []])
+                    e[0] = max(e[0], st.st_mtime_ns)
+                    e[1] += st.st_size
+                    e[2].append(entry.path)
+                    total += st.st_size
+        freed = 0
+        for _, size, paths in sorted(entries.values()):
+            if total - freed <= self.max_bytes:
+                break
+            for p in paths:
+                try:
+                    os.remove(p)
+                except FileNotFoundError:
+                    pass
+            freed += size
+        if freed:
+            logger.info("HR cache: evicted %.1f MB from %s", freed / 2**20, self.cache_dir)
+        return freed
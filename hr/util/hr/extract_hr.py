@@ -1,12 +1,16 @@
+import io
 import logging
 import os
 import re
+import numpy as np
 import pandas as pd
 
+from util.hr.recording import CLOCK_BASE, SECONDS_PER_DAY, Recording
+
 logger = logging.getLogger(__name__)
 
 
-def _get_week_from_path(path: str) -> int | None:
+def _get_week_from_path(path: str, warn: bool = True) -> int | None:
     """
     Extract the week number from a filename pattern containing `_wkXX`.
     Returns None if no week segment can be found, allowing caller to skip.
@@ -14,12 +18,166 @@ def _get_week_from_path(path: str) -> int | None:
     filename = os.path.basename(str(path))
     match = re.search(r"_wk(\d+)", filename, re.IGNORECASE)
     if not match:
-        logger.warning("Could not parse week from filename: %s; skipping", filename)
+        if warn:
+            logger.warning("Could not parse week from filename: %s; skipping", filename)
         return None
     return int(match.group(1))
 
 
-def extract_hr(file):
+# extract_hr keeps the historical 1900-01-01 clock-time representation
+_CLOCK_BASE = CLOCK_BASE
+_SECONDS_PER_DAY = SECONDS_PER_DAY
+
+
+def _hms_to_seconds(times: pd.Series) -> np.ndarray:
+    """
+    Convert HH:MM:SS strings to integer seconds without a string round-trip.
+
+    The common case (every value exactly 'HH:MM:SS') is decoded straight from
+    the ASCII bytes; anything else (longer hour fields, stray whitespace) goes
+    through a numeric split. Hours >= 24 are kept as-is, so a value like
+    '24:00:05' maps to 86405.
+    """
+    raw = times.to_numpy(dtype=object)
+    if len(raw) == 0:
+        return np.zeros(0, dtype=np.int64)
+    try:
+        b = raw.astype("S")
+    except (UnicodeEncodeError, TypeError, ValueError):
+        b = None
+    # itemsize is the longest value; shorter ones are NUL-padded and fail the checks
+    if b is not None and b.dtype.itemsize == 8:
+        u8 = b.view(np.uint8).reshape(-1, 8)
+        colons = (u8[:, 2] == ord(":")) & (u8[:, 5] == ord(":"))
+        digits = u8[:, [0, 1, 3, 4, 6, 7]] - ord("0")
+        if colons.all() and (digits <= 9).all():
+            digits = digits.astype(np.int64)
+            hours = digits[:, 0] * 10 + digits[:, 1]
+            minutes = digits[:, 2] * 10 + digits[:, 3]
+            seconds = digits[:, 4] * 10 + digits[:, 5]
+            return _check_hms(hours, minutes, seconds)
+
+    parts = times.astype(str).str.strip().str.split(":", n=2, expand=True)
+    if parts.shape[1] < 3:
+        raise ValueError("time values are not HH:MM:SS")
+    hms = parts.apply(pd.to_numeric, errors="coerce")
+    if hms.isna().any().any():
+        raise ValueError("time values are not HH:MM:SS")
+    hms = hms.to_numpy(dtype=np.int64)
+    return _check_hms(hms[:, 0], hms[:, 1], hms[:, 2])
+
+
+def _check_hms(hours, minutes, seconds) -> np.ndarray:
+    if (minutes >= 60).any() or (seconds >= 60).any():
+        raise ValueError("time values have minutes or seconds >= 60")
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def read_polar_csv(path, data: bytes | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Read a Polar export and return (seconds, hr).
+
+    Only the Time and HR (bpm) columns are loaded, from a memory-mapped file
+    (or `data`, the file's content when it was already read) with fixed
+    dtypes. `seconds` is an int64 array of the HH:MM:SS values (hours >= 24
+    included, not wrapped) and `hr` is float32 with NaN for missing samples.
+    """
+    df = pd.read_csv(
+        io.BytesIO(data) if data is not None else path,
+        skiprows=2,
+        usecols=["Time", "HR (bpm)"],
+        dtype={"Time": str, "HR (bpm)": np.float32},
+        memory_map=data is None,
+    )
+    try:
+        seconds = _hms_to_seconds(df["Time"])
+    except ValueError as exc:
+        raise ValueError(f"Could not parse Time column in {path}: {exc}") from exc
+    return seconds, df["HR (bpm)"].to_numpy()
+
+
+_TAIL_BYTES = 4096
+
+
+def _parse_hms(value) -> int | None:
+    """'HH:MM:SS' (hours may exceed 23) to seconds, or None."""
+    parts = str(value).strip().split(":")
+    if len(parts) != 3:
+        return None
+    try:
+        h, m, sec = (int(p) for p in parts)
+    except ValueError:
+        return None
+    if h < 0 or not (0 <= m < 60 and 0 <= sec < 60):
+        return None
+    return h * 3600 + m * 60 + sec
+
+
+def _last_line(fh, size: int, data_start: int) -> bytes | None:
+    """Last non-empty line at or after `data_start`, read with one seek from the end."""
+    block_start = max(data_start, size - _TAIL_BYTES)
+    fh.seek(block_start)
+    lines = [ln for ln in fh.read().splitlines() if ln.strip()]
+    # the first line of the block may be cut off, unless the block starts the data
+    if block_start > data_start:
+        lines = lines[1:]
+    return lines[-1] if lines else None
+
+
+def screen_recording(path, data: bytes | None = None):
+    """
+    Recording window of a Polar export read without parsing its samples.
+
+    Returns (start_time, end_time, duration) in the same form as
+    recording_window, or None when the file cannot be screened. The window
+    comes from the Time of the first and last sample lines (the first read
+    together with the header, the last with a single seek from the end of the
+    file); when the last line is unusable the header's Duration field is used
+    instead. Time is elapsed since the session start, so the span between the
+    two lines is the recording length. `data` is the file's content when it
+    has already been read (see util/prefetch.py).
+    """
+    try:
+        with (io.BytesIO(data) if data is not None else open(path, "rb")) as fh:
+            head = [fh.readline() for _ in range(4)]
+            if not head[3].strip():
+                return None
+            data_start = sum(len(ln) for ln in head[:3])
+            size = fh.seek(0, os.SEEK_END)
+            tail = _last_line(fh, size, data_start)
+    except OSError:
+        return None
+
+    try:
+        summary = dict(zip(
+            head[0].decode("utf-8-sig").strip().split(","),
+            head[1].decode("utf-8").strip().split(","),
+        ))
+        time_col = head[2].decode("utf-8").strip().split(",").index("Time")
+        first = _parse_hms(head[3].decode("utf-8").split(",")[time_col])
+    except (UnicodeDecodeError, ValueError, IndexError):
+        return None
+    if first is None:
+        return None
+
+    last = None
+    if tail is not None:
+        fields = tail.decode("utf-8", errors="replace").split(",")
+        if len(fields) > time_col:
+            last = _parse_hms(fields[time_col])
+    if last is None or last < first:
+        header_duration = _parse_hms(summary.get("Duration", ""))
+        if header_duration is None:
+            return None
+        last = first + header_duration
+
+    start_time = pd.Timestamp(_CLOCK_BASE + np.timedelta64(first % _SECONDS_PER_DAY, "s"))
+    duration = pd.Timedelta(seconds=last - first)
+    return start_time, start_time + duration, duration
+
+
+def _read_first_week_csv(file, cache=None, data: bytes | None = None, stat: tuple | None = None):
+    """(path, seconds, hr, week) for the first CSV in `file` whose name carries a week, or None."""
     if not file:
         raise ValueError("File must be a non-empty path or list of paths.")
 
@@ -32,31 +190,56 @@ def extract_hr(file):
             week = _get_week_from_path(path)
             if week is None:
                 continue
-            df = pd.read_csv(path, skiprows=2)
-            df = df[["Time", "HR (bpm)"]].rename(columns={"Time": "time", "HR (bpm)": "hr"})
-            # Normalize invalid >=24:MM:SS to HH%24:MM:SS before parsing, and log when it occurs
-            time_str = df["time"].astype(str).str.strip()
-            parts = time_str.str.split(":", n=2, expand=True)
-            if parts.shape[1] >= 3:
-                hours = pd.to_numeric(parts[0], errors="coerce")
-                bad_mask = hours >= 24
-                if bad_mask.any():
-                    sample = time_str[bad_mask].iloc[0]
-                    logger.warning(
-                        "Found %d time values with hour >= 24 in %s (sample %s); normalizing to HH%%24",
-                        int(bad_mask.sum()),
-                        path,
-                        sample,
-                    )
-                    hours = hours.where(~bad_mask, hours % 24)
-                    parts[0] = hours.fillna(0).astype(int).astype(str).str.zfill(2)
-                    time_str = parts[0] + ":" + parts[1].str.zfill(2) + ":" + parts[2].str.zfill(2)
-            df["time"] = pd.to_datetime(time_str, format="%H:%M:%S")
-            return df, week
-    return None, None
+            reader = read_polar_csv if data is None else (lambda p: read_polar_csv(p, data))
+            if cache is not None:
+                seconds, hr = cache.read(path, reader, stat)
+            else:
+                seconds, hr = reader(path)
+            # Normalize invalid >=24:MM:SS to HH%24:MM:SS, and log when it occurs
+            bad_mask = seconds >= _SECONDS_PER_DAY
+            if bad_mask.any():
+                first = int(seconds[bad_mask][0])
+                logger.warning(
+                    "Found %d time values with hour >= 24 in %s (sample %s); normalizing to HH%%24",
+                    int(bad_mask.sum()),
+                    path,
+                    f"{first // 3600:02d}:{first // 60 % 60:02d}:{first % 60:02d}",
+                )
+            return path, seconds, hr, week
+    return None
+
+
+def extract_hr(file, cache=None, data: bytes | None = None, stat: tuple | None = None):
+    """
+    Return (df, week) for the first CSV in `file` whose name carries a week,
+    or (None, None). `cache` is an optional HR_Cache consulted before parsing.
+    `data` is the content of `file` when a single path was already read, and
+    `stat` its known (size, mtime_ns), which spares the cache a stat call.
+    """
+    found = _read_first_week_csv(file, cache, data, stat)
+    if found is None:
+        return None, None
+    _, seconds, hr, week = found
+    clock = _CLOCK_BASE + (seconds % _SECONDS_PER_DAY).astype("timedelta64[s]")
+    df = pd.DataFrame({"time": clock, "hr": hr})
+    return df, week
+
+
+def extract_recording(file, cache=None, data: bytes | None = None, stat: tuple | None = None):
+    """
+    Same as extract_hr, but returns the samples as a Recording (int32 seconds
+    on a rollover-resolved axis and float32 hr) instead of a DataFrame.
+    """
+    found = _read_first_week_csv(file, cache, data, stat)
+    if found is None:
+        return None, None
+    _, seconds, hr, week = found
+    return Recording(seconds, hr), week
 
 
 def recording_window(df: pd.DataFrame) -> tuple[pd.Timestamp, pd.Timestamp, pd.Timedelta] | None:
+    if isinstance(df, Recording):
+        return df.window
     if df is None or df.empty or "time" not in df.columns:
         return None
     times = df["time"].reset_index(drop=True)
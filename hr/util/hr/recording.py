@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+
+# clock times are kept relative to 1900-01-01, as extract_hr has always done
+CLOCK_BASE = np.datetime64("1900-01-01", "ns")
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+class Recording:
+    """
+    One Polar recording as two read-only arrays, validated once.
+
+    `seconds` is the monotonic time axis of the samples: the int32 clock
+    (HH:MM:SS % 24h) of the first day, with every backward step in file
+    order taken as a midnight rollover and the samples after it moved one
+    day on, as recording_window does. It is ascending by construction, so
+    a session that crosses midnight keeps its sample order and nothing is
+    ever re-sorted; `seconds - seconds[0]` is the elapsed time. `hr` is the
+    matching float32 heart rate with NaN for missing samples.
+
+    QC routines receive the same instance and work on views of its arrays;
+    nothing is copied or re-sorted per check.
+
+    `regular` marks recordings on an exact 1 s cadence (every sample one
+    second after the previous one), which is almost every Polar export. Their
+    samples are a dense series from `seconds[0]`, so duration-weighted
+    metrics reduce to counts and slices (see qc/zone/kernel.py).
+    """
+
+    __slots__ = ("seconds", "hr", "start_s", "end_s", "regular")
+
+    def __init__(self, seconds, hr):
+        clock = np.asarray(seconds, dtype=np.int64) % SECONDS_PER_DAY
+        hr = np.asarray(hr, dtype=np.float32)
+        if clock.ndim != 1 or clock.shape != hr.shape:
+            raise ValueError(f"seconds and hr must be 1-d arrays of equal length, got {clock.shape} and {hr.shape}")
+
+        # a backwards step in the clock is taken as a day rollover
+        rollover = np.diff(clock) < 0
+        if rollover.any():
+            clock[1:] += np.cumsum(rollover) * SECONDS_PER_DAY
+        if len(clock):
+            self.start_s = int(clock[0])
+            self.end_s = int(clock[-1])
+        else:
+            self.start_s = self.end_s = None
+
+        self.seconds = clock.astype(np.int32)
+        self.hr = np.ascontiguousarray(hr)
+        self.regular = len(clock) > 1 and bool((np.diff(self.seconds) == 1).all())
+        self.seconds.flags.writeable = False
+        self.hr.flags.writeable = False
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "Recording":
+        """Build from an extract_hr-style frame with `time` (clock) and `hr` columns, in file order."""
+        times = pd.to_datetime(df["time"]).to_numpy(dtype="datetime64[s]")
+        seconds = (times - times.astype("datetime64[D]")).astype(np.int64)
+        return cls(seconds, df["hr"].to_numpy(dtype=np.float32))
+
+    @classmethod
+    def coerce(cls, hr) -> "Recording":
+        """`hr` itself when it is a Recording, otherwise a Recording built from the frame."""
+        return hr if isinstance(hr, cls) else cls.from_frame(hr)
+
+    def __len__(self) -> int:
+        return len(self.seconds)
+
+    @property
+    def empty(self) -> bool:
+        return len(self.seconds) == 0
+
+    @property
+    def time(self) -> np.ndarray:
+        """Sample times as datetime64[ns] from 1900-01-01 (samples after midnight fall on the following days)."""
+        return CLOCK_BASE + self.seconds.astype("timedelta64[s]")
+
+    @property
+    def window(self) -> tuple[pd.Timestamp, pd.Timestamp, pd.Timedelta] | None:
+        """(start_time, end_time, duration), as recording_window returns for the file-order frame."""
+        if self.start_s is None:
+            return None
+        start = pd.Timestamp(CLOCK_BASE + np.timedelta64(self.start_s, "s"))
+        duration = pd.Timedelta(seconds=self.end_s - self.start_s)
+        return start, start + duration, duration
+
+    def to_frame(self) -> pd.DataFrame:
+        """`time`/`hr` frame in sample order, for code that still wants a DataFrame."""
+        return pd.DataFrame({"time": self.time, "hr": self.hr})
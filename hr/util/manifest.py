@@ -0,0 +1,121 @@
+import hashlib
+import logging
+import os
+import pickle
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever QC or zone rules change so stale results are not reused.
+MANIFEST_VERSION = 7
+
+
+def file_fingerprint(path: str, content_hash: bool = False) -> tuple:
+    """
+    (size, mtime_ns, sha256-or-None) for `path`; the hash is only computed
+    when `content_hash` is set since it means reading the whole file.
+    """
+    st = os.stat(path)
+    digest = None
+    if content_hash:
+        h = hashlib.sha256()
+        with open(path, "rb") as fh:
+            for chunk in iter(lambda: fh.read(1 << 20), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+    return st.st_size, st.st_mtime_ns, digest
+
+
+class Manifest:
+    """
+    Persisted per-file QC results for incremental runs.
+
+    Entries are keyed by file path and remember the file's size/mtime (and
+    optionally a sha256), the subject's zone row the result was computed with,
+    and the result itself as a compact qc.records.File_Result. A stored
+    result is reused only while both the file and the zone row are unchanged.
+
+    The file holds two pickles: a small {"version": ...} header, then the
+    entries, which are only unpickled when the header matches. A manifest
+    that cannot be read for any reason is ignored and every file recomputed.
+    """
+
+    FILE = "manifest.pkl"
+
+    def __init__(self, path: str, content_hash: bool = False):
+        self.path = path
+        self.content_hash = content_hash
+        self.entries = {}
+
+    @classmethod
+    def load(cls, cache_dir: str, content_hash: bool = False) -> "Manifest":
+        manifest = cls(os.path.join(cache_dir, cls.FILE), content_hash=content_hash)
+        if not os.path.isfile(manifest.path):
+            return manifest
+        try:
+            with open(manifest.path, "rb") as fh:
+                header = pickle.load(fh)
+                if not isinstance(header, dict) or header.get("version") != MANIFEST_VERSION:
+                    logger.info("Manifest version changed; recomputing all files")
+                    return manifest
+                entries = pickle.load(fh)
+            if not isinstance(entries, dict):
+                raise TypeError(f"expected a dict of entries, got {type(entries).__name__}")
+        except Exception as exc:  # any older layout or damaged file just means a full recompute
+            logger.warning("Ignoring unreadable manifest %s: %s", manifest.path, exc)
+            return manifest
+        manifest.entries = entries
+        return manifest
+
+    def lookup(self, file: str, zone_row, stat: tuple | None = None) -> tuple:
+        """
+        Return (fingerprint, result) for `file`, where result is the stored
+        File_Result or None when the file must be recomputed.
+
+        `stat` is an already known (size, mtime_ns), e.g. from the catalog.
+        The content hash, when enabled, is only computed for files whose
+        size/mtime changed, so unchanged files cost at most a single stat.
+        """
+        if stat is None:
+            st = os.stat(file)
+            stat = (st.st_size, st.st_mtime_ns)
+        entry = self.entries.get(file)
+        if entry is not None and entry["zone"] == zone_row:
+            if (entry["size"], entry["mtime_ns"]) == stat:
+                fingerprint = (*stat, entry["sha256"])
+                return fingerprint, entry["result"]
+        fingerprint = file_fingerprint(file, content_hash=self.content_hash)
+        if entry is not None and entry["zone"] == zone_row:
+            # re-copied or touched files can still match by content
+            if fingerprint[2] is not None and entry["sha256"] == fingerprint[2]:
+                entry["mtime_ns"] = fingerprint[1]
+                return fingerprint, entry["result"]
+        return fingerprint, None
+
+    def put(self, file: str, fingerprint: tuple, zone_row, result):
+        size, mtime_ns, digest = fingerprint
+        self.entries[file] = {
+            "size": size,
+            "mtime_ns": mtime_ns,
+            "sha256": digest,
+            "zone": zone_row,
+            "result": result,
+        }
+
+    def stored(self):
+        """(file, fingerprint, zone row, File_Result) for every stored file."""
+        for file, entry in self.entries.items():
+            yield file, (entry["size"], entry["mtime_ns"], entry["sha256"]), entry["zone"], entry["result"]
+
+    def prune(self, files) -> None:
+        """Forget files that are no longer on disk."""
+        keep = set(files)
+        for file in [f for f in self.entries if f not in keep]:
+            del self.entries[file]
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as fh:
+            pickle.dump({"version": MANIFEST_VERSION}, fh, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(self.entries, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
@@ -0,0 +1,164 @@
+import csv
+import json
+import logging
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# per-file stages in the order util.pipeline.file_stages runs them
+FILE_STAGES = ("window", "read", "zone_lookup", "qc_data", "qc_zones")
+
+
+class File_Timer:
+    """
+    Wall time and, with `trace_memory`, peak traced allocation per stage.
+
+    A stage that runs more than once (e.g. the window pre-screen and the
+    post-parse check) accumulates its time and keeps its largest peak. Peaks
+    are bytes allocated above what was live when the stage started, as seen
+    by tracemalloc (numpy buffers included). Instances are picklable so pool
+    workers can send them back.
+    """
+
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory and tracemalloc.is_tracing()
+        self.seconds: dict[str, float] = {}
+        self.peak_bytes: dict[str, int] = {}
+
+    @contextmanager
+    def stage(self, name: str, trace_memory: bool = True):
+        # stages that wrap other timed stages pass trace_memory=False, since
+        # the inner stages reset the tracemalloc peak
+        trace = self.trace_memory and trace_memory
+        if trace:
+            tracemalloc.reset_peak()
+            start_bytes = tracemalloc.get_traced_memory()[0]
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - t0
+            if trace:
+                peak = tracemalloc.get_traced_memory()[1] - start_bytes
+                self.peak_bytes[name] = max(self.peak_bytes.get(name, 0), peak)
+
+    @property
+    def total(self) -> float:
+        return sum(self.seconds.values())
+
+
+def _max_rss_mb(who=resource.RUSAGE_SELF) -> float:
+    rss = resource.getrusage(who).ru_maxrss
+    # bytes on macOS, KiB on Linux
+    return rss / 2**20 if sys.platform == "darwin" else rss / 2**10
+
+
+class Run_Metrics:
+    """
+    Per-stage metrics for one Main.main run.
+
+    Run-level stages (discover, write, ...) are timed with `stage()`; per-file
+    stages come from the File_Timers that util.pipeline's file stages filled
+    in and are added with `add()`. `report()` summarizes both: totals and percentiles
+    per stage and the slowest files.
+    """
+
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.run = File_Timer(trace_memory)
+        self.files: dict[str, File_Timer] = {}
+        self._t0 = time.perf_counter()
+
+    def timer(self) -> File_Timer:
+        return File_Timer(self.trace_memory)
+
+    def stage(self, name: str, trace_memory: bool = True):
+        return self.run.stage(name, trace_memory)
+
+    def add(self, file: str, timer: File_Timer) -> None:
+        self.files[file] = timer
+
+    def report(self, top_n: int = 10) -> dict:
+        stages = list(FILE_STAGES) + sorted(
+            {s for t in self.files.values() for s in t.seconds} - set(FILE_STAGES)
+        )
+        file_stages = {}
+        for stage in stages:
+            secs = np.array([t.seconds[stage] for t in self.files.values() if stage in t.seconds])
+            if len(secs) == 0:
+                continue
+            summary = {
+                "files": int(len(secs)),
+                "total_s": float(secs.sum()),
+                "mean_s": float(secs.mean()),
+                "p50_s": float(np.percentile(secs, 50)),
+                "p90_s": float(np.percentile(secs, 90)),
+                "p99_s": float(np.percentile(secs, 99)),
+                "max_s": float(secs.max()),
+            }
+            peaks = [t.peak_bytes[stage] for t in self.files.values() if stage in t.peak_bytes]
+            if peaks:
+                summary["peak_bytes_max"] = int(max(peaks))
+                summary["peak_bytes_p90"] = int(np.percentile(peaks, 90))
+            file_stages[stage] = summary
+
+        run_stages = {}
+        for stage, secs in self.run.seconds.items():
+            run_stages[stage] = {"seconds": secs}
+            if stage in self.run.peak_bytes:
+                run_stages[stage]["peak_bytes"] = self.run.peak_bytes[stage]
+
+        slowest = sorted(self.files.items(), key=lambda item: item[1].total, reverse=True)[:top_n]
+        return {
+            "wall_s": time.perf_counter() - self._t0,
+            "files": len(self.files),
+            "max_rss_mb": _max_rss_mb(),
+            # largest pool worker, when --workers > 1
+            "max_rss_children_mb": _max_rss_mb(resource.RUSAGE_CHILDREN),
+            "trace_memory": self.trace_memory,
+            "run_stages": run_stages,
+            "file_stages": file_stages,
+            "slowest_files": [
+                {"file": file, "total_s": timer.total, "seconds": timer.seconds, "peak_bytes": timer.peak_bytes}
+                for file, timer in slowest
+            ],
+        }
+
+    def save(self, path: str, top_n: int = 10) -> dict:
+        """
+        Write the run report as JSON to `path` and one row per file (seconds,
+        and peak bytes when traced, per stage) to a CSV next to it.
+        """
+        report = self.report(top_n)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as fh:
+            json.dump(report, fh, indent=2)
+
+        csv_path = os.path.splitext(path)[0] + "_files.csv"
+        stages = list(report["file_stages"])
+        columns = ["file", "total_s"] + [f"{s}_s" for s in stages]
+        if self.trace_memory:
+            columns += [f"{s}_peak_bytes" for s in stages]
+        with open(csv_path, "w", newline="") as fh:
+            writer = csv.writer(fh)
+            writer.writerow(columns)
+            for file, timer in self.files.items():
+                row = [file, timer.total] + [timer.seconds.get(s, "") for s in stages]
+                if self.trace_memory:
+                    row += [timer.peak_bytes.get(s, "") for s in stages]
+                writer.writerow(row)
+
+        logger.info(
+            "Run metrics written: %s, %s (%d files, %.1fs)",
+            path, csv_path, report["files"], report["wall_s"],
+        )
+        return report
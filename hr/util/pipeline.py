@@ -0,0 +1,321 @@
+"""
+The QC pipeline as generator stages that are chained lazily, so only the
+files in flight (the prefetch window) are held in memory:
+
+    catalog_records -> jobs -> prefetch -> screen -> read -> window
+        -> lookup_zones -> qc -> results -> in_task_order -> csv_sink / db_sink
+
+Main.main is this chain plus the manifest (lookup_cached) and a process pool
+(util.workers.run_files). Stages can be left out or swapped, e.g. zone
+metrics for one subject without scanning the tree:
+
+    records = [File_Record.from_path(p) for p in sorted(glob(f"{subject_dir}/*.csv"))]
+    stream = file_stages(jobs(records), ZoneTable.load(zone_path), data_qc=False)
+    for result in results(stream):
+        print(result.file, result.zone)
+"""
+import logging
+from contextlib import nullcontext
+from functools import partial
+
+import pandas as pd
+
+from qc.records import File_Result, Results_Writer
+from qc.sup import QC_Sup
+from util.hr.extract_hr import _get_week_from_path, extract_recording, screen_recording
+from util.metrics import File_Timer
+
+logger = logging.getLogger(__name__)
+
+MAX_RECORDING = pd.Timedelta(hours=4)
+
+
+def no_stage(name, trace_memory=True):
+    """Stand-in for Run_Metrics.stage when a run is not timed."""
+    return nullcontext()
+
+
+class File_Job:
+    """
+    One file on its way through the per-file stages.
+
+    Stages fill in `data` (bytes read ahead), `window` (the header screen's
+    result, when the prefetcher already computed it), `hr`/`week` (the
+    parsed recording), `zones`, `err`, `zone_metrics` and `zone_stats`. A stage
+    that rejects the file calls finish() with the file's error, and later
+    stages pass jobs that are `done` through untouched. Buffers are dropped
+    as soon as no later stage needs them.
+    """
+
+    __slots__ = ("file", "subject", "group", "size", "mtime_ns", "timer", "data", "window", "hr", "week", "zones", "err", "zone_metrics", "zone_stats", "done")
+
+    def __init__(self, file, subject, group, size=0, timer=None, data=None, mtime_ns=None):
+        self.file = file
+        self.subject = subject
+        self.group = group
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.timer = timer if timer is not None else File_Timer()
+        self.data = data
+        self.window = None
+        self.hr = None
+        self.week = None
+        self.zones = None
+        self.err = None
+        self.zone_metrics = None
+        self.zone_stats = None
+        self.done = False
+
+    @classmethod
+    def from_record(cls, record, timer=None) -> "File_Job":
+        return cls(record.path, record.subject, record.group, record.size, timer, mtime_ns=record.mtime_ns)
+
+    @property
+    def stat(self) -> tuple | None:
+        """(size, mtime_ns) from the catalog, or None when the job was not made from a File_Record."""
+        return (self.size, self.mtime_ns) if self.mtime_ns is not None else None
+
+    def finish(self, err) -> None:
+        self.err = err
+        self.data = self.hr = None
+        self.done = True
+
+    def result(self) -> File_Result:
+        return File_Result.from_qc(self.file, self.err, self.zone_metrics, self.zone_stats)
+
+
+def catalog_records(catalog, skip=()):
+    """A Catalog's CSV File_Records in (group, subject, name) order, minus the paths in `skip`."""
+    for record in catalog.csvs():
+        if record.path not in skip:
+            yield record
+
+
+def jobs(records, metrics=None):
+    """A File_Job per File_Record, timed into `metrics` (util.metrics.Run_Metrics) when given."""
+    for record in records:
+        yield File_Job.from_record(record, metrics.timer() if metrics is not None else None)
+
+
+def _duration_err(file, window):
+    """The `duration` error for a recording over MAX_RECORDING, or None."""
+    if window is None:
+        return None
+    start_time, end_time, duration = window
+    if duration <= MAX_RECORDING:
+        return None
+    logger.warning(
+        "Skipping file with long duration (%s): %s",
+        duration,
+        file,
+    )
+    return {
+        "duration": [
+            "recording longer than 4 hours; file ignored",
+            pd.DataFrame({
+                "start_time": [start_time],
+                "end_time": [end_time],
+                "duration": [duration],
+            }),
+        ]
+    }
+
+
+def _prefetch_bytes(job, hr_cache=None):
+    """
+    Content of `job`'s file for read(), or None when it is not needed: no
+    week (skipped), a cached parse, or a recording the header screen rejects.
+    The file is read once and screened in memory; the window is kept on the
+    job, so screen() does not look at the file again.
+    """
+    if not job.file.lower().endswith(".csv") or _get_week_from_path(job.file, warn=False) is None:
+        return None
+    if hr_cache is not None and hr_cache.has(job.file, job.stat):
+        return None
+    # one open per file: the screen runs on the bytes already read
+    with open(job.file, "rb") as fh:
+        data = fh.read()
+    job.window = window = screen_recording(job.file, data)
+    if window is not None and window[2] > MAX_RECORDING:
+        return None
+    return data
+
+
+def prefetch(jobs, hr_cache=None, depth: int = 4, max_bytes: int = 256 << 20):
+    """
+    Read up to `depth` upcoming files (at most `max_bytes` in flight) on
+    background threads while later stages work on the current one.
+    """
+    if depth <= 0:
+        yield from jobs
+        return
+    from util.prefetch import Prefetcher
+    loaded = Prefetcher(
+        jobs,
+        partial(_prefetch_bytes, hr_cache=hr_cache),
+        depth=depth,
+        max_bytes=max_bytes,
+        size=lambda job: job.size,
+    )
+    for job, data in loaded:
+        job.data = data
+        yield job
+
+
+def screen(jobs, hr_cache=None):
+    """
+    Reject recordings whose first/last sample lines already span more than
+    MAX_RECORDING, before parsing. Files whose parse is in `hr_cache` are
+    left to window(), which checks the cached arrays without touching the
+    source.
+    """
+    for job in jobs:
+        if not job.done and str(job.file).lower().endswith(".csv") and _get_week_from_path(job.file, warn=False) is not None:
+            if job.window is not None or hr_cache is None or not hr_cache.has(job.file, job.stat):
+                with job.timer.stage("window"):
+                    window = job.window if job.window is not None else screen_recording(job.file, job.data)
+                    err = _duration_err(job.file, window)
+                if err is not None:
+                    job.finish(err)
+        yield job
+
+
+def read(jobs, hr_cache=None):
+    """Parse each file into a Recording (through `hr_cache` when given)."""
+    for job in jobs:
+        if not job.done:
+            with job.timer.stage("read"):
+                job.hr, job.week = extract_recording(job.file, cache=hr_cache, data=job.data, stat=job.stat)
+            job.data = None
+            if job.hr is None or job.week is None:
+                logger.warning("Skipping file with unparseable week: %s", job.file)
+                job.finish({"week_parse": ["could not parse week from filename; file skipped", None]})
+        yield job
+
+
+def window(jobs):
+    """Reject parsed recordings longer than MAX_RECORDING, for files the pre-screen could not judge."""
+    for job in jobs:
+        if not job.done:
+            with job.timer.stage("window"):
+                err = _duration_err(job.file, job.hr.window)
+            if err is not None:
+                job.finish(err)
+        yield job
+
+
+def lookup_zones(jobs, zone_table):
+    """
+    Attach each subject's HR zones from a util.zone.zone_table.ZoneTable,
+    looked up once per run of consecutive files of the same subject (a
+    util.schedule batch).
+    """
+    subject = zones = None
+    for job in jobs:
+        if not job.done:
+            with job.timer.stage("zone_lookup"):
+                if job.subject != subject:
+                    zones = zone_table.lookup(job.subject)
+                    subject = job.subject
+                job.zones = zones
+        yield job
+
+
+def qc(jobs, data: bool = True, zones: bool = True):
+    """Run QC_Sup's data checks and/or zone metrics on each recording."""
+    for job in jobs:
+        if not job.done:
+            sup = QC_Sup(job.hr, job.zones, job.week, job.group)
+            if data:
+                with job.timer.stage("qc_data"):
+                    sup.qc_data()
+            if zones:
+                with job.timer.stage("qc_zones"):
+                    job.zone_metrics = sup.qc_zones()
+                job.zone_stats = sup.zone_stats
+            job.err = sup.err
+            job.hr = None
+        yield job
+
+
+def file_stages(jobs, zone_table, hr_cache=None, data_qc: bool = True, zone_qc: bool = True):
+    """The per-file chain: screen -> read -> window -> zone lookup -> QC."""
+    jobs = window(read(screen(jobs, hr_cache), hr_cache))
+    return qc(lookup_zones(jobs, zone_table), data=data_qc, zones=zone_qc)
+
+
+def results(jobs, metrics=None):
+    """Each finished job as a File_Result; its stage timings go to `metrics` when given."""
+    for job in jobs:
+        result = job.result()
+        if metrics is not None:
+            metrics.add(result.file, job.timer)
+        yield result
+
+
+def lookup_cached(tasks, manifest, zone_table) -> tuple[dict, list, dict]:
+    """
+    Split `tasks` against a util.manifest.Manifest. Returns (stored
+    File_Results by task position, positions to recompute, manifest key
+    (fingerprint, zone row) by position).
+    """
+    cached, pending, keys = {}, [], {}
+    for i, record in enumerate(tasks):
+        zone_row = zone_table.row_key(record.subject)
+        fingerprint, result = manifest.lookup(record.path, zone_row, stat=(record.size, record.mtime_ns))
+        keys[i] = (fingerprint, zone_row)
+        if result is None:
+            pending.append(i)
+        else:
+            cached[i] = result
+    return cached, pending, keys
+
+
+def in_task_order(tasks, cached, processed, manifest=None, keys=None):
+    """
+    (position, File_Record, File_Result, fresh) for every task: stored results
+    from `cached`, the rest taken from `processed` (the pending tasks' results,
+    in order), each handed on as soon as it exists. New results are recorded
+    in `manifest` under their `keys`.
+    """
+    processed = iter(processed)
+    for k, record in enumerate(tasks):
+        result = cached.pop(k, None)
+        fresh = result is None
+        if fresh:
+            result = next(processed)
+            if manifest is not None:
+                manifest.put(result.file, *keys[k], result)
+        yield k, record, result, fresh
+    # run the producer to its end so a process pool shuts down here
+    for _ in processed:
+        pass
+
+
+def csv_sink(outcomes, out_path, zone_out_path, catalog=None, stage=no_stage) -> dict:
+    """Write qc_out.csv and zone_out.csv from in_task_order() tuples; returns their row counts."""
+    writer = Results_Writer(out_path, zone_out_path, catalog=catalog)
+    with stage("process", trace_memory=False):
+        for k, record, result, _ in outcomes:
+            writer.add(k, record.subject, result)
+    with stage("write"):
+        n_qc, n_zones = writer.close()
+    return {"qc_rows": n_qc, "zone_rows": n_zones}
+
+
+def db_sink(outcomes, db_path, out_path, zone_out_path, catalog=None, stage=no_stage) -> dict:
+    """
+    Upsert in_task_order() tuples into a util.results_db.Results_DB and
+    export qc_out.csv and zone_out.csv from it; returns their row counts.
+    """
+    from util.results_db import Results_DB
+    store = Results_DB(db_path)
+    try:
+        with stage("process", trace_memory=False):
+            store.sync(outcomes, catalog=catalog)
+        with stage("write"):
+            n_qc = store.export_qc(out_path)
+            n_zones = store.export_zones(zone_out_path)
+    finally:
+        store.close()
+    return {"qc_rows": n_qc, "zone_rows": n_zones}
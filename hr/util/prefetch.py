@@ -0,0 +1,70 @@
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class Prefetcher:
+    """
+    Iterate `items` in order while `load(item)` runs ahead of the consumer on
+    a small thread pool.
+
+    At most `depth` items are in flight, and the loads in flight reserve at
+    most `max_bytes` according to `size(item)` (e.g. the file size from the
+    catalog). When the budget is used up, no further loads are started until
+    the consumer catches up. Items larger than the whole budget are not
+    loaded ahead. Iteration yields (item, loaded), where loaded is None when
+    the item was not loaded ahead, `load` returned None, or `load` failed. The
+    consumer then does the work itself, so errors still surface where they
+    did before.
+    """
+
+    def __init__(self, items, load, depth: int = 4, max_bytes: int = 256 << 20, size=None, threads: int | None = None):
+        self.items = items
+        self.load = load
+        self.depth = max(1, depth)
+        self.max_bytes = max_bytes
+        self.size = size or (lambda item: 0)
+        self.threads = threads or min(4, self.depth)
+
+    def _load(self, item):
+        try:
+            return self.load(item)
+        except Exception as exc:  # the consumer redoes the work and sees the real error
+            logger.debug("Prefetch failed for %s: %s", item, exc)
+            return None
+
+    def __iter__(self):
+        items = iter(self.items)
+        pending = deque()  # (item, future or None, reserved bytes)
+        reserved = 0
+        held = None        # next item, waiting for budget
+        exhausted = False
+        pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="prefetch")
+        try:
+            while True:
+                # top up the queue in order, within depth and the byte budget
+                while not exhausted and len(pending) < self.depth:
+                    if held is None:
+                        held = next(items, None)
+                        if held is None:
+                            exhausted = True
+                            break
+                    nbytes = self.size(held)
+                    if nbytes > self.max_bytes:
+                        pending.append((held, None, 0))
+                    elif reserved + nbytes <= self.max_bytes:
+                        pending.append((held, pool.submit(self._load, held), nbytes))
+                        reserved += nbytes
+                    else:
+                        break
+                    held = None
+                if not pending:
+                    return
+                item, future, nbytes = pending.popleft()
+                loaded = future.result() if future is not None else None
+                reserved -= nbytes
+                yield item, loaded
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,251 @@
+import os
+import logging
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from qc.columns import METRIC_COLUMNS, QC_COLUMNS, ZONE_COLUMNS
+from qc.records import file_meta, qc_csv_frame, write_csv, zone_csv_frame
+from util.catalog import parse_path
+
+logger = logging.getLogger(__name__)
+
+# Bump when the tables change; an older store is rebuilt from the next run.
+SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    file        TEXT PRIMARY KEY,
+    subject_dir TEXT NOT NULL,
+    size        INTEGER NOT NULL,
+    mtime_ns    INTEGER NOT NULL,
+    seq         INTEGER NOT NULL    -- position in the last run's task order
+);
+CREATE TABLE IF NOT EXISTS qc_errors (
+    file       TEXT NOT NULL,
+    row        INTEGER NOT NULL,    -- order within the file
+    grp        TEXT,
+    subject    TEXT,
+    week       INTEGER,
+    session    TEXT,
+    error_type TEXT,
+    message    TEXT,
+    start_ns   INTEGER,
+    end_ns     INTEGER,
+    duration_s REAL,
+    length,
+    PRIMARY KEY (file, row)
+);
+CREATE INDEX IF NOT EXISTS qc_errors_subject ON qc_errors (subject, week);
+CREATE INDEX IF NOT EXISTS qc_errors_week ON qc_errors (week);
+CREATE INDEX IF NOT EXISTS qc_errors_type ON qc_errors (error_type, subject);
+CREATE TABLE IF NOT EXISTS zone_metrics (
+    file                   TEXT PRIMARY KEY,
+    grp                    TEXT,
+    subject                TEXT,
+    week                   INTEGER,
+    session                TEXT,
+    time_in_allowed_s      REAL,
+    time_above_s           REAL,
+    time_below_s           REAL,
+    longest_bounded_bout_s REAL,
+    bounded_met            INTEGER,
+    mazd                   REAL
+);
+CREATE INDEX IF NOT EXISTS zone_metrics_subject ON zone_metrics (subject, week);
+CREATE INDEX IF NOT EXISTS zone_metrics_week ON zone_metrics (week);
+"""
+
+# File_Result row (with its file first) -> table column
+_QC_DB = ["file", "grp", "subject", "week", "session", "error_type", "message",
+          "start_ns", "end_ns", "duration_s", "length"]
+_ZONE_DB = ["file", "grp", "subject", "week", "session"] + METRIC_COLUMNS
+
+# rows in the order Main builds err_master/zone_master: subjects by first
+# appearance, then files in task order
+_RUN_JOIN = """
+    JOIN files f ON f.file = t.file
+    JOIN (SELECT subject_dir, MIN(seq) AS first_seq FROM files GROUP BY subject_dir) s
+        ON s.subject_dir = f.subject_dir
+"""
+_RUN_ORDER = " ORDER BY s.first_seq, f.seq"
+
+# NULL times come back as NaT, i.e. the smallest int64 in datetime64[ns]
+_NAT = np.iinfo(np.int64).min
+
+
+def _py(value):
+    """numpy/pandas scalars as plain Python values sqlite3 can bind; missing values as None."""
+    if value is None or value is pd.NA or value is pd.NaT:
+        return None
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    return value
+
+
+def _zone_csv_frame(rows: list[tuple]):
+    # bounded_met is stored as 0/1
+    bounded_met = ZONE_COLUMNS.index("bounded_met")
+    return zone_csv_frame([
+        (*row[:bounded_met], None if row[bounded_met] is None else bool(row[bounded_met]), *row[bounded_met + 1:])
+        for row in rows
+    ])
+
+
+def _where(subject=None, weeks=None, error_type=None) -> tuple[str, list]:
+    clauses, params = [], []
+    if subject is not None:
+        clauses.append("t.subject = ?")
+        params.append(subject)
+    if weeks is not None:
+        weeks = list(weeks)
+        clauses.append(f"t.week IN ({', '.join('?' * len(weeks))})")
+        params.extend(int(w) for w in weeks)
+    if error_type is not None:
+        clauses.append("t.error_type = ?")
+        params.append(error_type)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+class Results_DB:
+    """
+    Per-file QC results in a local SQLite database.
+
+    Each catalogued file has one `files` row (size/mtime it was scored at and
+    its position in the run), its qc_out rows in `qc_errors` and its zone_out
+    row in `zone_metrics`, all keyed by file path. sync() replaces the rows
+    of files that were (re)computed and drops files that are gone, so a run
+    only writes what changed; export_qc/export_zones rebuild the CSVs from
+    the tables exactly as qc.records.Results_Writer writes them. qc_errors and
+    zone_metrics are indexed by (subject, week) and week for queries.
+    """
+
+    FILE = "results.sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != SCHEMA_VERSION:
+            if version:
+                logger.info("Results store %s has schema %d; rebuilding", path, version)
+            with self.conn:
+                for table in ("files", "qc_errors", "zone_metrics"):
+                    self.conn.execute(f"DROP TABLE IF EXISTS {table}")
+                self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def sync(self, outcomes, catalog=None) -> int:
+        """
+        Bring the store in line with one run. `outcomes` yields (position,
+        File_Record, File_Result, fresh) in task order, as Main streams them;
+        results that are `fresh` or whose size/mtime differ from the store are
+        rewritten as they arrive and files the run did not see are removed at
+        the end. Returns the number of files written.
+        """
+        parse_meta = catalog.meta if catalog is not None else parse_path
+        stored = {file: (size, mtime_ns) for file, size, mtime_ns in self.conn.execute(
+            "SELECT file, size, mtime_ns FROM files"
+        )}
+        insert_qc = f"INSERT INTO qc_errors (row, {', '.join(_QC_DB)}) VALUES ({', '.join('?' * (len(_QC_DB) + 1))})"
+        insert_zone = f"INSERT INTO zone_metrics ({', '.join(_ZONE_DB)}) VALUES ({', '.join('?' * len(_ZONE_DB))})"
+        seen = set()
+        written = 0
+        with self.conn:
+            for seq, record, result, fresh in outcomes:
+                seen.add(record.path)
+                self.conn.execute(
+                    "INSERT INTO files (file, subject_dir, size, mtime_ns, seq) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (file) DO UPDATE SET subject_dir = excluded.subject_dir, "
+                    "size = excluded.size, mtime_ns = excluded.mtime_ns, seq = excluded.seq",
+                    (record.path, record.subject, record.size, record.mtime_ns, seq),
+                )
+                if not fresh and stored.get(record.path) == (record.size, record.mtime_ns):
+                    continue
+                written += 1
+                for table in ("qc_errors", "zone_metrics"):
+                    self.conn.execute(f"DELETE FROM {table} WHERE file = ?", (result.file,))
+                meta = file_meta(parse_meta, result.file, record.subject)
+                self.conn.executemany(
+                    insert_qc,
+                    ([i, result.file, *map(_py, row)] for i, row in enumerate(result.qc_rows(meta))),
+                )
+                zone_row = result.zone_row(meta)
+                if zone_row is not None:
+                    self.conn.execute(insert_zone, [result.file, *map(_py, zone_row)])
+
+            gone = [(file,) for file in stored if file not in seen]
+            for table in ("files", "qc_errors", "zone_metrics"):
+                self.conn.executemany(f"DELETE FROM {table} WHERE file = ?", gone)
+        logger.info("Results store %s: %d files written, %d removed", self.path, written, len(gone))
+        return written
+
+    def _qc_rows(self, where: str = "", params=()) -> pd.DataFrame:
+        cur = self.conn.execute(
+            f"SELECT t.{', t.'.join(_QC_DB)} FROM qc_errors t {_RUN_JOIN}{where}{_RUN_ORDER}, t.row",
+            params,
+        )
+        rows = cur.fetchall()
+        cols = list(zip(*rows)) if rows else [()] * len(_QC_DB)
+        # built column by column so NULLs come back as missing values
+        df = pd.DataFrame.from_records([row[:7] for row in rows], columns=["file"] + QC_COLUMNS[:6])
+        for name, values in (("start_time", cols[7]), ("end_time", cols[8])):
+            df[name] = np.array([_NAT if v is None else v for v in values], dtype=np.int64).view("datetime64[ns]")
+        df["duration_s"] = np.array([np.nan if v is None else v for v in cols[9]], dtype=float)
+        df["length"] = np.array([pd.NA if v is None else v for v in cols[10]], dtype=object)
+        return df
+
+    def _zone_rows(self, where: str = "", params=()) -> pd.DataFrame:
+        cur = self.conn.execute(
+            f"SELECT t.{', t.'.join(_ZONE_DB)} FROM zone_metrics t {_RUN_JOIN}{where}{_RUN_ORDER}",
+            params,
+        )
+        df = pd.DataFrame.from_records(cur.fetchall(), columns=["file"] + ZONE_COLUMNS)
+        df["bounded_met"] = df["bounded_met"].map(lambda v: None if v is None else bool(v), na_action="ignore")
+        return df
+
+    def _export(self, table: str, select: list[str], keys: list[str], ties: str, out_csv, columns, frame) -> int:
+        # sorted like Results_Writer (missing values last), ties in run order
+        order = ", ".join(f"t.{c} IS NULL, t.{c}" for c in keys)
+        cur = self.conn.execute(
+            f"SELECT t.{', t.'.join(select)} FROM {table} t {_RUN_JOIN} ORDER BY {order}, {ties}"
+        )
+        rows = (row for batch in iter(lambda: cur.fetchmany(10_000), []) for row in batch)
+        return write_csv(out_csv, columns, rows, frame)
+
+    def export_qc(self, out_csv: str | os.PathLike) -> int:
+        """Write qc_out.csv from the store, byte for byte as a run without the store would; returns the row count."""
+        n = self._export(
+            "qc_errors", _QC_DB[1:], ["grp", "subject", "week", "session", "error_type", "start_ns", "end_ns"],
+            "s.first_seq, f.seq, t.row", out_csv, QC_COLUMNS, qc_csv_frame,
+        )
+        logger.info("QC summary written: %s (%d rows)", out_csv, n)
+        return n
+
+    def export_zones(self, out_csv: str | os.PathLike) -> int:
+        """Write zone_out.csv from the store, byte for byte as a run without the store would; returns the row count."""
+        n = self._export(
+            "zone_metrics", _ZONE_DB[1:], ["grp", "subject", "week", "session"],
+            "s.first_seq, f.seq", out_csv, ZONE_COLUMNS, _zone_csv_frame,
+        )
+        logger.info("Zone QC summary written: %s (%d rows)", out_csv, n)
+        return n
+
+    def qc(self, subject=None, weeks=None, error_type=None) -> pd.DataFrame:
+        """
+        qc_out rows (with their `file`) filtered by subject label, weeks and
+        error type, e.g. qc(subject="sub8030", error_type="bounded_short").
+        """
+        return self._qc_rows(*_where(subject, weeks, error_type))
+
+    def zones(self, subject=None, weeks=None) -> pd.DataFrame:
+        """zone_out rows (with their `file`) filtered by subject label and weeks, e.g. zones(weeks=range(7, 13))."""
+        return self._zone_rows(*_where(subject, weeks))
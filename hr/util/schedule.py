@@ -0,0 +1,190 @@
+"""
+Work plans for multi-process runs: the files are grouped into per-subject
+batches, so a worker looks up a subject's zones once per batch, and the
+batches are started longest first (LPT) by a cost estimated from the
+catalogued file sizes, so a few large files cannot become the long pole at
+the end of a run.
+"""
+import csv
+import heapq
+import logging
+import os
+
+import numpy as np
+
+from util.hr.extract_hr import _get_week_from_path, screen_recording
+from util.pipeline import MAX_RECORDING
+
+logger = logging.getLogger(__name__)
+
+# per-file overhead and seconds per byte parsed (or per byte of a parse
+# already in the HR cache), measured on local disk; Cost_Model.from_metrics
+# refits them for the filesystem at hand
+FILE_S = 0.004
+BYTE_S = 70e-9
+CACHED_BYTE_S = 16e-9
+
+PLAN_COLUMNS = ["batch", "subject", "files", "size_mb", "cost_s", "worker", "start_s", "end_s"]
+
+
+class Cost_Model:
+    """
+    Estimated seconds to QC one file: `file_s` + size * `byte_s`, with
+    `cached_byte_s` per byte instead when the file's parse is in the HR cache.
+    """
+
+    __slots__ = ("file_s", "byte_s", "cached_byte_s")
+
+    def __init__(self, file_s: float = FILE_S, byte_s: float = BYTE_S, cached_byte_s: float = CACHED_BYTE_S):
+        self.file_s = file_s
+        self.byte_s = byte_s
+        self.cached_byte_s = cached_byte_s
+
+    def cost(self, size: int, cached: bool = False) -> float:
+        return self.file_s + size * (self.cached_byte_s if cached else self.byte_s)
+
+    @classmethod
+    def from_metrics(cls, path: str) -> "Cost_Model":
+        """
+        Fit file_s and byte_s to the per-file times of an earlier --metrics
+        report (its JSON path or the `_files.csv` next to it). Only files
+        that were parsed are used, and files that no longer exist are left
+        out. A report from a run without the HR cache fits best;
+        cached_byte_s keeps its default ratio to byte_s.
+        """
+        if not path.endswith("_files.csv"):
+            path = os.path.splitext(path)[0] + "_files.csv"
+        sizes, times = [], []
+        with open(path, newline="") as fh:
+            for row in csv.DictReader(fh):
+                if not row.get("read_s"):
+                    continue
+                try:
+                    sizes.append(os.path.getsize(row["file"]))
+                except OSError:
+                    continue
+                times.append(float(row["total_s"]))
+        sizes, times = np.asarray(sizes, dtype=float), np.asarray(times)
+        if len(np.unique(sizes)) < 2:
+            raise ValueError(f"{path} needs timings of at least two files of different sizes")
+        (file_s, byte_s), *_ = np.linalg.lstsq(np.c_[np.ones(len(sizes)), sizes], times, rcond=None)
+        if file_s < 0 or byte_s <= 0:
+            # noisy timings: charge everything to the bytes read
+            file_s, byte_s = 0.0, times.sum() / sizes.sum()
+        logger.info("Cost model from %s: %.1f ms per file + %.1f ms per MB", path, file_s * 1e3, byte_s * 2**20 * 1e3)
+        return cls(float(file_s), float(byte_s), float(byte_s) * CACHED_BYTE_S / BYTE_S)
+
+
+class Batch:
+    """
+    Files of one subject (positions into the planned task list, in task
+    order) that one worker processes together, with their total size and
+    estimated cost in seconds.
+    """
+
+    __slots__ = ("subject", "positions", "size", "cost")
+
+    def __init__(self, subject: str, positions: list, size: int = 0, cost: float = 0.0):
+        self.subject = subject
+        self.positions = positions
+        self.size = size
+        self.cost = cost
+
+
+def _screened_out(record, screen: bool) -> bool:
+    """True when the run drops `record` before parsing it: no week token or, with `screen`, a header window over MAX_RECORDING."""
+    if _get_week_from_path(record.path, warn=False) is None:
+        return True
+    if not screen:
+        return False
+    window = screen_recording(record.path)
+    return window is not None and window[2] > MAX_RECORDING
+
+
+def plan(
+    tasks: list,
+    workers: int = 1,
+    cost_model: Cost_Model | None = None,
+    hr_cache=None,
+    split: int = 4,
+    screen: bool = True,
+) -> list[Batch]:
+    """
+    Batches for `tasks` (File_Records) in the order they should be started.
+
+    Files the run skips without parsing cost only file_s. With `screen` (the
+    default, used by both --plan and the run), the first and last lines of
+    every file are read to find the recordings the duration screen rejects
+    (e.g. 24-hour files); without it they are costed by size.
+
+    Each subject's files form one batch, cut into consecutive pieces when the
+    subject alone would cost more than 1/(`split` * `workers`) of the total,
+    so the batches stay small enough to balance. Batches are sorted by
+    estimated cost, largest first, with ties in task order.
+    """
+    cost_model = cost_model or Cost_Model()
+    costs = []
+    for record in tasks:
+        if _screened_out(record, screen):
+            costs.append(cost_model.file_s)
+            continue
+        # the catalog's stat, so no NFS round trip per file
+        cached = hr_cache is not None and hr_cache.has(record.path, (record.size, record.mtime_ns))
+        costs.append(cost_model.cost(record.size, cached))
+    cap = sum(costs) / (split * max(workers, 1))
+    by_subject = {}
+    for pos, record in enumerate(tasks):
+        by_subject.setdefault(record.subject, []).append(pos)
+
+    batches = []
+    for subject, positions in by_subject.items():
+        total = sum(costs[pos] for pos in positions)
+        pieces = max(1, min(len(positions), int(np.ceil(total / cap)) if cap > 0 else 1))
+        for chunk in np.array_split(np.asarray(positions), pieces):
+            chunk = chunk.tolist()
+            batches.append(Batch(
+                subject,
+                chunk,
+                sum(tasks[pos].size for pos in chunk),
+                sum(costs[pos] for pos in chunk),
+            ))
+    batches.sort(key=lambda batch: -batch.cost)
+    return batches
+
+
+def assign(batches: list[Batch], workers: int = 1) -> list[tuple[int, float, float]]:
+    """
+    (worker, start_s, end_s) of each batch when `workers` processes take the
+    next batch as soon as they are free, as a process pool does; workers are
+    numbered from 1.
+    """
+    free = [(0.0, k) for k in range(1, max(workers, 1) + 1)]
+    slots = []
+    for batch in batches:
+        start, k = heapq.heappop(free)
+        slots.append((k, start, start + batch.cost))
+        heapq.heappush(free, (start + batch.cost, k))
+    return slots
+
+
+def write_plan(path: str, batches: list[Batch], workers: int = 1) -> dict:
+    """
+    Write one row per batch (PLAN_COLUMNS) in start order and return the
+    totals: files, batches, estimated serial seconds and wall seconds on
+    `workers` processes.
+    """
+    slots = assign(batches, workers)
+    with open(path, "w", newline="") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(PLAN_COLUMNS)
+        for i, (batch, (k, start, end)) in enumerate(zip(batches, slots), start=1):
+            writer.writerow([
+                i, batch.subject, len(batch.positions), f"{batch.size / 2**20:.2f}",
+                f"{batch.cost:.2f}", k, f"{start:.2f}", f"{end:.2f}",
+            ])
+    return {
+        "files": sum(len(batch.positions) for batch in batches),
+        "batches": len(batches),
+        "cost_s": sum(batch.cost for batch in batches),
+        "wall_s": max((end for _, _, end in slots), default=0.0),
+    }
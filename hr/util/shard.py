@@ -0,0 +1,105 @@
+import os
+import glob
+import pickle
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+SHARD_VERSION = 5
+
+
+def parse_shard(spec: str) -> tuple[int, int]:
+    """'i/N' -> (i, N), with shards numbered 1..N like SGE_TASK_ID."""
+    try:
+        i, n = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"shard must look like i/N, got {spec!r}") from None
+    if n < 1 or not 1 <= i <= n:
+        raise ValueError(f"shard index must be between 1 and N, got {spec!r}")
+    return i, n
+
+
+def shard_indices(tasks: list, i: int, n: int) -> list[int]:
+    """
+    Positions in `tasks` (File_Records) that belong to shard i of n.
+
+    Whole subjects are assigned, largest total file size first, each to the
+    shard with the fewest bytes so far (ties to the lower shard), so every
+    shard reads about the same amount and the split depends only on the
+    catalog.
+    """
+    sizes = {}
+    for record in tasks:
+        sizes[record.subject] = sizes.get(record.subject, 0) + record.size
+    loads = [0] * n
+    owner = {}
+    for subject, size in sorted(sizes.items(), key=lambda item: (-item[1], item[0])):
+        k = min(range(n), key=lambda s: loads[s])
+        owner[subject] = k + 1
+        loads[k] += size
+    return [pos for pos, record in enumerate(tasks) if owner[record.subject] == i]
+
+
+def tasks_digest(tasks: list) -> str:
+    """Fingerprint of the task list, so shards cut from different catalogs are not merged."""
+    h = hashlib.sha1()
+    for record in tasks:
+        h.update(f"{record.path}\0{record.size}\0{record.mtime_ns}\n".encode())
+    return h.hexdigest()
+
+
+def shard_path(shard_dir: str, i: int, n: int) -> str:
+    return os.path.join(shard_dir, f"shard_{i:03d}_of_{n:03d}.pkl")
+
+
+def save_shard(shard_dir: str, i: int, n: int, n_tasks: int, digest: str, entries: list) -> str:
+    """
+    Write one shard's results. `entries` are (task position, File_Record,
+    File_Result, manifest key or None) in task order.
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+    path = shard_path(shard_dir, i, n)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as fh:
+        pickle.dump(
+            {"version": SHARD_VERSION, "shard": (i, n), "n_tasks": n_tasks, "digest": digest, "entries": entries},
+            fh,
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+    os.replace(tmp, path)
+    logger.info("Shard %d/%d written: %s (%d files)", i, n, path, len(entries))
+    return path
+
+
+def load_shards(shard_dir: str) -> list:
+    """
+    All entries from a complete set of shard files in `shard_dir`, in task
+    order. Raises ValueError when shards are missing, come from different
+    runs or do not cover every task exactly once.
+    """
+    shards = {}
+    for path in sorted(glob.glob(os.path.join(shard_dir, "shard_*_of_*.pkl"))):
+        with open(path, "rb") as fh:
+            shard = pickle.load(fh)
+        if shard.get("version") != SHARD_VERSION:
+            raise ValueError(f"{path} was written by a different shard format")
+        shards[shard["shard"]] = shard
+    if not shards:
+        raise ValueError(f"No shard files in {shard_dir}")
+
+    counts = {n for _, n in shards}
+    if len(counts) > 1:
+        raise ValueError(f"Shard files from runs with different shard counts in {shard_dir}: {sorted(counts)}")
+    n = counts.pop()
+    missing = [i for i in range(1, n + 1) if (i, n) not in shards]
+    if missing:
+        raise ValueError(f"Missing shards {missing} of {n} in {shard_dir}")
+    if len({(s["digest"], s["n_tasks"]) for s in shards.values()}) > 1:
+        raise ValueError("Shards were run against different file catalogs; rerun them")
+
+    entries = sorted((e for s in shards.values() for e in s["entries"]), key=lambda e: e[0])
+    n_tasks = next(iter(shards.values()))["n_tasks"]
+    if [e[0] for e in entries] != list(range(n_tasks)):
+        raise ValueError(f"Shards do not cover all {n_tasks} files exactly once")
+    return entries
@@ -0,0 +1,117 @@
+import os
+import time
+import logging
+
+from util.catalog import GROUPS
+
+logger = logging.getLogger(__name__)
+
+
+def _stat_key(path: str) -> tuple[int, int] | None:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+class Dir_Watcher:
+    """
+    Polls polarhrcsv/{Supervised,Unsupervised}/<subject>/ for new CSVs.
+
+    An idle poll is one stat per group and subject directory: a directory is
+    only listed again when its mtime changes, which is what adding, renaming
+    or removing a file does. New files are then stat'ed on every poll until
+    their size and mtime are the same on two polls in a row (and the file is
+    not empty), i.e. the upload has finished; until then they are `unsettled`.
+
+    Edits to files that already existed do not touch the directory and are
+    left to the next full (--incremental) run.
+    """
+
+    def __init__(self, project_path: str, groups=GROUPS, settle_s: float = 0):
+        self.project_path = project_path
+        self.groups = groups
+        self._dir_mtime: dict[str, int] = {}  # group and subject dirs
+        self._files: dict[str, tuple[int, int]] = {}  # csv path -> (size, mtime_ns) last seen
+        self.unsettled: set[str] = set()
+        # the first listing counts as settled, except files modified in the
+        # last `settle_s` seconds, which may still be being written
+        cutoff = time.time_ns() - int(settle_s * 1e9)
+        self._refresh()
+        self.unsettled = {p for p, (size, mtime_ns) in self._files.items() if mtime_ns > cutoff or size == 0}
+
+    def _list_csvs(self, subject_path: str) -> dict[str, tuple[int, int]]:
+        found = {}
+        try:
+            with os.scandir(subject_path) as it:
+                for entry in it:
+                    if entry.name.startswith(".") or not entry.name.lower().endswith(".csv") or not entry.is_file():
+                        continue
+                    st = entry.stat()
+                    found[entry.path] = (st.st_size, st.st_mtime_ns)
+        except FileNotFoundError:
+            pass
+        return found
+
+    def _refresh(self) -> tuple[set[str], bool]:
+        """Re-list directories whose mtime changed; returns (new or replaced csvs, any removed)."""
+        subject_dirs = [path for path in self._dir_mtime if os.path.dirname(path) != self.project_path]
+        for group in self.groups:
+            group_path = os.path.join(self.project_path, group)
+            key = _stat_key(group_path)
+            if key is None or self._dir_mtime.get(group_path) == key[1]:
+                continue
+            self._dir_mtime[group_path] = key[1]
+            with os.scandir(group_path) as it:
+                for entry in it:
+                    if not entry.name.startswith(".") and entry.is_dir() and entry.path not in self._dir_mtime:
+                        subject_dirs.append(entry.path)
+
+        added, removed = set(), False
+        for subject_path in subject_dirs:
+            key = _stat_key(subject_path)
+            if key is None:
+                # subject directory gone with its files
+                self._dir_mtime.pop(subject_path, None)
+                key_prefix = subject_path + os.sep
+                gone = [p for p in self._files if p.startswith(key_prefix)]
+                for path in gone:
+                    del self._files[path]
+                removed = removed or bool(gone)
+                continue
+            if self._dir_mtime.get(subject_path) == key[1]:
+                continue
+            self._dir_mtime[subject_path] = key[1]
+            listed = self._list_csvs(subject_path)
+            key_prefix = subject_path + os.sep
+            for path in [p for p in self._files if p.startswith(key_prefix) and p not in listed]:
+                del self._files[path]
+                self.unsettled.discard(path)
+                removed = True
+            for path, stat in listed.items():
+                if self._files.get(path) != stat:
+                    self._files[path] = stat
+                    added.add(path)
+        return added, removed
+
+    def poll(self) -> tuple[list[str], bool]:
+        """
+        One poll. Returns (files that settled since the last poll, whether any
+        csv was removed); either means the outputs are out of date.
+        """
+        ready = []
+        for path in sorted(self.unsettled):
+            stat = _stat_key(path)
+            if stat is None:
+                self.unsettled.discard(path)
+                self._files.pop(path, None)
+            elif stat == self._files.get(path) and stat[0] > 0:
+                self.unsettled.discard(path)
+                ready.append(path)
+            else:
+                self._files[path] = stat
+
+        added, removed = self._refresh()
+        self.unsettled |= added
+        return ready, removed
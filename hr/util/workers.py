@@ -0,0 +1,108 @@
+import logging
+import logging.handlers
+import multiprocessing
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+from util import pipeline, schedule
+from util.metrics import File_Timer
+
+# set in each pool worker by _init_worker so these are pickled once per process
+_zone_table = None
+_hr_cache = None
+_timed = False
+_trace_memory = False
+
+
+def _init_worker(zone_table, hr_cache, log_queue, level, timed=False, trace_memory=False):
+    """
+    Pool initializer: keep the zone table and HR cache, and route every log
+    record through the parent's queue, so only the parent process writes to
+    main.log.
+    """
+    global _zone_table, _hr_cache, _timed, _trace_memory
+    _zone_table = zone_table
+    _hr_cache = hr_cache
+    _timed = timed
+    _trace_memory = trace_memory
+    if trace_memory:
+        tracemalloc.start()
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+
+
+def _run_batch(records):
+    """QC one util.schedule.Batch's File_Records; the subject's zones are looked up once."""
+    stream = (pipeline.File_Job.from_record(record, File_Timer(_trace_memory) if _timed else None) for record in records)
+    # converted here so only the compact records cross the process boundary
+    return [(job.result(), job.timer if _timed else None) for job in pipeline.file_stages(stream, _zone_table, _hr_cache)]
+
+
+def run_files(
+    records,
+    zone_table,
+    workers: int = 1,
+    hr_cache=None,
+    metrics=None,
+    prefetch: int = 0,
+    prefetch_bytes: int = 256 << 20,
+    cost_model=None,
+):
+    """
+    Yield a qc.records.File_Result for each catalog File_Record, always in
+    input order so the merged output does not depend on `workers`. Each
+    result is reduced to its output rows as soon as it is computed, so the
+    err dicts and their detail tables are never held for more than one file.
+
+    With a util.metrics.Run_Metrics, each file's stage timings are added to it.
+    In-process runs are the util.pipeline stages chained lazily, reading up
+    to `prefetch` upcoming files (at most `prefetch_bytes` in flight) on
+    background threads while the current one is processed; pool workers
+    already overlap I/O with each other. Pools are fed the util.schedule
+    plan, the same one --plan writes: per-subject batches, longest estimated
+    cost (`cost_model`) first, with results held until every earlier file's
+    has been yielded.
+    """
+    records = list(records)
+    if workers <= 1 or len(records) <= 1:
+        stream = pipeline.jobs(records, metrics)
+        stream = pipeline.prefetch(stream, hr_cache, depth=prefetch, max_bytes=prefetch_bytes)
+        yield from pipeline.results(pipeline.file_stages(stream, zone_table, hr_cache), metrics)
+        return
+
+    root = logging.getLogger()
+    ctx = multiprocessing.get_context()
+    log_queue = ctx.Queue()
+    listener = logging.handlers.QueueListener(
+        log_queue, *root.handlers, respect_handler_level=True
+    )
+    listener.start()
+    try:
+        batches = schedule.plan(records, workers, cost_model, hr_cache)
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=ctx,
+            initializer=_init_worker,
+            initargs=(
+                zone_table, hr_cache, log_queue, root.level,
+                metrics is not None, metrics is not None and metrics.trace_memory,
+            ),
+        ) as pool:
+            # position -> (batch future, index in batch), submitted in plan order
+            owner = {}
+            for batch in batches:
+                future = pool.submit(_run_batch, [records[pos] for pos in batch.positions])
+                for j, pos in enumerate(batch.positions):
+                    owner[pos] = (future, j)
+            for pos in range(len(records)):
+                future, j = owner.pop(pos)
+                result, timer = future.result()[j]
+                if metrics is not None:
+                    metrics.add(result.file, timer)
+                yield result
+    finally:
+        listener.stop()
@@ -0,0 +1,156 @@
+import hashlib
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from util.zone.midpoint import midpoint_snap_array
+
+logger = logging.getLogger(__name__)
+
+N_ZONES = 5
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _read_workbook(path: str) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Parse `BOOST HR ranges.xlsx` into (ids, raw_bounds).
+
+    raw_bounds has shape (n_rows, 5, 2) and keeps NaN where the sheet is blank,
+    so rows with incomplete zones can still be reported on lookup.
+    """
+    df = pd.read_excel(path, sheet_name='Sheet1')
+    zone_cols = df.columns[5:15].tolist()   # ['Zone 1…', 'Unnamed: 6', … 'Unnamed: 14']
+
+    ids = pd.to_numeric(df['BOOST ID'], errors='coerce')
+    keep = ids.notna().to_numpy()
+    raw = df.loc[keep, zone_cols].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+    return ids[keep].to_numpy(dtype=np.int64), raw.reshape(-1, N_ZONES, 2)
+
+
+class ZoneTable:
+    """
+    All subjects' zone bounds from the HR ranges workbook, parsed once per run.
+
+    Midpoints are snapped for every subject in one vectorized pass and bounds
+    are looked up by BOOST ID through a dict index. The parsed sheet is kept in
+    a sidecar .npz under `cache_dir`, which is reused until the workbook's
+    mtime/size change and its sha256 no longer matches.
+    """
+
+    SIDECAR = "zone_table.npz"
+
+    def __init__(self, ids: np.ndarray, raw_bounds: np.ndarray, snap_to: int = 5):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.raw_bounds = np.asarray(raw_bounds, dtype=float)
+        self.snap_to = snap_to
+
+        # int() truncation as in midpoint_snap; rows with blanks stay invalid
+        self.valid = ~np.isnan(self.raw_bounds).any(axis=(1, 2))
+        truncated = np.trunc(np.nan_to_num(self.raw_bounds))
+        self.bounds = midpoint_snap_array(truncated, snap_to=snap_to).astype(np.int64)
+
+        # first row wins when an ID is duplicated, like iloc[0] on the filter
+        self._index = {}
+        for i, boost_id in enumerate(self.ids.tolist()):
+            self._index.setdefault(boost_id, i)
+
+    @classmethod
+    def load(cls, path: str, snap_to: int = 5, cache_dir: str | None = None) -> "ZoneTable":
+        """
+        Build the table from the workbook at `path`, going through the sidecar
+        in `cache_dir` when one is given.
+        """
+        if cache_dir is None:
+            ids, raw = _read_workbook(path)
+            return cls(ids, raw, snap_to=snap_to)
+
+        st = os.stat(path)
+        sidecar = os.path.join(cache_dir, cls.SIDECAR)
+        digest = None
+        if os.path.isfile(sidecar):
+            try:
+                with np.load(sidecar, allow_pickle=False) as cached:
+                    meta = {k: cached[k].item() for k in ("path", "mtime_ns", "size", "sha256")}
+                    ids, raw = cached["ids"], cached["raw_bounds"]
+            except (OSError, KeyError, ValueError) as exc:
+                logger.warning("Ignoring unreadable zone sidecar %s: %s", sidecar, exc)
+            else:
+                if meta["path"] == os.path.abspath(path):
+                    if meta["mtime_ns"] == st.st_mtime_ns and meta["size"] == st.st_size:
+                        return cls(ids, raw, snap_to=snap_to)
+                    # touched but maybe not edited: fall back to the content hash
+                    digest = _sha256(path)
+                    if digest == meta["sha256"]:
+                        cls._write_sidecar(sidecar, path, st, digest, ids, raw)
+                        return cls(ids, raw, snap_to=snap_to)
+
+        logger.info("Parsing zone workbook: %s", path)
+        ids, raw = _read_workbook(path)
+        cls._write_sidecar(sidecar, path, st, digest or _sha256(path), ids, raw)
+        return cls(ids, raw, snap_to=snap_to)
+
+    @staticmethod
+    def _write_sidecar(sidecar, path, st, digest, ids, raw):
+        os.makedirs(os.path.dirname(sidecar) or ".", exist_ok=True)
+        tmp = sidecar + ".tmp.npz"
+        np.savez(
+            tmp,
+            path=os.path.abspath(path),
+            mtime_ns=st.st_mtime_ns,
+            size=st.st_size,
+            sha256=digest,
+            ids=ids,
+            raw_bounds=raw,
+        )
+        os.replace(tmp, sidecar)
+
+    def __len__(self):
+        return len(self._index)
+
+    def _row(self, subject) -> int:
+        subject = str(subject)
+        if subject.startswith('sub'):
+            subject = subject.removeprefix('sub')
+        i = self._index.get(int(subject))
+        if i is None:
+            raise ValueError(f"No rows matching ID {subject}")
+        if not self.valid[i]:
+            raise ValueError(f"Incomplete zone bounds for ID {subject}")
+        return i
+
+    def lookup(self, subject) -> np.ndarray:
+        """
+        Snapped bounds for `subject` ('sub8000' or '8000') as a read-only
+        (5, 2) int array of [start, end] per zone.
+        """
+        out = self.bounds[self._row(subject)]
+        out.flags.writeable = False
+        return out
+
+    def row_key(self, subject) -> tuple | None:
+        """
+        Hashable snapshot of `subject`'s snapped bounds, or None when the
+        subject has no usable row; used to notice edits to the workbook.
+        """
+        try:
+            return tuple(self.lookup(subject).ravel().tolist())
+        except ValueError:
+            return None
+
+    def zones(self, subject) -> pd.DataFrame:
+        """Same 1-row DataFrame that extract_zones returns."""
+        bounds = self.lookup(subject)
+        out = {}
+        for i in range(N_ZONES):
+            out[f"z{i+1}_start"] = int(bounds[i, 0])
+            out[f"z{i+1}_end"] = int(bounds[i, 1])
+        return pd.DataFrame([out])